@@ -1,14 +1,54 @@
 import os
-from flask import Flask, request, jsonify
-from query_engine import search, _ensure_loaded, _index_cache
+import hmac
+import json
+from functools import partial, wraps
+from flask import Flask, Response, request, jsonify
+import metrics
+import query_engine
+from query_engine import search, search_many, plan_cache_info, result_cache_info, Query
+from query_engine import CursorError
+from query_engine import start_background_load, is_ready, load_status
+from shards import ShardedSearcher, HttpShard, shard_search, shard_wildcard_df
+from profiling import profile_call, sample_call, start_process_sampling
+from inspect_index import inspect_index, INSPECT_TOP
+from querylog import record_query, start_query_log
 from dotenv import load_dotenv
 
 load_dotenv()
 
 app = Flask(__name__, static_folder="static", static_url_path="/static")
 
-# Pre-warm the index on startup so the first query isn't slow
-_ensure_loaded()
+# Coordinator mode: SHARD_NODES=http://host1:5001,http://host2:5002 scatters
+# every query to those nodes (each an app.py serving one shard file) instead
+# of loading an index here.
+SHARD_NODES = [url for url in os.environ.get("SHARD_NODES", "").split(",") if url]
+_coordinator = ShardedSearcher([HttpShard(url) for url in SHARD_NODES]) if SHARD_NODES else None
+
+# Per-request profiling (/search?profile=1) is only enabled with an admin token
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+if os.environ.get("PROFILE_SAMPLING") == "1":
+    start_process_sampling()
+
+# Anonymized counts of user queries, replayed to warm up fresh workers
+# (QUERY_LOG=0 turns it off, see querylog.py)
+start_query_log()
+
+# Load the index on a background thread: the app answers /health right away
+# and /ready (plus every index-backed endpoint) returns 503 until it is loaded
+if _coordinator is None:
+    start_background_load()
+
+
+def requires_index(view):
+    """503 with the load progress while the index is still loading."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if _coordinator is None and not is_ready():
+            return jsonify({"error": "index is still loading", **load_status()}), 503
+        return view(*args, **kwargs)
+
+    return wrapper
 
 
 @app.route("/")
@@ -17,32 +57,174 @@ def index():
 
 
 @app.route("/search")
+@requires_index
 def search_endpoint():
     query = request.args.get("q", "").strip()
     top_k = request.args.get("top_k", 5, type=int)
     include_summary = request.args.get("summary", "true").lower() == "true"
+    match = request.args.get("match", "all").lower()  # "all" (AND) | "any" (OR)
+    explain = request.args.get("explain", "false").lower() == "true"
+    profile = request.args.get("profile", "")  # "1" (cProfile) | "sample"
+    cursor = request.args.get("cursor") or None  # "next_cursor" of the previous page
+    offset = request.args.get("offset", 0, type=int)
 
     if not query:
         return jsonify({"query": "", "count": 0, "results": []})
+    if top_k < 1:
+        return jsonify({"error": "top_k must be at least 1"}), 400
+    if match not in ("all", "any"):
+        return jsonify({"error": 'match must be "all" or "any"'}), 400
+    if offset < 0:
+        return jsonify({"error": "offset must be >= 0"}), 400
+    if cursor is not None:
+        try:
+            query_engine.decode_cursor(cursor, query, match)
+        except CursorError as e:  # malformed, or another query's
+            return jsonify({"error": str(e)}), 400
+    if cursor is None and not offset:
+        record_query(query)  # later pages aren't new searches
 
-    response = search(query, top_k=top_k, include_summary=include_summary)
+    if _coordinator:
+        # Plans are per shard, so explain is only available on a single index
+        run = partial(
+            _coordinator.search, query, top_k=top_k, include_summary=include_summary, match=match,
+            cursor=cursor, offset=offset,
+        )
+    else:
+        run = partial(
+            search, query, top_k=top_k, include_summary=include_summary, match=match,
+            explain=explain, cursor=cursor, offset=offset,
+        )
+
+    if not profile:
+        return jsonify(run())
+
+    token = request.headers.get("X-Admin-Token", "")
+    if not ADMIN_TOKEN or not hmac.compare_digest(token, ADMIN_TOKEN):
+        return jsonify({"error": "profiling needs a valid X-Admin-Token"}), 403
+    profiler = sample_call if profile == "sample" else profile_call
+    response, report = profiler(run, dump=request.args.get("dump") == "1")
+    response["profile"] = report
     return jsonify(response)
 
 
+@app.route("/search/batch", methods=["POST"])
+@requires_index
+def search_batch_endpoint():
+    """
+    Body: {"queries": ["...", ...], "top_k": 5, "match": "all"}
+    Streams one JSON response per line (NDJSON), in the order of "queries".
+    """
+    body = request.get_json(silent=True) or {}
+    queries = body.get("queries")
+    if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+        return jsonify({"error": "'queries' must be a list of strings"}), 400
+    try:
+        top_k = int(body.get("top_k", 5))
+    except (TypeError, ValueError):
+        top_k = 0
+    if top_k < 1:
+        return jsonify({"error": "'top_k' must be an integer of at least 1"}), 400
+    match = str(body.get("match", "all")).lower()
+    if match not in ("all", "any"):
+        return jsonify({"error": "'match' must be \"all\" or \"any\""}), 400
+
+    def generate():
+        if _coordinator:
+            responses = (
+                _coordinator.search(q, top_k=top_k, include_summary=False, match=match)
+                for q in queries
+            )
+        else:
+            responses = search_many(queries, top_k=top_k, match=match)
+        for response in responses:
+            yield json.dumps(response, ensure_ascii=False) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+# Shard node endpoints, called by a coordinator's HttpShard
+@app.route("/shard/search", methods=["POST"])
+@requires_index
+def shard_search_endpoint():
+    body = request.get_json()
+    query = Query.from_dict(body["query"])
+    return jsonify(shard_search(query, body["top_k"], body["match"], body["global_df"]))
+
+
+@app.route("/shard/wildcard_df", methods=["POST"])
+@requires_index
+def shard_wildcard_df_endpoint():
+    return jsonify(shard_wildcard_df(request.get_json()["patterns"]))
+
+
 @app.route("/stats")
+@requires_index
 def stats():
-    _ensure_loaded()
+    if _coordinator:
+        # Every shard holds the global metadata and the full dictionary
+        nodes = {shard.name: shard.get("/stats") for shard in _coordinator.shards}
+        first = next(iter(nodes.values()), {})
+        return jsonify(
+            {
+                "num_docs": first.get("num_docs", 0),
+                "num_terms": first.get("num_terms", 0),
+                "shards": nodes,
+            }
+        )
+    # Read at call time: these are set by _ensure_loaded()
     return jsonify(
         {
-            "num_docs": _index_cache["metadata"]["num_docs"],
-            "num_terms": len(_index_cache["index"]),
+            "num_docs": query_engine._index_cache["metadata"]["num_docs"],
+            "num_terms": len(query_engine._sorted_terms),
+            "plan_cache": plan_cache_info(),
+            "result_cache": result_cache_info(),
         }
     )
 
+
+# (index file, mtime, size, top) → inspect_index() report; the inspector
+# streams the files on disk, which takes a while on a large index
+_detail_cache = {}
+
+
+@app.route("/stats/detail")
+@requires_index
+def stats_detail():
+    """Size and shape of the index files on disk (see inspect_index.py)."""
+    top = request.args.get("top", INSPECT_TOP, type=int)
+    if _coordinator:
+        return jsonify(
+            {"shards": {s.name: s.get(f"/stats/detail?top={top}") for s in _coordinator.shards}}
+        )
+    index_file = query_engine.INDEX_FILE
+    stat = os.stat(index_file)
+    key = (index_file, stat.st_mtime_ns, stat.st_size, top)
+    if key not in _detail_cache:
+        _detail_cache.clear()
+        _detail_cache[key] = inspect_index(index_file, query_engine.CRAWLED_DATA_FILE, top)
+    return jsonify(_detail_cache[key])
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Latency histograms and counters in the Prometheus text format."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/health")
 def health():
     return jsonify({"status": "ok"}), 200
 
+
+@app.route("/ready")
+def ready():
+    """200 once the index is loaded, 503 with the load progress before that."""
+    if _coordinator is not None:
+        return jsonify({"state": "ready", "role": "coordinator"}), 200
+    status = load_status()
+    return jsonify(status), 200 if status["state"] == "ready" else 503
+
 print("✅ Flask app initialized and routes registered")
 
 if __name__ == "__main__":
@@ -0,0 +1,426 @@
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import resource
+import subprocess
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+# BENCHMARK
+#
+# Reproducible indexing + query latency numbers:
+#
+#   python benchmark.py                          # 10k, 100k, 1M docs → JSON on stdout
+#   python benchmark.py --sizes 10000 -o bench.json
+#   python benchmark.py --sizes 10000 --compare bench.json   # diff against an older run
+#
+# Every corpus size runs in its own child process, so its peak RSS is its own.
+# A run:
+#   1. generates (or reuses) a seeded synthetic Wikipedia-like corpus
+#   2. times build_index, save_index and load_index
+#   3. times a cold start in a fresh interpreter (import + load + first query)
+#      and how long importing app.py takes (the time before /health answers)
+#   4. runs a fixed query mix through search() with summaries off (and the
+#      result cache off: the mix times the scorers, not cache hits)
+#   5. reruns its simple queries in every tiered-search mode (TIER_MODE):
+#      latency, share answered from tier 1 and recall@k against the full index
+# Corpora and indexes are cached in --workdir, keyed by size and seed.
+
+SIZES = [10_000, 100_000, 1_000_000]
+SEED = 42
+WORKDIR = "bench_data"
+QUERIES_PER_KIND = 50
+
+# Regression budgets: dotted path into a run's report → maximum allowed value.
+# Exceeded budgets are listed under "budget_violations" and logged, and the
+# benchmark exits with status 1.
+BUDGETS = {
+    "cold_start.app_import_s": 1.0,  # app.py must be importable (and bind) fast
+    "queries.fuzzy.p95_ms": 50.0,  # typo expansion runs on every unknown term
+}
+
+# Corpus shape: Zipf-distributed vocabulary, page lengths like the crawler's
+# (which truncates extracts to MAX_CHARS_PER_PAGE = 5000 characters)
+VOCAB_SIZE = 50_000
+MIN_WORDS, MAX_WORDS = 60, 700
+MAX_CHARS = 5000
+TOPIC_WORDS = (
+    "history science world war empire river mountain city music art philosophy "
+    "theory physics chemistry biology language programming python computer "
+    "algorithm data model network neural learning machine intelligence robot "
+    "government economy population university century king church island"
+).split()
+SYLLABLES = "ka lo mi ne ra to su vi pe qu ze xo an el or bi du fa go hu ji".split()
+
+
+# ─────────────────────────────────────────────
+# SYNTHETIC CORPUS
+# ─────────────────────────────────────────────
+
+
+def _vocabulary(rng: random.Random) -> list[str]:
+    """Topic words first (the most frequent), then made-up words."""
+    words = list(TOPIC_WORDS)
+    seen = set(words)
+    while len(words) < VOCAB_SIZE:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 5)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def generate_corpus(num_docs: int, seed: int = SEED) -> list[dict]:
+    """Pages shaped like crawled_data.json: {title, url, text, links, id}."""
+    rng = random.Random(seed)
+    vocab = _vocabulary(rng)
+    cum_weights = []
+    total = 0.0
+    for rank in range(len(vocab)):
+        total += 1.0 / (rank + 1)
+        cum_weights.append(total)
+
+    pages = []
+    for doc_id in range(num_docs):
+        words = rng.choices(vocab, cum_weights=cum_weights, k=rng.randint(MIN_WORDS, MAX_WORDS))
+        sentences = (" ".join(words[i : i + 14]) for i in range(0, len(words), 14))
+        text = ". ".join(s.capitalize() for s in sentences)[:MAX_CHARS] + "."
+        title = " ".join(rng.choices(vocab[:2000], k=rng.randint(1, 3))).title()
+        pages.append(
+            {
+                "title": f"{title} {doc_id}",
+                "url": "https://en.wikipedia.org/wiki/" + title.replace(" ", "_"),
+                "text": text,
+                "links": [],
+                "id": doc_id,
+            }
+        )
+    for page in pages:
+        page["links"] = [pages[rng.randrange(num_docs)]["title"] for _ in range(5)]
+    return pages
+
+
+def query_mix(pages: list[dict], seed: int = SEED) -> dict[str, list[str]]:
+    """A fixed set of queries per kind, drawn from the corpus itself."""
+    rng = random.Random(seed + 1)
+    vocab = _vocabulary(random.Random(seed))
+    frequent, rare = vocab[:40], vocab[5000:20000]
+
+    def sample_text():
+        return pages[rng.randrange(len(pages))]["text"].rstrip(".").lower().split()
+
+    def phrase():
+        words = [w.strip(".") for w in sample_text()]
+        start = rng.randrange(max(1, len(words) - 3))
+        return '"' + " ".join(words[start : start + rng.randint(2, 3)]) + '"'
+
+    def typo(word):
+        i = rng.randrange(1, len(word))
+        return word[:i] + word[i + 1 :]
+
+    n = QUERIES_PER_KIND
+    return {
+        "frequent": [" ".join(rng.sample(frequent, rng.randint(1, 3))) for _ in range(n)],
+        "rare": [" ".join(rng.sample(rare, rng.randint(1, 2))) for _ in range(n)],
+        "mixed": [f"{rng.choice(frequent)} {rng.choice(rare)}" for _ in range(n)],
+        "phrase": [phrase() for _ in range(n)],
+        "boolean": [
+            f"{rng.choice(frequent)} AND ({rng.choice(frequent)} OR {rng.choice(rare)}) "
+            f"AND NOT {rng.choice(frequent)}"
+            for _ in range(n)
+        ],
+        "wildcard": [rng.choice(frequent)[:4] + "*" for _ in range(n)],
+        "fuzzy": [typo(rng.choice([w for w in frequent if len(w) > 5])) for _ in range(n)],
+    }
+
+
+# ─────────────────────────────────────────────
+# MEASUREMENT
+# ─────────────────────────────────────────────
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, round(time.perf_counter() - start, 4)
+
+
+def percentiles(samples: list[float]) -> dict:
+    """Latency summary in milliseconds (nearest-rank percentiles)."""
+    ordered = sorted(samples)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+    return {
+        "n": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": round(rank(50) * 1000, 3),
+        "p95_ms": round(rank(95) * 1000, 3),
+        "p99_ms": round(rank(99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def cold_start(index_file: str, pages_file: str) -> dict:
+    """Fresh interpreter: import query_engine, load the index, run one query."""
+    script = (
+        "import time; t0 = time.perf_counter()\n"
+        "import query_engine; t1 = time.perf_counter()\n"
+        "query_engine._ensure_loaded(); t2 = time.perf_counter()\n"
+        "query_engine.search('history science', include_summary=False)\n"
+        "t3 = time.perf_counter()\n"
+        "print(round(t1 - t0, 4), round(t2 - t1, 4), round(t3 - t0, 4))\n"
+    )
+    env = dict(os.environ, INDEX_FILE=index_file, CRAWLED_DATA_FILE=pages_file)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [_REPO, env.get("PYTHONPATH")]))
+
+    def run(code):
+        return subprocess.run(
+            [sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True
+        ).stdout.split()
+
+    start = time.perf_counter()
+    import_s, load_s, first_query_s = map(float, run(script)[-3:])
+    wall_s = round(time.perf_counter() - start, 4)
+    # The web app loads the index in the background, so importing it is all
+    # that stands between the process starting and /health answering
+    app_import_s = float(
+        run("import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)")[-1]
+    )
+    return {
+        "wall_s": wall_s,
+        "import_s": import_s,
+        "load_s": load_s,
+        "first_query_s": first_query_s,
+        "app_import_s": round(app_import_s, 4),
+        "peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+_REPO = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_size(num_docs: int, seed: int, workdir: str) -> dict:
+    """Everything for one corpus size (meant to run in its own process)."""
+    sys.path.insert(0, _REPO)
+    from indexer import build_index, save_index, load_index, positions_path
+
+    os.makedirs(workdir, exist_ok=True)
+    pages_file = os.path.join(workdir, f"crawled_data.{num_docs}.{seed}.json")
+    index_file = os.path.join(workdir, f"index.{num_docs}.{seed}.json")
+    report = {"num_docs": num_docs}
+
+    if os.path.exists(pages_file):
+        with open(pages_file, "r", encoding="utf-8") as f:
+            pages = json.load(f)
+    else:
+        pages, report["generate_s"] = _timed(generate_corpus, num_docs, seed)
+        with open(pages_file, "w", encoding="utf-8") as f:
+            json.dump(pages, f, ensure_ascii=False)
+
+    index, report["build_s"] = _timed(build_index, pages)
+    report["num_terms"] = len(index["index"])
+    report["num_postings"] = sum(entry["doc_freq"] for entry in index["index"].values())
+    _, report["save_s"] = _timed(save_index, index, index_file)
+    index_files = [p for p in (index_file, positions_path(index_file)) if os.path.exists(p)]
+    report["index_mb"] = round(sum(map(os.path.getsize, index_files)) / 2**20, 1)
+    del index
+    _, report["load_s"] = _timed(load_index, index_file)
+    report["cold_start"] = cold_start(index_file, pages_file)
+
+    # Query mix through the public API, one fresh pass over every query
+    import query_engine
+
+    query_engine.INDEX_FILE, query_engine.CRAWLED_DATA_FILE = index_file, pages_file
+    query_engine.RESULT_CACHE_SIZE = 0
+    query_engine._ensure_loaded()
+    logging.getLogger("query_engine").setLevel(logging.WARNING)  # no per-query INFO lines
+
+    queries = query_mix(pages, seed)
+    del pages
+    report["queries"] = {}
+    all_samples = []
+    mix_start = time.perf_counter()
+    for kind, kind_queries in queries.items():
+        samples = []
+        for query in kind_queries:
+            start = time.perf_counter()
+            query_engine.search(query, include_summary=False)
+            samples.append(time.perf_counter() - start)
+        report["queries"][kind] = percentiles(samples)
+        all_samples += samples
+    elapsed = time.perf_counter() - mix_start
+    report["queries"]["all"] = percentiles(all_samples)
+    report["throughput_qps"] = round(len(all_samples) / elapsed, 1)
+    report["tiers"] = tier_report(query_engine, queries)
+    report["peak_rss_mb"] = peak_rss_mb()
+    report["budget_violations"] = check_budgets(report)
+    return report
+
+
+TIER_KINDS = ("frequent", "rare", "mixed")  # the simple queries of the mix
+
+
+def tier_report(query_engine, queries: dict[str, list[str]]) -> dict:
+    """
+    Recall vs latency of the tiered index: the simple queries in every
+    TIER_MODE, recall@k measured against "off" (the full index only).
+    """
+    import metrics
+
+    simple = [query for kind in TIER_KINDS for query in queries[kind]]
+    configured = query_engine.TIER_MODE
+    report = {}
+    expected = None
+    try:
+        for mode in ("off", "exact", "approximate"):
+            query_engine.TIER_MODE = mode
+            before = metrics.snapshot()
+            samples, found = [], []
+            for query in simple:
+                start = time.perf_counter()
+                response = query_engine.search(query, include_summary=False)
+                samples.append(time.perf_counter() - start)
+                found.append({result["doc_id"] for result in response["results"]})
+            expected = expected or found
+            after = metrics.snapshot()
+            tier1, full = (
+                after.get(f"search_tier_total{{result={r}}}", 0)
+                - before.get(f"search_tier_total{{result={r}}}", 0)
+                for r in ("tier1", "full")
+            )
+            recalls = [len(f & e) / len(e) for f, e in zip(found, expected) if e]
+            report[mode] = dict(
+                percentiles(samples),
+                tier1_share=round(tier1 / (tier1 + full), 3) if tier1 + full else 0.0,
+                recall_at_k=round(sum(recalls) / len(recalls), 4) if recalls else 1.0,
+            )
+    finally:
+        query_engine.TIER_MODE = configured
+    return report
+
+
+def check_budgets(report: dict) -> dict:
+    """Every BUDGETS entry the report exceeds → {"actual": …, "budget": …}."""
+    violations = {}
+    for path, budget in BUDGETS.items():
+        value = report
+        for key in path.split("."):
+            value = value.get(key) if isinstance(value, dict) else None
+        if value is not None and value > budget:
+            violations[path] = {"actual": value, "budget": budget}
+            logger.warning("%d docs: %s = %s exceeds budget %s", report["num_docs"], path,
+                           value, budget)
+    return violations
+
+
+# ─────────────────────────────────────────────
+# REPORT
+# ─────────────────────────────────────────────
+
+
+def _environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=_REPO,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(old: dict, new: dict):
+    """Prints the relative change of every timing shared by two reports."""
+
+    def flatten(value, prefix=""):
+        if isinstance(value, dict):
+            for key, child in value.items():
+                yield from flatten(child, f"{prefix}.{key}" if prefix else key)
+        elif isinstance(value, (int, float)) and prefix.endswith(("_s", "_ms", "_mb", "qps")):
+            yield prefix, value
+
+    old_runs = {run["num_docs"]: dict(flatten(run)) for run in old["runs"]}
+    for run in new["runs"]:
+        before = old_runs.get(run["num_docs"])
+        if not before:
+            continue
+        print(f"\n  {run['num_docs']:,} docs  ({old['env']['commit']} → {new['env']['commit']})")
+        for key, value in flatten(run):
+            if key in before and before[key]:
+                change = (value - before[key]) / before[key] * 100
+                print(f"    {key:32} {before[key]:>12} → {value:<12} {change:+7.1f}%")
+
+
+# ─────────────────────────────────────────────
+# ENTRY POINT
+# ─────────────────────────────────────────────
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexing + query latency benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--workdir", default=WORKDIR)
+    parser.add_argument("-o", "--output", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", help="older JSON report to diff against")
+    parser.add_argument("--run-size", type=int, help=argparse.SUPPRESS)  # child process
+    args = parser.parse_args()
+
+    if args.run_size:
+        print(json.dumps(run_size(args.run_size, args.seed, args.workdir)))
+        sys.exit(0)
+
+    runs = []
+    for size in args.sizes:
+        logger.info("Benchmarking %d docs...", size)
+        child = subprocess.run(
+            [sys.executable, __file__, "--run-size", str(size), "--seed", str(args.seed),
+             "--workdir", args.workdir],
+            capture_output=True,
+            text=True,
+        )
+        if child.returncode:
+            logger.error("Run with %d docs failed:\n%s", size, child.stderr[-2000:])
+            continue
+        runs.append(json.loads(child.stdout.strip().splitlines()[-1]))
+
+    report = {"env": _environment(), "seed": args.seed, "runs": runs}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        logger.info("Report saved → %s", args.output)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+    if any(run["budget_violations"] for run in runs):
+        sys.exit(1)
@@ -73,6 +73,7 @@ def fetch_batch_data(titles, session):
 
 def crawl(seed_titles, max_pages):
     visited = set()
+    collected = set()  # resolved titles of the pages kept
     queue = deque(seed_titles)
     all_pages = []
     session = requests.Session()
@@ -105,6 +106,13 @@ def crawl(seed_titles, max_pages):
             if len(all_pages) >= max_pages:
                 break
 
+            # Redirects and alternate spellings are requested under another
+            # title but resolve to the article's own: keep it only once
+            if res["title"] in collected:
+                continue
+            collected.add(res["title"])
+            visited.add(res["title"])
+
             res["id"] = len(all_pages)
             all_pages.append(res)
 
@@ -1,12 +1,30 @@
+import os
 import json
 import math
 import re
+import sys
+import heapq
+import hashlib
 import logging
-from collections import defaultdict
+from array import array
+from itertools import repeat
+from operator import eq, rshift
+from collections import Counter, defaultdict
 
 # CONFIG
 CRAWLED_DATA_FILE = "crawled_data.json"
 INDEX_FILE = "index.json"
+# Token positions are only needed by phrase queries and offset snippets;
+# INDEX_POSITIONS=0 builds an index without them (and without token_offsets)
+# for a minimal-memory deployment.  Phrases then match their tokens anywhere.
+INDEX_POSITIONS = os.environ.get("INDEX_POSITIONS", "1") != "0"
+POSITIONS_SUFFIX = ".positions"  # index.json → index.positions
+VECTORS_SUFFIX = ".vectors"  # index.json → index.vectors (see DENSE VECTORS)
+HEAD_RESULTS_SUFFIX = ".head.json"  # index.json → index.head.json (querylog.py head)
+# Tier 1 keeps this many postings of every term found in more docs (0: no tiers)
+TIER1_POSTINGS = int(os.environ.get("TIER1_POSTINGS", "128"))
+# INDEX_DENSE=1 adds LSA document vectors for semantic / hybrid search
+INDEX_DENSE = os.environ.get("INDEX_DENSE", "0") == "1"
 
 logging.basicConfig(
     level=logging.INFO,
@@ -352,6 +370,80 @@ def tokenize(text: str) -> list[str]:
     return tokens
 
 
+def tokenize_with_offsets(text: str) -> tuple[list[str], list[int]]:
+    """
+    Same pipeline as tokenize(), but also returns the character offset of each
+    kept token in text, so snippets can be cut and highlighted without
+    re-scanning the text at query time.
+    """
+    tokens = []
+    offsets = []
+    for match in re.finditer(r"[a-z0-9]+", text.lower()):
+        t = match.group()
+        if t in STOPWORDS or len(t) <= 1:
+            continue
+        tokens.append(stem(t))
+        offsets.append(match.start())
+    return tokens, offsets
+
+
+# FUZZY TERM INDEX  (SymSpell-style deletion index)
+#
+# For every vocabulary term we pre-compute all strings reachable by deleting
+# up to FUZZY_MAX_DISTANCE characters from its first FUZZY_PREFIX_LENGTH chars:
+#
+#   "neural" → { "neural", "eural", "nural", "neral", ..., "nral", "neal", ... }
+#
+# At query time a misspelled term is put through the same deletes and any
+# shared key yields a candidate within edit distance ≤ FUZZY_MAX_DISTANCE.
+# Only candidates are verified with a real edit-distance computation, so a
+# lookup costs a few dozen dict probes instead of a scan of the vocabulary.
+
+FUZZY_MAX_DISTANCE = 2
+FUZZY_PREFIX_LENGTH = 7  # deletes beyond this prefix add little but blow up size
+FUZZY_MIN_TERM_LENGTH = 4  # shorter terms have too many near neighbours
+
+
+def fuzzy_deletes(word: str, max_distance: int) -> set[str]:
+    """All strings obtained by deleting 0..max_distance characters from word."""
+    result = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        next_frontier = set()
+        for w in frontier:
+            if len(w) <= 1:
+                continue
+            for i in range(len(w)):
+                next_frontier.add(w[:i] + w[i + 1 :])
+        result |= next_frontier
+        frontier = next_frontier
+    return result
+
+
+def build_fuzzy_index(
+    terms,
+    max_distance: int = FUZZY_MAX_DISTANCE,
+    prefix_length: int = FUZZY_PREFIX_LENGTH,
+) -> dict:
+    """
+    Builds the deletion index over the (stemmed) vocabulary.
+    Numeric terms and very short terms are left out — "1990" should never
+    match "1991", and 3-letter terms would match half the dictionary.
+    """
+    deletes = defaultdict(list)  # delete-string → [term, ...]
+    for term in terms:
+        if len(term) < FUZZY_MIN_TERM_LENGTH or not term.isalpha():
+            continue
+        for d in fuzzy_deletes(term[:prefix_length], max_distance):
+            deletes[d].append(term)
+
+    return {
+        "max_distance": max_distance,
+        "prefix_length": prefix_length,
+        "deletes": dict(deletes),
+    }
+
+
 # INVERTED INDEX BUILDER
 # 
 # Structure of the inverted index:
@@ -359,84 +451,811 @@ def tokenize(text: str) -> list[str]:
 #   {
 #     "metadata": {
 #         "num_docs": <int>,
-#         "avg_doc_length": <float>
+#         "avg_doc_length": <float>,
+#         "avg_title_length": <float>,
+#         "positions": "file" | "none"                ← in index.positions / not stored
 #     },
-#     "doc_lengths": { "<doc_id>": <int>, ... },      ← token count per doc
+#     "doc_lengths": { "<doc_id>": <int>, ... },      ← token count per doc (body)
+#     "title_lengths": { "<doc_id>": <int>, ... },    ← token count per doc (title)
+#     "doc_rank": { "<doc_id>": <float>, ... },       ← PageRank per doc, mean 1 (see compute_pagerank)
+#     "duplicates": { "<doc_id>": "<doc_id>", ... },  ← near-duplicate → canonical doc (see NearDuplicates)
+#     "token_offsets": { "<doc_id>": [<int>, ...] },  ← char offset of each body token (for snippets)
 #     "index": {
 #         "<term>": {
-#             "doc_freq": <int>,                       ← how many docs contain this term
+#             "doc_freq": <int>,                       ← how many docs contain this term (any field)
+#             "positions_at": <int>,                   ← first of its positions in index.positions
 #             "postings": {
 #                 "<doc_id>": {
-#                     "term_freq": <int>,              ← how many times the term appears
-#                     "positions": [<int>, ...]        ← character positions (for phrase search later)
+#                     "term_freq": <int>,              ← how many times the term appears in the body
+#                     "title_freq": <int>              ← occurrences in the title (omitted when 0)
 #                 },
 #                 ...
 #             }
 #         },
 #         ...
+#     },
+#     "fuzzy": {                                       ← deletion index for typo tolerance
+#         "max_distance": <int>,
+#         "prefix_length": <int>,
+#         "deletes": { "<delete>": ["<term>", ...], ... }
+#     },
+#     "tiers": {                                       ← tier 1 of the tiered index (see build_tiers)
+#         "postings": <int>,
+#         "terms": { "<term>": ["<doc_id>", ...], ... }
+#     },
+#     "dense": {                                       ← layout of index.vectors (see build_dense)
+#         "dims": <int>, "lists": <int>, "offsets": [<int>, ...]
 #     }
 #   }
+#
+# Token positions (for phrase search and snippets) go to a binary file next
+# to it, index.positions: uint32 little-endian, term after term in dictionary
+# order and, within a term, posting after posting in the order above.  A
+# posting has exactly term_freq positions, so a term's positions are the
+# sum of its term_freqs starting at positions_at, and the query engine maps
+# the file instead of loading it.  Older indexes keep a "positions" list in
+# each posting (no "positions" metadata key); both are read.
 
 
-def build_index(pages: list[dict]) -> dict:
+def build_index(
+    pages: list[dict],
+    positions: bool = INDEX_POSITIONS,
+    tier1_postings: int = TIER1_POSTINGS,
+    dense: bool = INDEX_DENSE,
+) -> dict:
     """
     Takes the crawled pages list and builds the full inverted index.
+    Positions are kept aside, one array per term, for save_index() to write
+    to index.positions; positions=False leaves them (and token_offsets) out.
+    tier1_postings: size of tier 1 (see build_tiers), 0 for none.
+    dense: add LSA vectors (see build_dense), kept aside for index.vectors.
     """
     num_docs = len(pages)
     index = {}  # term → { doc_freq, postings }
     doc_lengths = {}  # doc_id → number of tokens
+    title_lengths = {}  # doc_id → number of title tokens
+    token_offsets = {}  # doc_id → [char offset of token 0, token 1, ...]
+    all_positions = defaultdict(lambda: array("I"))  # term → positions, posting after posting
+    near_duplicates = NearDuplicates()
 
     for page in pages:
         doc_id = str(page["id"])
-        tokens = tokenize(page["text"])
+        tokens, offsets = tokenize_with_offsets(page["text"])
         doc_lengths[doc_id] = len(tokens)
+        near_duplicates.add(doc_id, tokens)
+        # Offsets are taken on the lowercased text; skip the rare page where
+        # lowercasing changes the length (snippets fall back to scanning)
+        if positions and len(page["text"].lower()) == len(page["text"]):
+            token_offsets[doc_id] = offsets
+        title_freqs = Counter(tokenize(page.get("title", "")))
+        title_lengths[doc_id] = sum(title_freqs.values())
 
         # Count term frequency and track positions within this doc
         term_positions = defaultdict(list)  # term → [pos0, pos1, ...]
         for pos, token in enumerate(tokens):
             term_positions[token].append(pos)
 
-        # Merge into the global index
-        for term, positions in term_positions.items():
+        # Merge into the global index.  Title-only terms get a posting with
+        # term_freq 0; title_freq is only stored where it is non-zero, so the
+        # extra field costs one int per (term, doc) pair that actually has it.
+        for term in term_positions.keys() | title_freqs.keys():
             if term not in index:
                 index[term] = {"doc_freq": 0, "postings": {}}
 
+            doc_positions = term_positions.get(term, ())
+            posting = {"term_freq": len(doc_positions)}
+            if positions and doc_positions:
+                all_positions[term].extend(doc_positions)
+            if term in title_freqs:
+                posting["title_freq"] = title_freqs[term]
+
             index[term]["doc_freq"] += 1
-            index[term]["postings"][doc_id] = {
-                "term_freq": len(positions),
-                "positions": positions,
-            }
+            index[term]["postings"][doc_id] = posting
 
         logger.info(
             f"  Indexed doc {doc_id}: '{page['title']}' ({len(tokens)} tokens, {len(term_positions)} unique)"
         )
 
     avg_doc_length = sum(doc_lengths.values()) / num_docs if num_docs else 0
+    avg_title_length = sum(title_lengths.values()) / num_docs if num_docs else 0
+
+    # Store the dictionary in sorted order so loaders get a sorted term list
+    # (for prefix range scans) without re-sorting
+    index = dict(sorted(index.items()))
 
     full_index = {
-        "metadata": {"num_docs": num_docs, "avg_doc_length": round(avg_doc_length, 2)},
+        "metadata": {
+            "num_docs": num_docs,
+            "avg_doc_length": round(avg_doc_length, 2),
+            "avg_title_length": round(avg_title_length, 2),
+        },
         "doc_lengths": doc_lengths,
+        "title_lengths": title_lengths,
+        "doc_rank": compute_pagerank(pages),
+        "duplicates": near_duplicates.duplicates,
+        "token_offsets": token_offsets,
         "index": index,
+        "fuzzy": build_fuzzy_index(index.keys()),
     }
+    if tier1_postings:
+        full_index["tiers"] = build_tiers(full_index, tier1_postings)
+    if dense:
+        built = build_dense(full_index)
+        if built is not None:
+            full_index["dense"], full_index["vectors"] = built  # vectors: not JSON either
+    if positions:
+        full_index["positions"] = dict(all_positions)  # not JSON: save_index writes it apart
+    else:
+        full_index["metadata"]["positions"] = "none"
+        del full_index["token_offsets"]
 
-    logger.info(f"Index built: {num_docs} docs, {len(index)} unique terms")
+    logger.info(
+        f"Index built: {num_docs} docs, {len(index)} unique terms,"
+        f" {len(near_duplicates.duplicates)} near-duplicates"
+    )
     return full_index
 
 
+# TIERED INDEX
+#
+# Most postings of a frequent term never reach a top-5.  Tier 1 lists, for
+# every term in more than TIER1_POSTINGS docs, the docs of its TIER1_POSTINGS
+# highest-impact postings; the query engine scores a query on tier 1 first
+# and only goes through the full postings when tier 1 can't guarantee the
+# top_k (see score_tiered in query_engine.py).
+#
+# Impact is the posting's BM25F pseudo term frequency (saturation doesn't
+# change the order) with the engine's default field weights and b.  It only
+# decides what goes into tier 1: the engine bounds the postings left out with
+# its own settings, so results stay exact if those are tuned.
+TIER_FIELDS = {"body": (1.0, 0.75), "title": (3.0, 0.5)}  # field → (weight, b)
+
+
+def build_tiers(full_index: dict, size: int = TIER1_POSTINGS) -> dict:
+    """Tier 1 of a built index: term → docs of its `size` highest-impact postings."""
+    doc_lengths, title_lengths = full_index["doc_lengths"], full_index["title_lengths"]
+    metadata = full_index["metadata"]
+    (body_weight, body_b), (title_weight, title_b) = TIER_FIELDS["body"], TIER_FIELDS["title"]
+    avg_doc_length = metadata["avg_doc_length"] or 1
+    avg_title_length = metadata["avg_title_length"] or 1
+
+    def impact(item):
+        doc_id, posting = item
+        norm = 1 - body_b + body_b * doc_lengths[doc_id] / avg_doc_length
+        pseudo_tf = body_weight * posting["term_freq"] / norm
+        if "title_freq" in posting:
+            norm = 1 - title_b + title_b * title_lengths[doc_id] / avg_title_length
+            pseudo_tf += title_weight * posting["title_freq"] / norm
+        return pseudo_tf
+
+    terms = {}
+    for term, entry in full_index["index"].items():
+        postings = entry["postings"]
+        if len(postings) > size:
+            top = heapq.nlargest(size, postings.items(), key=impact)
+            terms[term] = sorted((doc_id for doc_id, _ in top), key=int)
+    logger.info(f"Tier 1: {len(terms)} terms pruned to {size} postings")
+    return {"postings": size, "terms": terms}
+
+
+# PAGERANK
+#
+# A query-independent prior for the query engine's pagerank reranker: pages
+# link to each other by title (crawler.py keeps the outgoing links of every
+# page), links to pages that weren't crawled are dropped, and a page without
+# outgoing links spreads its rank over all pages.  Stored scaled to a mean of
+# 1, so 2.0 reads "twice the average page" at any corpus size.
+PAGERANK_DAMPING = 0.85
+PAGERANK_ITERATIONS = 30
+
+
+def compute_pagerank(
+    pages: list[dict], damping: float = PAGERANK_DAMPING, iterations: int = PAGERANK_ITERATIONS
+) -> dict:
+    """doc_id → PageRank of the page over the crawled link graph (mean 1)."""
+    num_docs = len(pages)
+    if not num_docs:
+        return {}
+    by_title = {page["title"]: n for n, page in enumerate(pages)}
+    out_links = []
+    for n, page in enumerate(pages):
+        targets = {by_title.get(title) for title in page.get("links", ())}
+        targets.discard(None)
+        targets.discard(n)
+        out_links.append(list(targets))
+
+    rank = [1.0 / num_docs] * num_docs
+    for _ in range(iterations):
+        dangling = sum(r for r, links in zip(rank, out_links) if not links)
+        base = (1 - damping + damping * dangling) / num_docs
+        new_rank = [base] * num_docs
+        for r, links in zip(rank, out_links):
+            if links:
+                share = damping * r / len(links)
+                for target in links:
+                    new_rank[target] += share
+        rank = new_rank
+
+    return {str(page["id"]): round(r * num_docs, 4) for page, r in zip(pages, rank)}
+
+
+# NEAR-DUPLICATES
+#
+# Redirects, list pages and mirrored intros crawl as near-identical extracts
+# under different titles.  Two pages are near-duplicates when their sets of
+# shingles (DUP_SHINGLE consecutive tokens, as tokenize() returns them) have
+# a Jaccard similarity of DUP_MIN_SIMILARITY or more, estimated by MinHash:
+# a page's signature is the smallest shingle hash in each of DUP_HASHES bins
+# (one hash per shingle, its top bits pick the bin; an empty bin borrows the
+# next bin's minimum), and the share of bins two signatures agree on is
+# their estimated similarity.
+#
+# Found in the indexing pass itself, by LSH banding: the signature is cut into
+# DUP_BANDS bands, and a page is only compared with the earlier pages equal
+# to it on a whole band.  Pages DUP_MIN_SIMILARITY alike share a band almost
+# surely (1 - (1 - 0.8^4)^16 > 99.9% with 16 bands of 4 bins), unrelated ones
+# hardly ever.  A page joins the cluster of the first page it duplicates;
+# that page (the lowest doc id: the crawl reaches the most linked-to titles
+# first) stays the cluster's canonical doc, and the query engine shows one
+# result per cluster.
+DUP_SHINGLE = 3
+DUP_MIN_SHINGLES = 8  # shorter pages are too short to tell apart reliably
+DUP_HASHES = 64  # bins of a signature (a power of 2)
+DUP_BANDS = 16
+DUP_MIN_SIMILARITY = 0.8
+_MASK64 = 2**64 - 1
+
+
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+
+
+def minhash(tokens: list[str], token_hashes: dict | None = None) -> array | None:
+    """
+    MinHash signature of a token list's shingles, None if it has too few.
+    token_hashes: token → hash cache to share between calls (each token is
+    hashed once, a shingle hashes as the tuple of its tokens' hashes).
+    """
+    count = len(tokens) - DUP_SHINGLE + 1
+    if count < DUP_MIN_SHINGLES:
+        return None
+    if token_hashes is None:
+        token_hashes = {}
+    token_hashes.update((t, _token_hash(t)) for t in set(tokens) if t not in token_hashes)
+    per_token = list(map(token_hashes.__getitem__, tokens))
+    shingles = zip(*(per_token[j:] for j in range(DUP_SHINGLE)))
+    hashes = sorted(map(_MASK64.__and__, map(hash, shingles)), reverse=True)
+
+    # The top bits pick the bin: going down the sorted hashes, the last one
+    # stored for a bin is its smallest
+    value_bits = 64 - (DUP_HASHES.bit_length() - 1)
+    empty = 1 << value_bits
+    smallest = dict(zip(map(rshift, hashes, repeat(value_bits)), hashes))
+    mins = [smallest[b] & (empty - 1) if b in smallest else empty for b in range(DUP_HASHES)]
+    # Densify: an empty bin takes the next filled bin's minimum, marked with
+    # how far it had to look (the same for two pages with the same empty bins)
+    filled = [m < empty for m in mins]
+    for b in range(DUP_HASHES):
+        distance = 0
+        while not filled[(b + distance) % DUP_HASHES]:
+            distance += 1
+        if distance:
+            mins[b] = mins[(b + distance) % DUP_HASHES] + distance * empty
+    return array("Q", mins)
+
+
+class NearDuplicates:
+    """Clusters pages by MinHash as they are added (see NEAR-DUPLICATES)."""
+
+    def __init__(self, min_similarity: float = DUP_MIN_SIMILARITY, bands: int = DUP_BANDS):
+        self.min_agree = math.ceil(min_similarity * DUP_HASHES)  # bins two duplicates share
+        self.rows = DUP_HASHES // bands
+        self.buckets = defaultdict(list)  # (band, its bins) → doc ids
+        self.signatures = {}  # doc id → signature
+        self.token_hashes = {}  # token → hash, see minhash
+        self.duplicates = {}  # doc id → canonical doc id, for docs that aren't canonical
+
+    def add(self, doc_id: str, tokens: list[str]) -> str | None:
+        """Adds a page → the canonical doc id it duplicates, None if none."""
+        signature = minhash(tokens, self.token_hashes)
+        if signature is None:
+            return None
+        keys = [
+            (start, *signature[start : start + self.rows])
+            for start in range(0, DUP_HASHES, self.rows)
+        ]
+        canonical = None
+        compared = set()
+        for key in keys:
+            for other in self.buckets.get(key, ()):
+                if other in compared:
+                    continue
+                compared.add(other)
+                if sum(map(eq, signature, self.signatures[other])) >= self.min_agree:
+                    canonical = self.duplicates.get(other, other)
+                    break
+            if canonical is not None:
+                break
+        for key in keys:
+            self.buckets[key].append(doc_id)
+        self.signatures[doc_id] = signature
+        if canonical is not None:
+            self.duplicates[doc_id] = canonical
+        return canonical
+
+
+# DENSE VECTORS  (optional: INDEX_DENSE=1 or --dense, needs numpy)
+#
+# Latent semantic analysis.  The tf-idf term × doc matrix (log(1 + tf) · idf,
+# title occurrences counted with the body) is factored by a randomized SVD
+# into DENSE_DIMS concepts: a term's vector is its row of U, a doc's vector
+# its column projected on U (Σ · its row of V) at unit length.  Docs about the
+# same concepts end up close even when they share no term, and a query's
+# vector is the idf-weighted sum of its terms' vectors.
+#
+# For approximate nearest neighbours the doc vectors are clustered by
+# spherical k-means into about √N lists (an IVF index): the query engine
+# only scores the docs of the lists whose centroids are nearest the query.
+#
+# Everything goes to index.vectors, little-endian, one block after another:
+#
+#   term vectors   num_terms × dims float32, in dictionary order
+#   centroids      lists × dims float32
+#   doc ids        num_docs uint32 (docs in id order, as the query engine
+#                  numbers them), grouped by list
+#   doc vectors    num_docs × dims float32, in the same order
+#
+# and index.json gets a "dense" section: {"dims", "lists", "offsets": start
+# of every list in the last two blocks, num_docs last}.
+DENSE_DIMS = 64
+DENSE_POWER_ITERATIONS = 2  # randomized SVD passes sharpening the top concepts
+DENSE_KMEANS_ITERATIONS = 10
+DENSE_KMEANS_SAMPLE = 64  # docs per list k-means is trained on
+_SPARSE_CHUNK = 2**18  # matrix entries multiplied at a time
+
+
+def _sparse_dot(np, starts, cols, vals, x):
+    """(rows of a sparse matrix: entries starts[r]:starts[r+1] of cols / vals) · x."""
+    num_rows = len(starts) - 1
+    out = np.zeros((num_rows, x.shape[1]), np.float32)
+    lo = 0
+    while lo < num_rows:
+        hi = int(np.searchsorted(starts, starts[lo] + _SPARSE_CHUNK, side="right")) - 1
+        hi = min(max(hi, lo + 1), num_rows)
+        a, b = starts[lo], starts[hi]
+        if b > a:
+            products = vals[a:b, None] * x[cols[a:b]]
+            row_starts = starts[lo:hi] - a
+            nonempty = row_starts < starts[lo + 1 : hi + 1] - a
+            out[lo:hi][nonempty] = np.add.reduceat(products, row_starts[nonempty])
+        lo = hi
+    return out
+
+
+def _ivf_lists(np, vectors, num_lists: int, rng):
+    """Spherical k-means of unit vectors → (centroids, list of every vector)."""
+    sample = vectors[rng.permutation(len(vectors))[: num_lists * DENSE_KMEANS_SAMPLE]]
+    centroids = sample[:num_lists].copy()
+    for _ in range(DENSE_KMEANS_ITERATIONS):
+        assigned = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assigned, sample)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+    assigned = np.concatenate(
+        [
+            np.argmax(vectors[n : n + 16384] @ centroids.T, axis=1)
+            for n in range(0, len(vectors), 16384)
+        ]
+    )
+    return centroids, assigned
+
+
+def build_dense(full_index: dict, dims: int = DENSE_DIMS, seed: int = 0) -> tuple | None:
+    """
+    LSA vectors + IVF lists of a built index → ("dense" section, vectors for
+    save_index), None without numpy.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        logger.warning("numpy not installed, index built without dense vectors")
+        return None
+
+    doc_ids = sorted(full_index["doc_lengths"], key=int)
+    to_doc = {d: doc for doc, d in enumerate(doc_ids)}
+    num_docs, terms = len(doc_ids), full_index["index"]
+
+    # tf-idf matrix, one row per term (CSR), and its transpose (CSC)
+    starts, cols, tfs = array("q", [0]), array("i"), array("I")
+    for entry in terms.values():
+        postings = entry["postings"]
+        cols.extend(map(to_doc.__getitem__, postings))
+        tfs.extend(p["term_freq"] + p.get("title_freq", 0) for p in postings.values())
+        starts.append(len(cols))
+    starts, cols = np.array(starts), np.array(cols)
+    doc_freqs = np.diff(starts)
+    idf = np.log(1 + (num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+    vals = np.log1p(np.array(tfs, np.float32)) * np.repeat(idf, doc_freqs)
+    order = np.argsort(cols, kind="stable")
+    t_starts = np.zeros(num_docs + 1, np.int64)
+    np.cumsum(np.bincount(cols, minlength=num_docs), out=t_starts[1:])
+    t_cols = np.repeat(np.arange(len(terms), dtype=np.int32), doc_freqs)[order]
+    t_vals = vals[order]
+
+    def by_terms(x):  # A · x
+        return _sparse_dot(np, starts, cols, vals, x)
+
+    def by_docs(x):  # Aᵀ · x
+        return _sparse_dot(np, t_starts, t_cols, t_vals, x)
+
+    rng = np.random.default_rng(seed)
+    dims = max(1, min(dims, len(terms), num_docs))
+    width = min(dims + 10, len(terms), num_docs)
+    q = np.linalg.qr(by_terms(rng.standard_normal((num_docs, width), np.float32)))[0]
+    for _ in range(DENSE_POWER_ITERATIONS):
+        q = np.linalg.qr(by_terms(np.linalg.qr(by_docs(q))[0]))[0]
+    # Aᵀ Q = V Σ Wᵀ  →  A ≈ (Q W) Σ Vᵀ
+    v, sigma, wt = np.linalg.svd(by_docs(q), full_matrices=False)
+    term_vectors = (q @ wt.T[:, :dims]).astype(np.float32)
+    doc_vectors = (v[:, :dims] * sigma[:dims]).astype(np.float32)
+    norms = np.linalg.norm(doc_vectors, axis=1, keepdims=True)
+    doc_vectors /= np.maximum(norms, 1e-12)
+
+    num_lists = max(1, min(round(math.sqrt(num_docs)), num_docs))
+    centroids, assigned = _ivf_lists(np, doc_vectors, num_lists, rng)
+    grouped = np.argsort(assigned, kind="stable").astype(np.uint32)
+    offsets = np.zeros(num_lists + 1, np.int64)
+    np.cumsum(np.bincount(assigned, minlength=num_lists), out=offsets[1:])
+
+    logger.info(f"Dense vectors: {dims} dims, {num_lists} IVF lists")
+    section = {"dims": dims, "lists": num_lists, "offsets": offsets.tolist()}
+    return section, (term_vectors, centroids, grouped, doc_vectors[grouped])
+
+
 # ─────────────────────────────────────────────
 # SAVE / LOAD
 # ─────────────────────────────────────────────
 
 
+def positions_path(index_file: str) -> str:
+    """index.json → index.positions, index.shard0.json → index.shard0.positions."""
+    return os.path.splitext(index_file)[0] + POSITIONS_SUFFIX
+
+
+def head_results_path(index_file: str) -> str:
+    """index.json → index.head.json: precomputed results of its head queries."""
+    return os.path.splitext(index_file)[0] + HEAD_RESULTS_SUFFIX
+
+
+def vectors_path(index_file: str) -> str:
+    """index.json → index.vectors: its dense vectors and IVF lists."""
+    return os.path.splitext(index_file)[0] + VECTORS_SUFFIX
+
+
 def save_index(full_index: dict, filepath: str):
+    """
+    Writes index.json, and index.positions if full_index has a "positions"
+    section (term → array of positions, as built by build_index), and
+    index.vectors if it has "vectors" (see build_dense).
+    """
+    if "positions" in full_index:
+        full_index = _save_positions(full_index, positions_path(filepath))
+    if "vectors" in full_index:
+        full_index = _save_vectors(full_index, vectors_path(filepath))
     with open(filepath, "w", encoding="utf-8") as f:
         json.dump(full_index, f, ensure_ascii=False, indent=2)
     logger.info(f"Index saved → {filepath}")
 
 
-def load_index(filepath: str) -> dict:
-    with open(filepath, "r", encoding="utf-8") as f:
-        return json.load(f)
+def _save_positions(full_index: dict, filepath: str) -> dict:
+    """
+    Writes the positions section to filepath → full_index without it, each
+    term entry with its "positions_at" (the caller's dicts are not changed).
+    """
+    all_positions = full_index["positions"]
+    index = {}
+    start = 0
+    with open(filepath, "wb") as f:
+        for term, entry in full_index["index"].items():
+            index[term] = {
+                "doc_freq": entry["doc_freq"],
+                "positions_at": start,
+                "postings": entry["postings"],
+            }
+            positions = all_positions.get(term)
+            if positions:
+                if sys.byteorder == "big":
+                    positions = array("I", positions)
+                    positions.byteswap()
+                positions.tofile(f)
+                start += len(positions)
+    logger.info(f"Positions saved → {filepath} ({start:,} positions)")
+
+    saved = {key: value for key, value in full_index.items() if key != "positions"}
+    saved["metadata"] = dict(full_index["metadata"], positions="file")
+    saved["index"] = index
+    return saved
+
+
+def _save_vectors(full_index: dict, filepath: str) -> dict:
+    """Writes the vectors of build_dense to filepath → full_index without them."""
+    with open(filepath, "wb") as f:
+        for block in full_index["vectors"]:
+            f.write(block.astype(block.dtype.newbyteorder("<"), copy=False).tobytes())
+    logger.info(f"Dense vectors saved → {filepath}")
+    return {key: value for key, value in full_index.items() if key != "vectors"}
+
+
+def load_positions(full_index: dict, filepath: str) -> dict | None:
+    """
+    The positions of an index loaded with load_index() from filepath, in
+    build_index()'s form (term → array, positions_at dropped from the
+    entries), for tools that rewrite an index (shards.py).  None if they
+    aren't in a positions file.
+    """
+    if full_index["metadata"].get("positions") != "file":
+        return None
+    with open(positions_path(filepath), "rb") as f:
+        stored = array("I")
+        stored.frombytes(f.read())
+    if sys.byteorder == "big":
+        stored.byteswap()
+    all_positions = {}
+    for term, entry in full_index["index"].items():
+        start = entry.pop("positions_at")
+        count = sum(posting["term_freq"] for posting in entry["postings"].values())
+        if count:
+            all_positions[term] = stored[start : start + count]
+    return all_positions
+
+
+LOAD_CHUNK_SIZE = 16 * 2**20  # bytes read between two progress callbacks
+
+
+def load_index(filepath: str, progress=None) -> dict:
+    """
+    Reads a JSON file (index or crawled pages).  If given, progress(bytes_read)
+    is called after every LOAD_CHUNK_SIZE bytes, before parsing starts.
+    """
+    if progress is None:
+        with open(filepath, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    # One preallocated buffer, filled in chunks (no second copy of the file)
+    buf = bytearray(os.path.getsize(filepath))
+    view = memoryview(buf)
+    read = 0
+    with open(filepath, "rb") as f:
+        while read < len(buf):
+            n = f.readinto(view[read : read + LOAD_CHUNK_SIZE])
+            if not n:
+                break
+            read += n
+            progress(read)
+    view.release()
+    del buf[read:]
+    return json.loads(buf)
+
+
+READ_CHUNK_SIZE = 2**20  # bytes read at a time by JsonStream
+
+_NOT_WS = re.compile(r"\S")
+_PLAIN_KEY = re.compile(r'\s*"([^"\\]*)"\s*:')  # "key": with no escapes
+_INDENT = re.compile(r"\s*")
+# After a complete JSON value, none of these can follow: a number cut by the
+# end of the buffer ("12." + "5") decodes to a shorter one followed by them
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
+
+
+def _utf8(text: str) -> str:
+    """Undoes the latin-1 decoding of a JsonStream (one char per byte)."""
+    return text if text.isascii() else text.encode("latin-1").decode("utf-8")
+
+
+class JsonStream:
+    """
+    Pull parser over a JSON file.  items() / elements() walk an object / array
+    one entry at a time and value() decodes a single value with the json
+    module's raw_decode, over a buffer refilled from the file as needed, so
+    only one entry is ever decoded at a time.
+
+    With encoding="latin-1" one char is one byte: tell() is a byte offset and
+    entry sizes are exact (inspect_index.py).  Decoded strings with non-ASCII
+    characters then need _utf8() (keys from items() already get it).
+
+    If given, progress(chars_read) is called after every chunk read.
+
+        with JsonStream("index.json") as stream:
+            for section in stream.items():
+                if section == "metadata":
+                    metadata = stream.value()
+                else:
+                    stream.skip()
+    """
+
+    def __init__(
+        self,
+        path: str,
+        chunk_size: int = READ_CHUNK_SIZE,
+        encoding: str = "utf-8",
+        progress=None,
+    ):
+        self._file = open(path, "r", encoding=encoding)
+        self._latin1 = encoding == "latin-1"
+        self._chunk_size = chunk_size
+        self._progress = progress
+        self._buf = ""
+        self._pos = 0
+        self._base = 0  # chars dropped from the front of _buf
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def tell(self) -> int:
+        return self._base + self._pos
+
+    def _fill(self) -> bool:
+        """Appends at least as much as is buffered (so long values cost O(n))."""
+        if self._eof:
+            return False
+        more = self._file.read(max(self._chunk_size, len(self._buf) - self._pos))
+        if not more:
+            self._eof = True
+            return False
+        self._base += self._pos
+        self._buf = self._buf[self._pos :] + more
+        self._pos = 0
+        if self._progress is not None:
+            self._progress(self._base + len(self._buf))
+        return True
+
+    def _peek(self) -> str:
+        """Next non-whitespace char ("" at the end of the file)."""
+        char = self._buf[self._pos : self._pos + 1]
+        if char and not char.isspace():
+            return char
+        while True:
+            match = _NOT_WS.search(self._buf, self._pos)
+            if match:
+                self._pos = match.start()
+                return self._buf[self._pos]
+            self._pos = len(self._buf)
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars: str) -> str:
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError(f"expected one of {chars!r} at char {self.tell()}, got {char!r}")
+        self._pos += 1
+        return char
+
+    def _decode(self) -> tuple[object, int]:
+        """Decodes the next value → (value, where it starts in _buf)."""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # A number ending at the end of the buffer may go on in the file
+                if self._eof or (end < len(self._buf) and self._buf[end] not in _NUMBER_CHARS):
+                    break
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+        start, self._pos = self._pos, end
+        return value, start
+
+    def raw(self) -> tuple[object, str]:
+        """Decodes the next value → (value, its text as found in the file)."""
+        value, start = self._decode()
+        return value, self._buf[start : self._pos]
+
+    def value(self):
+        return self._decode()[0]
+
+    def skip(self):
+        """Moves past the next value without holding all of it in memory."""
+        char = self._peek()
+        try:
+            # Whole value already buffered: one C-speed decode
+            _, end = self._decoder.raw_decode(self._buf, self._pos)
+            if end < len(self._buf) and self._buf[end] not in _NUMBER_CHARS:
+                self._pos = end
+                return
+        except json.JSONDecodeError:
+            pass
+        # Too long for the buffer: walk a container entry by entry
+        if char == "{":
+            for _ in self.items():
+                self.skip()
+        elif char == "[":
+            for _ in self.elements():
+                self.skip()
+        else:
+            self._decode()
+
+    def items(self):
+        """
+        Yields the keys of the object at the cursor.  After each key the
+        cursor is on its value, which the caller must consume (value(),
+        skip(), items() or elements()) before asking for the next key.
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            # One regex match per key; escaped keys go through the decoder
+            match = _PLAIN_KEY.match(self._buf, self._pos)
+            if match and match.end() < len(self._buf):
+                key = match.group(1)
+                self._pos = match.end()
+            else:
+                key = self.value()
+                self._expect(":")
+            yield _utf8(key) if self._latin1 else key
+            if self._expect(",}") == "}":
+                return
+
+    def entries(self):
+        """
+        Yields (key, value) for each entry of the object at the cursor, like
+        items() + value() but for objects of many small values: whatever is
+        buffered is decoded in one go, cut before the last key at the
+        object's own indentation (one entry per line, as save_index writes
+        them).  A cut inside a nested value can't decode, so anything else
+        (compact JSON) goes one entry at a time.
+        """
+        self._expect("{")
+        indent = _INDENT.match(self._buf, self._pos).group()
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        next_key = "," + indent + '"' if "\n" in indent else None
+        while True:
+            if next_key is not None:
+                cut = self._buf.rfind(next_key, self._pos)
+                if cut > self._pos:
+                    try:
+                        batch = self._decoder.decode("{" + self._buf[self._pos : cut] + "}")
+                    except json.JSONDecodeError:
+                        next_key = None  # not one entry per line after all
+                    else:
+                        self._pos = cut + 1
+                        for key, value in batch.items():
+                            yield (_utf8(key) if self._latin1 else key), value
+                        continue
+            # Last entry in the buffer: one at a time (refilling as needed)
+            key = self.value()
+            self._expect(":")
+            value = self.value()
+            yield (_utf8(key) if self._latin1 else key), value
+            if self._expect(",}") == "}":
+                return
+
+    def elements(self):
+        """Like items() for an array: yields each index with the cursor on the element."""
+        self._expect("[")
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        n = 0
+        while True:
+            yield n
+            n += 1
+            if self._expect(",]") == "]":
+                return
 
 
 # ─────────────────────────────────────────────
@@ -451,5 +1270,9 @@ if __name__ == "__main__":
     if not pages:
         logger.warning("No pages found in crawled data. Run crawler.py first.")
     else:
-        full_index = build_index(pages)
+        full_index = build_index(
+            pages,
+            INDEX_POSITIONS and "--no-positions" not in sys.argv[1:],
+            dense=INDEX_DENSE or "--dense" in sys.argv[1:],
+        )
         save_index(full_index, INDEX_FILE)
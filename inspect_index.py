@@ -0,0 +1,290 @@
+import os
+import re
+import json
+import heapq
+import logging
+import argparse
+from collections import Counter
+
+from indexer import INDEX_FILE, CRAWLED_DATA_FILE, JsonStream, positions_path, vectors_path
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+# INDEX INSPECTOR
+#
+# Size and shape of an index on disk, for capacity planning and pruning:
+#
+#   components         bytes of dictionary, postings, positions, doc metadata,
+#                      snippet offsets, fuzzy table, dense vectors and docstore
+#                      (crawled pages)
+#   postings           number of postings, postings per term, total positions
+#   df_histogram       terms per doc-freq bucket (1, 2-3, 4-7, 8-15, …)
+#   doc_length         average / max document and title length
+#   heaviest_terms     the top-N terms by bytes on disk
+#
+# The files are streamed: JsonStream (indexer.py) walks index.json entry by
+# entry and only one term's postings are ever decoded at a time, so
+# inspecting an index needs a few MB of memory whatever its size.  A format
+# is just a reader that feeds IndexStats; READERS maps file extensions to
+# readers, so another on-disk format only needs its own reader.
+#
+#   python inspect_index.py [index.json] [--pages crawled_data.json] [--top 20] [--json]
+
+INSPECT_TOP = 20  # heaviest terms listed
+_POSITIONS = re.compile(r'"positions":\s*\[[^\]]*\]')
+
+
+# ─────────────────────────────────────────────
+# STATISTICS
+# ─────────────────────────────────────────────
+
+
+def _df_bucket(doc_freq: int) -> str:
+    """1, 2-3, 4-7, 8-15, … (powers of two)."""
+    low = 1 << (max(doc_freq, 1).bit_length() - 1)
+    return "1" if low == 1 else f"{low}-{2 * low - 1}"
+
+
+class IndexStats:
+    """Accumulates what a reader reports; report() turns it into the inspector's output."""
+
+    def __init__(self, top: int = INSPECT_TOP):
+        self.top = top
+        self.metadata = {}
+        self.files = {}  # role → (path, bytes)
+        self.components = Counter()  # component → bytes
+        self.num_terms = 0
+        self.num_postings = 0
+        self.num_positions = 0
+        self.max_doc_freq = 0
+        self.df_histogram = Counter()
+        self.num_pages = None
+        self._heaviest = []  # min-heap of (bytes, term, doc_freq, positions)
+        self._lengths = {"doc": [0, 0, 0], "title": [0, 0, 0]}  # count, total, max
+
+    def add_component(self, name: str, size: int):
+        self.components[name] += size
+
+    def add_length(self, kind: str, length: int):
+        stats = self._lengths[kind]
+        stats[0] += 1
+        stats[1] += length
+        stats[2] = max(stats[2], length)
+
+    def add_term(self, term: str, doc_freq: int, positions: int, size: int):
+        """size: the term's bytes on disk (postings + positions)."""
+        self.num_terms += 1
+        self.num_postings += doc_freq
+        self.num_positions += positions
+        self.max_doc_freq = max(self.max_doc_freq, doc_freq)
+        self.df_histogram[_df_bucket(doc_freq)] += 1
+        entry = (size, term, doc_freq, positions)
+        if len(self._heaviest) < self.top:
+            heapq.heappush(self._heaviest, entry)
+        elif entry > self._heaviest[0]:
+            heapq.heapreplace(self._heaviest, entry)
+
+    def report(self) -> dict:
+        def lengths(kind):
+            count, total, longest = self._lengths[kind]
+            return {"avg": round(total / count, 2) if count else 0, "max": longest}
+
+        terms = self.num_terms or 1
+        return {
+            "files": {role: {"path": p, "bytes": b} for role, (p, b) in self.files.items()},
+            "num_docs": self.metadata.get("num_docs", self._lengths["doc"][0]),
+            "num_pages": self.num_pages,
+            "num_terms": self.num_terms,
+            "components": dict(self.components.most_common()),
+            "postings": {
+                "total": self.num_postings,
+                "per_term_avg": round(self.num_postings / terms, 2),
+                "per_term_max": self.max_doc_freq,
+                "bytes_per_term_avg": round(
+                    (self.components["postings"] + self.components["positions"]) / terms, 1
+                ),
+                "positions_total": self.num_positions,
+            },
+            "df_histogram": dict(
+                sorted(self.df_histogram.items(), key=lambda item: int(item[0].split("-")[0]))
+            ),
+            "doc_length": lengths("doc"),
+            "title_length": lengths("title"),
+            "heaviest_terms": [
+                {"term": term, "bytes": size, "doc_freq": doc_freq, "positions": positions}
+                for size, term, doc_freq, positions in sorted(self._heaviest, reverse=True)
+            ],
+        }
+
+
+# ─────────────────────────────────────────────
+# READERS
+# ─────────────────────────────────────────────
+
+
+def _read_json_terms(stream: JsonStream, stats: IndexStats):
+    for term in stream.items():
+        start = stream.tell()
+        entry, text = stream.raw()
+        size = stream.tell() - start
+        if "positions_at" in entry:
+            # In the positions file: 4 bytes each, term_freq of them per posting
+            positions = sum(p["term_freq"] for p in entry["postings"].values())
+            postings_bytes, positions_bytes = size, 4 * positions
+        else:
+            positions_bytes = sum(len(m.group()) for m in _POSITIONS.finditer(text))
+            positions = sum(len(p.get("positions", ())) for p in entry["postings"].values())
+            postings_bytes = size - positions_bytes
+        stats.add_component("dictionary", len(term.encode("utf-8")) + 2)
+        stats.add_component("postings", postings_bytes)
+        stats.add_component("positions", positions_bytes)
+        stats.add_term(
+            term,
+            entry.get("doc_freq", len(entry["postings"])),
+            positions,
+            postings_bytes + positions_bytes,
+        )
+
+
+def read_json_index(path: str, stats: IndexStats):
+    """index.json (+ index.positions, index.vectors) as written by indexer.save_index()."""
+    # index.json section → component it is accounted to
+    components = {
+        "metadata": "doc_metadata",
+        "doc_lengths": "doc_metadata",
+        "title_lengths": "doc_metadata",
+        "doc_rank": "doc_metadata",
+        "duplicates": "doc_metadata",
+        "token_offsets": "snippet_offsets",
+        "fuzzy": "fuzzy",
+        "dense": "dense_vectors",
+    }
+    lengths = {"doc_lengths": "doc", "title_lengths": "title"}
+    with JsonStream(path, encoding="latin-1") as stream:
+        for section in stream.items():
+            start = stream.tell()
+            if section == "metadata":
+                stats.metadata = stream.value()
+                if stats.metadata.get("positions") == "file":
+                    positions_file = positions_path(path)
+                    stats.files["positions"] = (positions_file, os.path.getsize(positions_file))
+            elif section in lengths:
+                for _ in stream.items():
+                    stats.add_length(lengths[section], stream.value())
+            elif section == "index":
+                _read_json_terms(stream, stats)
+                continue  # accounted per term
+            elif section == "dense":
+                stream.skip()
+                vectors_file = vectors_path(path)
+                stats.files["vectors"] = (vectors_file, os.path.getsize(vectors_file))
+                stats.add_component("dense_vectors", stats.files["vectors"][1])
+            else:
+                stream.skip()
+            stats.add_component(components.get(section, section), stream.tell() - start)
+
+
+def read_json_pages(path: str, stats: IndexStats):
+    """crawled_data.json: one entry per document (the docstore)."""
+    with JsonStream(path) as stream:
+        pages = 0
+        for _ in stream.elements():
+            stream.skip()
+            pages += 1
+    stats.num_pages = pages
+    stats.add_component("docstore", os.path.getsize(path))
+
+
+# file extension → (index reader, pages reader)
+READERS = {
+    ".json": (read_json_index, read_json_pages),
+}
+
+
+def _reader(path: str, role: int):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in READERS:
+        raise ValueError(f"no reader for {ext or 'extension-less'} files: {path}")
+    return READERS[ext][role]
+
+
+def inspect_index(
+    index_file: str = INDEX_FILE, pages_file: str | None = CRAWLED_DATA_FILE, top: int = INSPECT_TOP
+) -> dict:
+    """Streams the index (and, if it exists, the pages file) → IndexStats.report()."""
+    stats = IndexStats(top)
+    stats.files["index"] = (index_file, os.path.getsize(index_file))
+    _reader(index_file, 0)(index_file, stats)
+    if pages_file and os.path.exists(pages_file):
+        stats.files["pages"] = (pages_file, os.path.getsize(pages_file))
+        _reader(pages_file, 1)(pages_file, stats)
+    return stats.report()
+
+
+# ─────────────────────────────────────────────
+# OUTPUT
+# ─────────────────────────────────────────────
+
+
+def _mb(size: int) -> str:
+    return f"{size / 2**20:10.2f} MB"
+
+
+def print_report(report: dict):
+    print(f"\n📦 {report['files']['index']['path']}")
+    print(f"  docs {report['num_docs']:,}   terms {report['num_terms']:,}", end="")
+    if report["num_pages"] is not None:
+        print(f"   pages {report['num_pages']:,}", end="")
+    print()
+
+    print("\nBytes per component")
+    total = sum(report["components"].values()) or 1
+    for name, size in report["components"].items():
+        print(f"  {name:<16}{_mb(size)}  {100 * size / total:5.1f}%")
+
+    postings = report["postings"]
+    print("\nPostings")
+    print(f"  total {postings['total']:,}   positions {postings['positions_total']:,}")
+    print(
+        f"  per term: avg {postings['per_term_avg']}  max {postings['per_term_max']:,}"
+        f"   avg bytes {postings['bytes_per_term_avg']:,}"
+    )
+    for kind in ("doc_length", "title_length"):
+        print(f"  {kind.replace('_', ' ')}: avg {report[kind]['avg']}  max {report[kind]['max']}")
+
+    print("\nDoc-freq histogram (terms)")
+    widest = max(report["df_histogram"].values(), default=1)
+    for bucket, count in report["df_histogram"].items():
+        print(f"  {bucket:>13}  {count:>9,}  {'█' * max(1, round(40 * count / widest))}")
+
+    print(f"\nHeaviest {len(report['heaviest_terms'])} terms")
+    for row in report["heaviest_terms"]:
+        print(
+            f"  {row['term']:<20}{_mb(row['bytes'])}  df {row['doc_freq']:>8,}"
+            f"  positions {row['positions']:>10,}"
+        )
+
+
+# ─────────────────────────────────────────────
+# ENTRY POINT
+# ─────────────────────────────────────────────
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Size and shape of an index on disk")
+    parser.add_argument("index", nargs="?", default=INDEX_FILE)
+    parser.add_argument("--pages", default=CRAWLED_DATA_FILE, help="docstore file ('' to skip)")
+    parser.add_argument("--top", type=int, default=INSPECT_TOP)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    result = inspect_index(args.index, args.pages or None, args.top)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print_report(result)
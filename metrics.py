@@ -0,0 +1,242 @@
+import time
+import threading
+from bisect import bisect_left
+
+
+# METRICS
+#
+# In-process latency histograms, counters and gauges, rendered in the
+# Prometheus text format by app.py's /metrics endpoint.  Cheap enough to stay
+# on in production: an observation is one bisect over ~15 bucket bounds and
+# a few additions under a per-series lock — a few microseconds per stage.
+#
+#   search_stage_seconds{stage="parse"|"candidates"|"scoring"|"topk"|"rerank_<name>"|"dense"|
+#                        "snippets"|"summary"}
+#   search_seconds                    end-to-end search() latency
+#   search_queries_total{mode=...}    queries run, by parsed mode
+#   search_postings_touched_total     postings entries of the terms queries resolved
+#   index_load_seconds                how long the last index load took
+#   plan_cache_requests_total{result="hit"|"miss"}
+#   search_tier_total{result="tier1"|"full"}   simple queries answered from tier 1 or not
+#   result_cache_requests_total{result="hit"|"miss"|"head"}
+#   page_cache_requests_total{result="hit"|"miss"}   later pages cut from a cached ranking or not
+#   warmup_seconds                    how long the last query-log warmup took
+#   search_rerank_over_budget_total{stage="retrieval"|<reranker>}   stages past their time budget
+#   search_duplicates_collapsed_total   near-duplicate results folded into a better one
+#
+# Every histogram also exports its p50 / p95 / p99, estimated from the
+# buckets the same way Prometheus' histogram_quantile() does.
+
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)  # seconds
+QUANTILES = (0.5, 0.95, 0.99)
+
+# name → (type, help)
+METRICS = {
+    "search_stage_seconds": ("histogram", "Time spent in each stage of a search."),
+    "search_seconds": ("histogram", "End-to-end search() latency, AI summary included."),
+    "search_queries_total": ("counter", "Queries run, by parsed query mode."),
+    "search_postings_touched_total": (
+        "counter",
+        "Postings entries of the index terms resolved by queries.",
+    ),
+    "index_load_seconds": ("gauge", "Time the last index load took."),
+    "plan_cache_requests_total": ("counter", "Plan cache lookups, by hit / miss."),
+    "search_tier_total": ("counter", "Simple queries answered from tier 1 / the full index."),
+    "result_cache_requests_total": (
+        "counter",
+        "search() result cache lookups, by hit / miss / head-query table.",
+    ),
+    "page_cache_requests_total": (
+        "counter",
+        "Pages after the first, cut from a cached ranking (hit) or a new one (miss).",
+    ),
+    "warmup_seconds": ("gauge", "Time the last query-log warmup took."),
+    "search_rerank_over_budget_total": (
+        "counter",
+        "Searches whose retrieval / a reranker ran past its time budget.",
+    ),
+    "search_duplicates_collapsed_total": (
+        "counter",
+        "Near-duplicate results folded into a better-ranked doc of their cluster.",
+    ),
+}
+
+
+class Histogram:
+    """Fixed-bucket histogram (cumulative on render, like Prometheus)."""
+
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        slot = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[slot] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Linear interpolation inside the bucket holding the q-th observation."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for slot, count in enumerate(counts):
+            if seen + count >= rank and count:
+                if slot == len(self.bounds):
+                    return self.bounds[-1]  # +Inf bucket: best we can say
+                lower = self.bounds[slot - 1] if slot else 0.0
+                return lower + (self.bounds[slot] - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+
+# (name, labels) → Histogram | float
+_series = {}
+_series_lock = threading.Lock()
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted(labels.items())))
+
+
+def histogram(name: str, **labels) -> Histogram:
+    key = _key(name, labels)
+    series = _series.get(key)
+    if series is None:
+        with _series_lock:
+            series = _series.setdefault(key, Histogram())
+    return series
+
+
+def observe(name: str, value: float, **labels):
+    histogram(name, **labels).observe(value)
+
+
+def inc(name: str, amount: float = 1, **labels):
+    key = _key(name, labels)
+    with _series_lock:
+        _series[key] = _series.get(key, 0) + amount
+
+
+def set_gauge(name: str, value: float, **labels):
+    with _series_lock:
+        _series[_key(name, labels)] = value
+
+
+class timer:
+    """
+    with metrics.timer("scoring"): ...
+    observes the block's duration in search_stage_seconds{stage="scoring"}
+    (or in the histogram given as name=...).
+    """
+
+    __slots__ = ("histogram", "start")
+
+    _stages = {}  # stage → Histogram, so entering a timer is one dict lookup
+
+    def __init__(self, stage: str | None = None, name: str = "search_stage_seconds"):
+        series = self._stages.get((stage, name))
+        if series is None:
+            series = histogram(name, **({"stage": stage} if stage else {}))
+            self._stages[(stage, name)] = series
+        self.histogram = series
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+def _labels(pairs, extra=()) -> str:
+    pairs = tuple(pairs) + tuple(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render() -> str:
+    """All series in the Prometheus text exposition format (version 0.0.4)."""
+    with _series_lock:
+        series = sorted(_series.items(), key=lambda item: item[0])
+
+    lines = []
+    described = set()
+    for (name, labels), value in series:
+        kind, help_text = METRICS.get(name, ("untyped", name))
+        if name not in described:
+            described.add(name)
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+        if not isinstance(value, Histogram):
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+            continue
+
+        with value._lock:
+            counts, total, sum_ = list(value.counts), value.count, value.sum
+        cumulative = 0
+        for bound, count in zip(value.bounds + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{name}_bucket{_labels(labels, [('le', le)])} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(sum_)}")
+        lines.append(f"{name}_count{_labels(labels)} {total}")
+
+    # Quantile estimates as plain gauges, for dashboards without PromQL
+    histograms = [(k, v) for k, v in series if isinstance(v, Histogram)]
+    for name in dict.fromkeys(name for (name, _), _ in histograms):
+        lines.append(f"# HELP {name}_quantile Estimated quantiles of {name}.")
+        lines.append(f"# TYPE {name}_quantile gauge")
+        for (series_name, labels), histogram in histograms:
+            if series_name != name:
+                continue
+            for q in QUANTILES:
+                estimate = histogram.quantile(q)
+                lines.append(
+                    f"{name}_quantile{_labels(labels, [('quantile', q)])} {estimate!r}"
+                )
+    return "\n".join(lines) + "\n"
+
+
+def snapshot() -> dict:
+    """Same data as render(), as JSON-friendly dicts with p50 / p95 / p99."""
+    with _series_lock:
+        series = list(_series.items())
+    result = {}
+    for (name, labels), value in series:
+        label = ",".join(f"{k}={v}" for k, v in labels)
+        key = f"{name}{{{label}}}" if label else name
+        if isinstance(value, Histogram):
+            result[key] = {
+                "count": value.count,
+                "sum": round(value.sum, 6),
+                **{f"p{round(q * 100)}": round(value.quantile(q), 6) for q in QUANTILES},
+            }
+        else:
+            result[key] = value
+    return result
+
+
+def reset():
+    with _series_lock:
+        _series.clear()
+        timer._stages.clear()
@@ -0,0 +1,218 @@
+import os
+import io
+import sys
+import time
+import pstats
+import cProfile
+import logging
+import threading
+from collections import Counter
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+# PROFILING
+#
+# Two ways to see where a slow query spends its time:
+#
+#   profile_call()      runs one call under cProfile → top functions (+ .pstats dump)
+#   SamplingProfiler    a thread that snapshots stacks every few ms → collapsed
+#                       stacks ("a;b;c 42" lines, what flamegraph.pl and
+#                       speedscope read).  Much lower overhead than cProfile.
+#
+# app.py exposes both per request (/search?profile=1 or profile=sample, with
+# the admin token).  Setting PROFILE_SAMPLING=1 also starts a process-wide
+# sampler that writes one collapsed-stack file per PROFILE_FLUSH_SECONDS.
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_TOP = 25  # functions listed in a cProfile report
+SAMPLE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "0.005"))  # seconds
+PROFILE_FLUSH_SECONDS = float(os.environ.get("PROFILE_FLUSH_SECONDS", "60"))
+
+
+def _dump_path(suffix: str) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    return os.path.join(PROFILE_DIR, f"profile-{os.getpid()}-{time.time_ns()}.{suffix}")
+
+
+# ─────────────────────────────────────────────
+# cPROFILE
+# ─────────────────────────────────────────────
+
+
+def profile_call(fn, *args, dump: bool = False, top: int = PROFILE_TOP, **kwargs):
+    """
+    Runs fn(*args, **kwargs) under cProfile.
+    Returns (fn's result, report) where report is:
+        {
+            "total_ms": 12.3,
+            "functions": [{"function": "score_simple", "location": "query_engine.py:812",
+                           "calls": 1, "tottime_ms": 4.1, "cumtime_ms": 9.8}, ...],
+            "dump": "profiles/profile-….pstats"   (only if dump=True)
+        }
+    """
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        profiler.disable()
+    report = {"total_ms": round((time.perf_counter() - start) * 1000, 3)}
+
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)  # cumtime
+    report["functions"] = [
+        {
+            "function": name,
+            "location": f"{os.path.basename(filename)}:{line}",
+            "calls": calls,
+            "tottime_ms": round(tottime * 1000, 3),
+            "cumtime_ms": round(cumtime * 1000, 3),
+        }
+        for (filename, line, name), (_, calls, tottime, cumtime, _) in rows[:top]
+    ]
+    if dump:
+        report["dump"] = _dump_path("pstats")
+        stats.dump_stats(report["dump"])
+    return result, report
+
+
+# ─────────────────────────────────────────────
+# SAMPLING PROFILER
+# ─────────────────────────────────────────────
+
+
+def _collapse(frame) -> str:
+    """Frame → "module:function;module:function;…" from the outermost call."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread (thread_id) or of every other thread
+    (thread_id=None) every interval seconds, from a daemon thread.
+        with SamplingProfiler(threading.get_ident()) as sampler:
+            search(...)
+        sampler.collapsed()   # → "app.py:search_endpoint;query_engine.py:search;… 12\n…"
+    """
+
+    def __init__(self, thread_id: int | None = None, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()  # collapsed stack → number of samples
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if self.thread_id is not None:
+                frames = {self.thread_id: frames.get(self.thread_id)}
+            stacks = [_collapse(f) for tid, f in frames.items() if f is not None and tid != me]
+            with self._lock:
+                self.samples.update(stacks)
+
+    def take(self) -> Counter:
+        """Returns the samples so far and starts counting from zero."""
+        with self._lock:
+            samples, self.samples = self.samples, Counter()
+        return samples
+
+    def collapsed(self, samples: Counter | None = None) -> str:
+        samples = self.samples if samples is None else samples
+        return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+    def top(self, samples: Counter | None = None, limit: int = PROFILE_TOP) -> list[dict]:
+        """Leaf functions by share of samples (where the time is actually spent)."""
+        samples = self.samples if samples is None else samples
+        leaves = Counter()
+        for stack, count in samples.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [
+            {"function": leaf, "samples": count, "percent": round(100 * count / total, 1)}
+            for leaf, count in leaves.most_common(limit)
+        ]
+
+    def dump(self, samples: Counter | None = None) -> str:
+        path = _dump_path("folded")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.collapsed(samples))
+        return path
+
+
+def sample_call(fn, *args, dump: bool = False, **kwargs):
+    """Like profile_call, with the sampling profiler on the calling thread."""
+    with SamplingProfiler(threading.get_ident()) as sampler:
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+    report = {
+        "total_ms": round(elapsed * 1000, 3),
+        "interval_ms": sampler.interval * 1000,
+        "samples": sum(sampler.samples.values()),
+        "functions": sampler.top(),
+    }
+    if dump:
+        report["dump"] = sampler.dump()
+    return result, report
+
+
+# ─────────────────────────────────────────────
+# PROCESS-WIDE SAMPLING
+# ─────────────────────────────────────────────
+
+_process_sampler = None
+
+
+def start_process_sampling(flush_seconds: float = PROFILE_FLUSH_SECONDS) -> SamplingProfiler:
+    """
+    Samples every thread of this worker for as long as it lives, writing the
+    collapsed stacks of each flush_seconds window to PROFILE_DIR.
+    """
+    global _process_sampler
+    if _process_sampler is not None:
+        return _process_sampler
+    _process_sampler = SamplingProfiler().start()
+
+    def flush():
+        while True:
+            time.sleep(flush_seconds)
+            samples = _process_sampler.take()
+            if samples:
+                logger.info("Wrote process profile → %s", _process_sampler.dump(samples))
+
+    threading.Thread(target=flush, name="profile-flush", daemon=True).start()
+    logger.info("Process-wide sampling every %.1f ms → %s/", SAMPLE_INTERVAL * 1000, PROFILE_DIR)
+    return _process_sampler
@@ -514,16 +514,46 @@
 
 
 import json
+import atexit
 import math
+import base64
+import hashlib
 import re
 import logging
 import os
-from collections import defaultdict
-from indexer import tokenize, load_index
+import gc
+import sys
+import mmap
+import heapq
+import time
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, defaultdict
+from itertools import accumulate, chain, compress, count
+from operator import itemgetter, le, mul
+from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+import metrics
+import querylog
+from querylog import normalize_query
+from indexer import (
+    tokenize,
+    tokenize_with_offsets,
+    load_index,
+    positions_path,
+    vectors_path,
+    head_results_path,
+    JsonStream,
+    build_fuzzy_index,
+    fuzzy_deletes,
+    FUZZY_MIN_TERM_LENGTH,
+)
 
 # CONFIG
-INDEX_FILE = "index.json"
-CRAWLED_DATA_FILE = "crawled_data.json"
+INDEX_FILE = os.environ.get("INDEX_FILE", "index.json")  # e.g. a shard file (shards.py)
+CRAWLED_DATA_FILE = os.environ.get("CRAWLED_DATA_FILE", "crawled_data.json")
 TOP_K = 5  # number of results to return by default
 SNIPPET_LENGTH = 200  # max chars in the snippet shown per result
 
@@ -531,6 +561,19 @@ SNIPPET_LENGTH = 200  # max chars in the snippet shown per result
 BM25_K1 = 1.5  # term-frequency saturation. Higher -> longer docs get more credit for repeated terms
 BM25_B = 0.75  # length normalisation. 0 = ignore doc length, 1 = full normalisation
 
+# BM25F field weights and per-field length normalisation.
+# A title match counts as FIELD_WEIGHTS["title"] body matches before saturation.
+FIELD_WEIGHTS = {"body": 1.0, "title": 3.0}
+FIELD_B = {"body": BM25_B, "title": 0.5}  # titles are short and similar in length
+
+# Typo tolerance for unknown query terms
+FUZZY_WEIGHT = 0.5  # score multiplier applied once per edit (distance 2 → 0.25)
+FUZZY_MAX_EXPANSIONS = 3  # at most this many near neighbours per unknown term
+
+# Wildcard terms (neur*, *ology, ne*al)
+WILDCARD_MAX_EXPANSIONS = 50  # keep only the most frequent matching terms
+WILDCARD_SCAN_LIMIT = 20000  # stop scanning the dictionary after this many matches
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(message)s",
@@ -540,27 +583,487 @@ logger = logging.getLogger(__name__)
 
 
 # DATA LOADING  (cached at module level)
-_index_cache = None
-_pages_cache = None  # list of crawled page dicts, keyed later by id
-_pages_by_id = None  # { "0": {title, url, text, ...}, ... }
+#
+# index.json keys everything by strings (doc ids "0", "17", … and terms).  At
+# load time both are replaced by dense integer ids, which is what every
+# scorer and set operation works on:
+#
+#   doc id   0 … N-1 in the order of the external ids  → _doc_ids[doc] is "17"
+#   term id  rank of the term in the sorted dictionary  → _sorted_terms[term_id]
+#
+# Per-doc data (lengths, pages, token offsets, PageRank) are indexed by doc
+# id, each term's postings are arrays sorted by doc id (see Postings), and the
+# term dictionary is the sorted term list itself (bisect lookups, prefix range
+# scans).  External doc ids only reappear when results are built (_run_query).
+# Token positions stay on disk: index.positions is mapped, not read (see
+# _map_positions), so they cost no memory until a query touches them.
+_index_cache = None  # metadata, fuzzy (term ids in deletes), tiers and dense sections of index.json
+_doc_ids = None  # doc id → external doc id string
+_doc_pages = None  # doc id → crawled page dict {title, url, text, ...}
+_token_offsets = None  # doc id → array of body token char offsets (None if not indexed)
+_doc_rank = None  # doc id → log of its PageRank, 0 for an average page (None if not indexed)
+_doc_rank_max = 0.0  # largest of _doc_rank
+_doc_rank_min = 0.0  # smallest of _doc_rank
+_duplicate_of = {}  # doc id → external id of its canonical doc, for near-duplicates only
+_sorted_terms = None  # term id → term, sorted: the term dictionary
+_entries = None  # term id → Postings
+_field_stats = None  # field → (Postings tf column, array of field lengths, avg length)
+_kgram_index = None  # bigram → set of term ids, built on the first infix wildcard
+
+# Loading happens once, on the first call or on a background thread (see
+# start_background_load); _ready is set when every global above is in place.
+_ready = threading.Event()
+_load_lock = threading.Lock()
+_load_status = {"state": "idle", "phase": None, "bytes_read": 0, "bytes_total": 0}
 
 
 def _ensure_loaded():
-    """Lazy-loads index + crawled pages exactly once."""
-    global _index_cache, _pages_cache, _pages_by_id
-    if _index_cache is not None:
+    """Lazy-loads index + crawled pages exactly once (thread-safe)."""
+    if _ready.is_set():
         return
-    _index_cache = load_index(INDEX_FILE)
-    with open(CRAWLED_DATA_FILE, "r", encoding="utf-8") as f:
-        _pages_cache = json.load(f)
-    _pages_by_id = {str(p["id"]): p for p in _pages_cache}
+    with _load_lock:
+        if _ready.is_set():
+            return  # another thread finished loading while we waited
+        try:
+            _load()
+        except Exception as e:
+            elapsed = time.perf_counter() - _load_status.get("started", time.perf_counter())
+            _load_status.update(state="failed", error=f"{type(e).__name__}: {e}", elapsed=elapsed)
+            raise
+
+
+def _load():
+    global _index_cache, _kgram_index, _doc_columns, _head_results, _dense
+    global _term_columns_bytes
+    start = time.perf_counter()
+    files = (INDEX_FILE, CRAWLED_DATA_FILE)
+    sizes = [os.path.getsize(path) for path in files]
+    _load_status.update(
+        state="loading",
+        phase="read_index",
+        bytes_read=0,
+        bytes_total=sum(sizes),
+        started=start,
+        error=None,
+    )
+
+    def progress(offset, size, name):
+        def update(read):
+            # read is in chars when streaming: close to bytes, never past the file
+            _load_status["bytes_read"] = offset + min(read, size)
+            if read == size:
+                _load_status["phase"] = f"parse_{name}"  # the slow part of a JSON load
+
+        return update
+
+    try:
+        index = _stream_index(INDEX_FILE, progress(0, sizes[0], "index"))
+    except _SectionOrder as e:
+        logger.warning("Can't stream %s (%s), loading it whole", INDEX_FILE, e)
+        index = _convert_index(load_index(INDEX_FILE, progress(0, sizes[0], "index")), INDEX_FILE)
+    if index["metadata"].get("positions") == "none":
+        logger.info("Index has no positions: phrase queries match their tokens anywhere")
+    _load_status.update(phase="read_pages", bytes_read=sizes[0])
+    pages = load_index(CRAWLED_DATA_FILE, progress(sizes[0], sizes[1], "pages"))
+    _load_status["phase"] = "lookups"
+    if "fuzzy" not in index:
+        # Index written before typo tolerance existed — build it in memory
+        logger.warning("Index has no fuzzy section, building it at load time")
+        index["fuzzy"] = fuzzy = build_fuzzy_index(index["index"][0])
+        _fuzzy_term_ids(fuzzy["deletes"], index["index"][0])
+    _densify(index, pages)
+    _index_cache = index  # only metadata + fuzzy are left in it
+    _dense = _map_vectors(INDEX_FILE, index.get("dense"))
+    _kgram_index = None
+    _plan_cache.clear()
+    with _result_cache_lock:
+        _result_cache.clear()
+    with _page_cache_lock:
+        _page_cache.clear()
+    _head_results = _load_head_results()
+    with _term_columns_lock:
+        _term_columns.clear()
+        _term_columns_bytes = 0
+    _doc_columns = None
+
+    # Everything loaded so far lives as long as the process: move it out of
+    # the GC's reach, so full collections don't walk millions of index dicts
+    # (a multi-second pause per gen-2 pass on big indexes).
+    gc.collect()
+    gc.freeze()
+
+    _ready.set()
+    elapsed = time.perf_counter() - start
+    _load_status.update(state="ready", phase=None, elapsed=elapsed)
+    metrics.set_gauge("index_load_seconds", elapsed)
     logger.info(
-        "Loaded index (%d docs, %d terms) + crawled pages",
+        "Loaded index (%d docs, %d terms) + crawled pages in %.2fs",
         _index_cache["metadata"]["num_docs"],
-        len(_index_cache["index"]),
+        len(_sorted_terms),
+        elapsed,
     )
 
 
+class _SectionOrder(Exception):
+    """index.json sections aren't in the order _stream_index() needs."""
+
+
+def _stream_index(path: str, progress=None) -> dict:
+    """
+    Reads index.json one entry at a time (indexer.JsonStream), converting
+    each term to a Postings as soon as it is decoded: the string-keyed
+    postings of the whole index never exist at once, so the load peaks at
+    the compact index plus one term instead of the whole parsed JSON (and
+    leaves no heap fragmented behind it).  Returns the sections in the form
+    _densify() takes (see _convert_index).
+
+    Needs doc_lengths before index and index before fuzzy, the order
+    save_index() writes them in; raises _SectionOrder otherwise.
+    """
+    index = {}
+    to_doc = to_term = positions = None
+    with JsonStream(path, progress=progress) as stream:
+        for section in stream.items():
+            if section == "index":
+                if to_doc is None:
+                    raise _SectionOrder("index before doc_lengths")
+                terms, entries = [], []
+                for term in stream.items():
+                    terms.append(term)
+                    entries.append(Postings.from_json(stream.value(), to_doc, positions))
+                index[section] = _sort_terms(terms, entries)
+                to_term = {term: term_id for term_id, term in enumerate(index[section][0])}
+            elif section == "token_offsets":
+                index[section] = {d: array("I", o) for d, o in stream.entries()}
+            elif section == "tiers":
+                if to_term is None:
+                    raise _SectionOrder("tiers before index")
+                entries = index["index"][1]
+                index[section] = tiers = {}
+                for key in stream.items():
+                    if key == "terms":
+                        for term, docs in stream.entries():
+                            entries[to_term[term]].set_tier(map(to_doc, docs))
+                    else:
+                        tiers[key] = stream.value()
+            elif section == "fuzzy":
+                if to_term is None:
+                    raise _SectionOrder("fuzzy before index")
+                index[section] = fuzzy = {}
+                for key in stream.items():
+                    if key == "deletes":
+                        fuzzy[key] = {
+                            d: array("I", map(to_term.__getitem__, candidates))
+                            for d, candidates in stream.entries()
+                        }
+                    else:
+                        fuzzy[key] = stream.value()
+            else:
+                index[section] = stream.value()
+                if section == "metadata":
+                    positions = _map_positions(path, index[section])
+                elif section == "doc_lengths":
+                    index["doc_ids"] = sorted(index[section], key=int)
+                    to_doc = {d: doc for doc, d in enumerate(index["doc_ids"])}.__getitem__
+    return index
+
+
+def _convert_index(index: dict, path: str) -> dict:
+    """
+    Same result as _stream_index() from a fully parsed index.json:
+    "doc_ids" added, "index" → (sorted terms, their Postings), token offsets
+    → arrays and fuzzy deletes → term ids.  Popping as it goes, so the
+    string-keyed and compact copies are never both held in full.
+    """
+    index["doc_ids"] = doc_ids = sorted(index["doc_lengths"], key=int)
+    # map(dict.__getitem__) rather than comprehensions: millions of lookups
+    to_doc = {d: doc for doc, d in enumerate(doc_ids)}.__getitem__
+    terms = index.pop("index")
+    sorted_terms = sorted(terms)  # already sorted on disk → O(n)
+    positions = _map_positions(path, index["metadata"])
+    index["index"] = (
+        sorted_terms,
+        [Postings.from_json(terms.pop(term), to_doc, positions) for term in sorted_terms],
+    )
+    offsets = index.get("token_offsets")
+    for d, doc_offsets in (offsets or {}).items():
+        offsets[d] = array("I", doc_offsets)
+    if "fuzzy" in index:
+        _fuzzy_term_ids(index["fuzzy"]["deletes"], sorted_terms)
+    if "tiers" in index:
+        entries = index["index"][1]
+        for term, docs in index["tiers"].pop("terms").items():
+            entries[bisect_left(sorted_terms, term)].set_tier(map(to_doc, docs))
+    return index
+
+
+def _map_positions(path: str, metadata: dict) -> memoryview | None:
+    """
+    The index's positions file (indexer.save_index) as a read-only uint32
+    view of a memory map, None if positions aren't in a file.  Pages are
+    read when a phrase query or a snippet first touches them and are the
+    OS's to drop again: unlike the postings, positions aren't resident.
+    """
+    if metadata.get("positions") != "file":
+        return None
+    with open(positions_path(path), "rb") as f:
+        if sys.byteorder == "little" and os.fstat(f.fileno()).st_size:
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)).cast("I")
+        # Big-endian host (the file is little-endian) or nothing to map
+        positions = array("I")
+        positions.frombytes(f.read())
+    if sys.byteorder == "big":
+        positions.byteswap()
+    return memoryview(positions)
+
+
+def _sort_terms(terms: list[str], entries: list) -> tuple[list[str], list]:
+    """(terms, entries) in term order (index.json is written sorted: O(n) check)."""
+    if all(map(le, terms, terms[1:])):
+        return terms, entries
+    order = sorted(range(len(terms)), key=terms.__getitem__)
+    return list(map(terms.__getitem__, order)), list(map(entries.__getitem__, order))
+
+
+def _fuzzy_term_ids(deletes: dict, sorted_terms: list[str]):
+    """Fuzzy deletes → arrays of term ids, in place."""
+    to_term = {term: term_id for term_id, term in enumerate(sorted_terms)}.__getitem__
+    for key, candidates in deletes.items():
+        deletes[key] = array("I", map(to_term, candidates))
+
+
+def _densify(index: dict, pages: list[dict]):
+    """
+    Moves the converted sections of index.json (see _convert_index) to the
+    dense id globals (see DATA LOADING), leaving metadata + fuzzy in index.
+    """
+    global _doc_ids, _doc_pages, _token_offsets, _sorted_terms, _entries, _field_stats
+    global _doc_rank, _doc_rank_max, _doc_rank_min, _duplicate_of
+
+    doc_ids = index.pop("doc_ids")
+    doc_lengths = index.pop("doc_lengths")
+    metadata = index["metadata"]
+    field_stats = {
+        "body": (
+            "tf",
+            array("I", map(doc_lengths.__getitem__, doc_ids)),
+            metadata["avg_doc_length"],
+        ),
+    }
+    title_lengths = index.pop("title_lengths", None)
+    if title_lengths is not None:
+        field_stats["title"] = (
+            "title_tf",
+            array("I", (title_lengths.get(d, 0) for d in doc_ids)),
+            metadata["avg_title_length"],
+        )
+    else:
+        logger.warning("Index has no title field — rebuild it to enable BM25F")
+
+    ranks = index.pop("doc_rank", None)
+    doc_rank = None
+    if ranks is not None:
+        doc_rank = array("d", (math.log(ranks.get(d, 1.0)) for d in doc_ids))
+
+    duplicates = index.pop("duplicates", None) or {}
+    offsets = index.pop("token_offsets", None)
+    pages_by_id = {str(p["id"]): p for p in pages}
+
+    _doc_ids = doc_ids
+    _doc_pages = [pages_by_id.get(d, {}) for d in doc_ids]
+    _token_offsets = None if offsets is None else [offsets.get(d) for d in doc_ids]
+    _doc_rank = doc_rank
+    _doc_rank_max = max(doc_rank, default=0.0) if doc_rank is not None else 0.0
+    _doc_rank_min = min(doc_rank, default=0.0) if doc_rank is not None else 0.0
+    _duplicate_of = {doc: duplicates[d] for doc, d in enumerate(doc_ids) if d in duplicates}
+    _sorted_terms, _entries = index.pop("index")
+    _field_stats = field_stats
+
+
+def _term_id(term: str) -> int | None:
+    """Term → term id (binary search of the sorted dictionary), None if unknown."""
+    i = bisect_left(_sorted_terms, term)
+    if i < len(_sorted_terms) and _sorted_terms[i] == term:
+        return i
+    return None
+
+
+# Compact postings
+# One term's postings are parallel array('I') columns sorted by doc id,
+# instead of a dict holding a dict and a positions list per doc:
+#
+#   docs       [3, 17, 42]              doc ids
+#   tf         [2, 1, 5]                body term frequency
+#   title_tf   [0, 1, 0]                title term frequency (None: never in a title)
+#   offsets    [0, 2, 3, 8]             posting i's positions are
+#   positions  [4, 90, 7, 1, 5, …]      positions[offsets[i] : offsets[i + 1]]
+#
+# 4 bytes per number instead of a boxed int each, plus a dict, a list and a
+# dict slot per posting.  A doc's posting is found by binary search (find).
+# positions is a slice of the mapped positions file, and offsets (the running
+# sum of tf: a posting has tf positions) is only built the first time a
+# phrase query or a snippet asks for them.
+
+# select() probes docs one binary search at a time only when the postings are
+# this many times longer; otherwise it scans them at C speed
+_PROBE_RATIO = 16
+
+
+class Postings:
+    __slots__ = (
+        "doc_freq", "docs", "tf", "title_tf", "_positions", "_start", "_offsets", "tier", "_bound"
+    )
+
+    def __init__(self, doc_freq, docs, tf, title_tf=None, positions=None, start=0):
+        self.doc_freq = doc_freq  # may differ from len(docs): global df on a shard
+        self.docs = docs
+        self.tf = tf
+        self.title_tf = title_tf
+        # None for merged wildcard postings and positions-less indexes
+        self._positions = positions  # every term's positions (memoryview)
+        self._start = start  # this term's first position in it
+        self._offsets = None
+        self.tier = None  # tier 1 posting indices, None if all postings are in it
+        self._bound = None
+
+    @classmethod
+    def from_json(cls, entry: dict, to_doc, positions=None) -> "Postings":
+        """
+        index.json entry {"doc_freq", "positions_at", "postings": {"17":
+        posting, ...}} → Postings.  positions: the mapped positions file
+        (_map_positions), None if the index has none.
+        """
+        postings = entry["postings"]
+        docs = array("I", map(to_doc, postings))
+        values = list(postings.values())
+        tf = array("I", map(itemgetter("term_freq"), values))
+        start = entry.get("positions_at", 0)
+        if positions is None and values and "positions" in values[0]:
+            # Older index: a positions list in every posting
+            positions = memoryview(
+                array("I", chain.from_iterable(map(itemgetter("positions"), values)))
+            )
+            start = 0
+        if not all(map(le, docs, docs[1:])):  # written in doc order, but be safe
+            order = sorted(range(len(docs)), key=docs.__getitem__)
+            if positions is not None:
+                bounds = list(accumulate(tf, initial=start))
+                moved = (positions[bounds[i] : bounds[i + 1]] for i in order)
+                positions = memoryview(array("I", chain.from_iterable(moved)))
+                start = 0
+            docs = array("I", map(docs.__getitem__, order))
+            tf = array("I", map(tf.__getitem__, order))
+            values = list(map(values.__getitem__, order))
+
+        title_tf = array("I", (p.get("title_freq", 0) for p in values))
+        return cls(
+            entry["doc_freq"], docs, tf, title_tf if any(title_tf) else None, positions, start
+        )
+
+    @property
+    def offsets(self) -> array | None:
+        """Posting i's positions are positions[offsets[i] : offsets[i + 1]]."""
+        if self._offsets is None and self._positions is not None:
+            self._offsets = array("I", accumulate(self.tf, initial=0))
+        return self._offsets
+
+    @property
+    def positions(self) -> memoryview | None:
+        """All of this term's positions, posting after posting (no copy)."""
+        if self._positions is None:
+            return None
+        return self._positions[self._start : self._start + self.offsets[-1]]
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def find(self, doc: int) -> int:
+        """Index of doc's posting, -1 if the term isn't in doc."""
+        docs = self.docs
+        i = bisect_left(docs, doc)
+        return i if i < len(docs) and docs[i] == doc else -1
+
+    def select(self, docs: set[int]) -> list[int]:
+        """Indices of the postings of docs (those that have one)."""
+        if len(docs) * _PROBE_RATIO < len(self.docs):
+            return [i for i in map(self.find, docs) if i >= 0]
+        return list(compress(range(len(self.docs)), map(docs.__contains__, self.docs)))
+
+    def set_tier(self, docs):
+        """Tier 1 of this term: the postings of docs (see TIERED SEARCH)."""
+        self.tier = array("I", sorted(map(self.find, docs)))
+        self._bound = None
+
+    def tier_bound(self) -> float:
+        """
+        Highest BM25F saturating TF (every field) of the postings left out of
+        tier 1: no doc outside tier 1 gets more from this term.
+        """
+        if self._bound is None:
+            columns = _tf_columns(self, tuple(_field_stats))
+            docs, tier = self.docs, set(self.tier)
+            self._bound = max(
+                (_bm25f_tf(columns, i, docs[i]) for i in range(len(docs)) if i not in tier),
+                default=0.0,
+            )
+        return self._bound
+
+    def positions_of(self, i: int) -> memoryview:
+        offsets = self.offsets
+        return self.positions[offsets[i] : offsets[i + 1]]
+
+    def has_position(self, i: int, position: int) -> bool:
+        """Whether posting i has a token at position (binary search, no slicing)."""
+        offsets, positions = self.offsets, self.positions
+        lo, hi = offsets[i], offsets[i + 1]
+        j = bisect_left(positions, position, lo, hi)
+        return j < hi and positions[j] == position
+
+
+def start_background_load() -> threading.Thread:
+    """
+    Loads the index on a daemon thread, so the app can serve /health at once,
+    then warms it up with the head of the query log (see WARMUP).
+    """
+
+    def run():
+        try:
+            _ensure_loaded()
+        except Exception:
+            logger.exception("Index load failed")
+            return
+        try:
+            warmup(querylog.top_queries(WARMUP_QUERIES))
+        except Exception:
+            logger.exception("Warmup failed")
+        finally:
+            _warming.clear()
+
+    if WARMUP_QUERIES:
+        _warming.set()
+    thread = threading.Thread(target=run, name="index-loader", daemon=True)
+    thread.start()
+    return thread
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def load_status() -> dict:
+    """Progress of the index load, for readiness checks."""
+    status = dict(_load_status)
+    started = status.pop("started", None)
+    if status["state"] == "loading":
+        status["elapsed"] = time.perf_counter() - started
+    elif status["state"] == "ready" and _warming.is_set():
+        status.update(state="warming", phase="warmup")
+    total = status["bytes_total"]
+    status["percent"] = round(100 * status["bytes_read"] / total, 1) if total else 0.0
+    status["elapsed_s"] = round(status.pop("elapsed", 0.0), 3)
+    return status
+
+
 # QUERY PARSER
 # 
 # Supports three syntaxes the user can type:
@@ -568,22 +1071,79 @@ def _ensure_loaded():
 #   Plain multi-word   →  neural networks          (implicit AND)
 #   Phrase (quotes)    →  "neural networks"        (exact adjacent-token match)
 #   Boolean operators  →  python AND (learning OR neural) NOT robotics
+#   Wildcards          →  neur*  *ology  ne*al     (in plain or boolean queries)
+#   Field restriction  →  title:python  body:neur* (in plain or boolean queries)
 #
 # Parsing strategy:
 #   1. If the query contains quotes  → phrase mode
 #   2. If the query contains AND/OR/NOT → boolean mode
 #   3. Otherwise                      → simple multi-term AND mode
 
+# Boolean AST nodes
+class Term(NamedTuple):
+    term: str
+
+
+class Not(NamedTuple):
+    operand: "Term | Not | BinOp"
+
+
+class BinOp(NamedTuple):
+    op: str  # "AND" | "OR"
+    left: "Term | Not | BinOp"
+    right: "Term | Not | BinOp"
+
+
+def ast_to_dict(node) -> dict | None:
+    """AST → nested dicts, e.g. {"op": "NOT", "operand": {"term": "robot"}} (JSON form)."""
+    if node is None:
+        return None
+    if isinstance(node, Term):
+        return {"term": node.term}
+    if isinstance(node, Not):
+        return {"op": "NOT", "operand": ast_to_dict(node.operand)}
+    return {"op": node.op, "left": ast_to_dict(node.left), "right": ast_to_dict(node.right)}
+
+
+def ast_from_dict(data: dict | None):
+    if data is None:
+        return None
+    if "term" in data:
+        return Term(data["term"])
+    if data["op"] == "NOT":
+        return Not(ast_from_dict(data["operand"]))
+    return BinOp(data["op"], ast_from_dict(data["left"]), ast_from_dict(data["right"]))
+
+
 # Shape of a query object
 class Query:
-    def __init__(self, mode, terms=None, phrase_tokens=None, boolean_ast=None, raw=""):
+    __slots__ = ("mode", "terms", "phrase_tokens", "boolean_ast", "raw", "plan")
+
+    def __init__(
+        self, mode, terms=None, phrase_tokens=None, boolean_ast=None, raw="", plan=None
+    ):
         self.mode = mode  # "simple" | "phrase" | "boolean"
         self.terms = terms or []  # list of stemmed tokens (simple mode)
         self.phrase_tokens = (
             phrase_tokens  # list of stemmed tokens that must be adjacent (phrase mode)
         )
-        self.boolean_ast = boolean_ast  # nested dict AST (boolean mode)
+        self.boolean_ast = boolean_ast  # Term / Not / BinOp tree (boolean mode)
         self.raw = raw  # original query string
+        self.plan = plan  # planned AST (boolean mode, set by compile_query)
+
+    def to_dict(self) -> dict:
+        """JSON form sent to shard nodes (the plan is made on the shard)."""
+        return {
+            "mode": self.mode,
+            "terms": self.terms,
+            "phrase_tokens": self.phrase_tokens,
+            "boolean_ast": ast_to_dict(self.boolean_ast),
+            "raw": self.raw,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Query":
+        return cls(**dict(data, boolean_ast=ast_from_dict(data.get("boolean_ast"))))
 
 
 def parse_query(raw: str) -> Query:
@@ -606,11 +1166,49 @@ def parse_query(raw: str) -> Query:
         return Query(mode="boolean", boolean_ast=ast, raw=raw)
 
     # Simple multi-term (implicit AND)
-    tokens = tokenize(raw)
+    tokens = [term for word in raw.split() for term in _word_terms(word)]
     logger.info("Parsed as SIMPLE query: %s", tokens)
     return Query(mode="simple", terms=tokens, raw=raw)
 
 
+def _word_terms(word: str) -> list[str]:
+    """
+    Turns one whitespace-separated query word into query terms:
+        "Networks"      → ["network"]
+        "neur*"         → ["neur*"]          (wildcard, kept verbatim)
+        "title:Python"  → ["title:python"]   (field-restricted term)
+    """
+    prefix = ""
+    field_match = re.match(r"^(title|body):(.+)$", word)
+    if field_match:
+        prefix, word = field_match.group(1) + ":", field_match.group(2)
+
+    if "*" in word:
+        pattern = _normalize_wildcard(word)
+        return [prefix + pattern] if pattern else []
+    return [prefix + token for token in tokenize(word)]
+
+
+def _split_field(term: str) -> tuple[tuple[str, ...], str]:
+    """"title:python" → (("title",), "python");  "python" → (all fields, "python")"""
+    if ":" in term:
+        field, term = term.split(":", 1)
+        return (field,), term
+    return tuple(FIELD_WEIGHTS), term
+
+
+def _normalize_wildcard(word: str) -> str | None:
+    """
+    Lowercases a wildcard word and drops punctuation, e.g. "Neur**," → "neur*".
+    Wildcard patterns are matched against the stemmed dictionary as-is (they
+    are not stemmed themselves).  Returns None if no literal characters remain.
+    """
+    pattern = re.sub(r"\*+", "*", re.sub(r"[^a-z0-9*]", "", word.lower()))
+    if not pattern.replace("*", ""):
+        return None
+    return pattern
+
+
 def _parse_boolean(raw: str) -> dict:
     """
     Minimal recursive-descent parser for boolean expressions.
@@ -618,8 +1216,8 @@ def _parse_boolean(raw: str) -> dict:
         expr   → factor (( AND | OR ) factor)*
         factor → NOT factor | ATOM
         ATOM   → word  |  "(" expr ")"
-    Returns a nested dict AST, e.g.:
-        {"op": "AND", "left": {"term": "python"}, "right": {"op": "NOT", "operand": {"term": "robot"}}}
+    Returns an AST of Term / Not / BinOp nodes, e.g.:
+        BinOp("AND", Term("python"), Not(Term("robot")))
     """
     tokens = raw.split()
     pos = [0]  # mutable pointer so nested calls can advance it
@@ -637,14 +1235,14 @@ def _parse_boolean(raw: str) -> dict:
         while peek() in ("AND", "OR"):
             op = consume()
             right = parse_factor()
-            left = {"op": op, "left": left, "right": right}
+            left = BinOp(op, left, right)
         return left
 
     def parse_factor():
         if peek() == "NOT":
             consume()
             operand = parse_factor()
-            return {"op": "NOT", "operand": operand}
+            return Not(operand)
         return parse_atom()
 
     def parse_atom():
@@ -654,10 +1252,10 @@ def _parse_boolean(raw: str) -> dict:
             if peek() == ")":
                 consume()  # eat ')'
             return node
-        # bare word → tokenize+stem it
+        # bare word → tokenize+stem it (wildcards are kept verbatim)
         word = consume()
-        stemmed = tokenize(word)
-        return {"term": stemmed[0] if stemmed else word.lower()}
+        terms = _word_terms(word)
+        return Term(terms[0] if terms else word.lower())
 
     return parse_expr()
 
@@ -676,6 +1274,13 @@ def _parse_boolean(raw: str) -> dict:
 # tf(t,d)  = raw count of term t in doc d
 # |d|      = length of doc d (in tokens)
 # avgdl    = average doc length across corpus
+#
+# Simple and boolean queries use BM25F: per-field term frequencies are length
+# normalised and weighted BEFORE the saturation step, so a title hit boosts a
+# doc without letting title + body matches add up to two saturated terms:
+#
+#   tf~(t,d) =  Σ_f  w_f * tf_f(t,d) / (1 - b_f + b_f * |d_f| / avgdl_f)
+#   TF_norm  =  tf~ * (k1 + 1) / (tf~ + k1)
 
 
 def _bm25_idf(doc_freq: int, num_docs: int) -> float:
@@ -690,31 +1295,907 @@ def _bm25_tf(term_freq: int, doc_length: int, avg_doc_length: float) -> float:
     )
 
 
-def score_simple(terms: list[str]) -> list[tuple[str, float]]:
+def _tf_columns(postings: Postings, fields: tuple[str, ...]) -> list[tuple]:
+    """
+    What _bm25f_tf needs of postings for the given fields, looked up once per
+    query term: (tf column, field lengths, avg length, b, weight) for each
+    field the term occurs in.
+    """
+    columns = []
+    for field in fields:
+        if field not in _field_stats:
+            continue
+        column, lengths, avg_length = _field_stats[field]
+        tfs = getattr(postings, column)
+        if tfs is not None:
+            columns.append((tfs, lengths, avg_length, FIELD_B[field], FIELD_WEIGHTS[field]))
+    return columns
+
+
+def _bm25f_tf(columns: list[tuple], i: int, doc: int) -> float:
+    """BM25F saturating TF of posting i (of doc) over _tf_columns() (0.0 if none match)."""
+    pseudo_tf = 0.0
+    for tfs, lengths, avg_length, b, weight in columns:
+        tf = tfs[i]
+        if tf:
+            norm = 1 - b + b * lengths[doc] / avg_length
+            pseudo_tf += weight * tf / norm
+    return pseudo_tf * (BM25_K1 + 1) / (pseudo_tf + BM25_K1)
+
+
+def score_simple(terms: list[str], candidates: set[int] | None = None) -> list[tuple[int, float]]:
     """
     Scores ALL docs in the index against a list of query terms using BM25.
-    Only docs that contain at least one query term are scored.
-    Returns list of (doc_id, score) sorted descending.
+    Only docs that contain at least one query term are scored, and only the
+    candidates if given (e.g. the docs matching a boolean query).
+    Wildcard and unknown terms are resolved first (see _resolve_term);
+    field-restricted terms (title:python) only score matches in that field.
+    Returns list of (doc id, score), unsorted (_run_query keeps the top_k).
     """
     _ensure_loaded()
-    index = _index_cache["index"]
     num_docs = _index_cache["metadata"]["num_docs"]
-    avg_dl = _index_cache["metadata"]["avg_doc_length"]
-    doc_lengths = _index_cache["doc_lengths"]
 
-    scores = defaultdict(float)  # doc_id → cumulative BM25 score
+    scores = defaultdict(float)  # doc id → cumulative BM25F score
 
-    for term in terms:
-        if term not in index:
-            continue  # unknown term — skip gracefully
-        entry = index[term]
-        idf = _bm25_idf(entry["doc_freq"], num_docs)
+    for query_term in terms:
+        fields, term = _split_field(query_term)
+        for postings, weight in _resolve_term(term):
+            idf = _bm25_idf(postings.doc_freq, num_docs) * weight
+            columns = _tf_columns(postings, fields)
+            docs = postings.docs
+            hits = range(len(docs)) if candidates is None else postings.select(candidates)
+
+            for i in hits:
+                doc = docs[i]
+                tf_norm = _bm25f_tf(columns, i, doc)
+                if tf_norm:
+                    scores[doc] += idf * tf_norm
 
-        for doc_id, posting in entry["postings"].items():
-            tf_norm = _bm25_tf(posting["term_freq"], int(doc_lengths[doc_id]), avg_dl)
-            scores[doc_id] += idf * tf_norm
+    return list(scores.items())
 
-    return sorted(scores.items(), key=lambda x: x[1], reverse=True)
+
+def score_conjunctive(terms: list[str]) -> list[tuple[int, float]]:
+    """
+    Like score_simple, but only docs matching EVERY query term are returned.
+    Terms are intersected rarest-first: candidates come from the shortest
+    postings list and each one is probed against the others in order of
+    increasing df, dropping it at the first term it lacks.
+    Returns list of (doc id, score), unsorted.
+    """
+    _ensure_loaded()
+    num_docs = _index_cache["metadata"]["num_docs"]
+
+    # clause = one query term → (df, [(doc ids, idf * weight, tf columns), ...])
+    clauses = []
+    for query_term in dict.fromkeys(terms):
+        fields, term = _split_field(query_term)
+        entries = _resolve_term(term)
+        if not entries:
+            return []  # a term that matches nothing empties the intersection
+        clauses.append(
+            (
+                sum(postings.doc_freq for postings, _ in entries),
+                [
+                    (
+                        postings.docs,
+                        _bm25_idf(postings.doc_freq, num_docs) * weight,
+                        _tf_columns(postings, fields),
+                    )
+                    for postings, weight in entries
+                ],
+            )
+        )
+    clauses.sort(key=lambda clause: clause[0])
+
+    rarest = clauses[0][1]
+    if len(rarest) == 1:
+        candidates = rarest[0][0]
+    else:
+        candidates = set().union(*(docs for docs, _, _ in rarest))
+
+    scores = []
+    for doc in candidates:
+        total = 0.0
+        for _, postings_list in clauses:
+            clause_score = 0.0
+            for docs, idf, columns in postings_list:
+                i = bisect_left(docs, doc)  # Postings.find, inlined: the hot loop
+                if i < len(docs) and docs[i] == doc:
+                    clause_score += idf * _bm25f_tf(columns, i, doc)
+            if not clause_score:
+                break  # missing (or field-restricted miss) → not a match
+            total += clause_score
+        else:
+            scores.append((doc, total))
+
+    return scores
+
+
+# ─────────────────────────────────────────────
+# TIERED SEARCH
+# ─────────────────────────────────────────────
+# Tier 1 (indexer.build_tiers) keeps, for every frequent term, its highest-
+# impact postings.  Simple queries are scored on it first:
+#
+#   candidates  every doc in some query term's tier 1 (all docs of a term
+#               that wasn't pruned), scored exactly against the full postings
+#   bound       Σ idf · tier_bound() over the query terms: no doc outside
+#               the candidates can score more than that
+#
+# If the k-th best candidate beats the bound, the candidates' top_k IS the
+# top_k ("exact"); otherwise the query falls through to the full index.
+# Reranked queries (see RERANKING) take all their candidates from tier 1, so
+# there the k-th best has to beat the bound plus the largest boost the
+# rerankers can give: a doc left out couldn't be lifted into the top_k, and
+# the reranked top_k is the full index's.  "approximate" answers from tier 1
+# whenever it yields top_k docs, so some results can be missed (benchmark.py
+# reports the recall).  The number of matches is counted exactly either way,
+# with set operations on the doc ids.
+TIER_MODE = os.environ.get("TIER_MODE", "exact")  # "exact" | "approximate" | "off"
+
+
+def _matching_docs(postings: Postings, columns: list[tuple]) -> set[int]:
+    """Docs of postings that score above 0 on columns: all of them unless field-restricted."""
+    if len(columns) == 1 + (postings.title_tf is not None):
+        return set(postings.docs)
+    if not columns:
+        return set()
+    return set(compress(postings.docs, columns[0][0]))
+
+
+def _match_count(clauses: list[list[tuple]], conjunctive: bool) -> int:
+    """Docs matching every clause (conjunctive) or any, with clauses as in _tier_top."""
+    matching = [set().union(*(_matching_docs(p, columns) for p, _, columns in c)) for c in clauses]
+    if conjunctive:
+        return len(matching[0].intersection(*matching[1:]))
+    return len(set().union(*matching))
+
+
+def _tier_top(
+    clauses: list[list[tuple]],
+    top_k: int,
+    conjunctive: bool,
+    total: int,
+    depth: int,
+    boost: float = 0.0,
+):
+    """
+    Top `depth` (≥ top_k) over the tier 1 candidates of clauses (one list of
+    (postings, idf, columns) per query term, total matches among all docs),
+    None if tier 1 can't answer for the top_k once reranked with at most
+    `boost` added.  Scores and their order among equal scores are the full
+    scorers' own.
+    """
+    if top_k <= 0:
+        return []
+    candidates = set()
+    bound = 0.0
+    complete = False  # some AND clause is unpruned: every match is a candidate
+    for clause in clauses:
+        clause_bound = 0.0
+        for postings, idf, _ in clause:
+            if postings.tier is None:
+                candidates.update(postings.docs)
+            else:
+                candidates.update(map(postings.docs.__getitem__, postings.tier))
+                clause_bound += idf * postings.tier_bound()
+        complete |= conjunctive and not clause_bound
+        bound += clause_bound
+
+    scored = []
+    if conjunctive:
+        for doc in sorted(candidates):
+            total_score = 0.0
+            for clause in clauses:
+                clause_score = 0.0
+                for postings, idf, columns in clause:
+                    docs = postings.docs
+                    i = bisect_left(docs, doc)
+                    if i < len(docs) and docs[i] == doc:
+                        clause_score += idf * _bm25f_tf(columns, i, doc)
+                if not clause_score:
+                    break
+                total_score += clause_score
+            else:
+                scored.append((doc, total_score))
+    else:
+        # In score_simple's order: by the first postings a doc scores in, then doc
+        entries = [entry for clause in clauses for entry in clause]
+        for doc in sorted(candidates):
+            total_score, first = 0.0, None
+            for n, (postings, idf, columns) in enumerate(entries):
+                docs = postings.docs
+                i = bisect_left(docs, doc)
+                if i < len(docs) and docs[i] == doc:
+                    tf_norm = _bm25f_tf(columns, i, doc)
+                    if tf_norm:
+                        total_score += idf * tf_norm
+                        first = n if first is None else first
+            if first is not None:
+                scored.append((first, doc, total_score))
+        scored.sort(key=itemgetter(0))  # stable: doc order within each postings
+        scored = [(doc, score) for _, doc, score in scored]
+    # The rerank candidates below the top_k come from tier 1: no doc left out
+    # may reach the top_k even with the largest boost
+    top = heapq.nlargest(depth, scored, key=itemgetter(1))
+    exact = (
+        complete
+        or len(scored) == total
+        or (len(top) >= top_k and top[top_k - 1][1] > bound + boost)
+    )
+    if not exact and not (TIER_MODE == "approximate" and len(top) >= top_k):
+        return None
+    return top
+
+
+def score_tiered(
+    query: Query,
+    top_k: int,
+    match: str,
+    depth: int | None = None,
+    exact: int | None = None,
+    boost: float = 0.0,
+) -> tuple | None:
+    """
+    A simple query answered from tier 1 → (top `depth` (default top_k),
+    total), None when the full index has to be scored (no tiers, TIER_MODE
+    "off", or no guarantee).  Same AND → OR fallback as _run_query.  The
+    first `exact` (default top_k) are guaranteed to stay the full index's
+    once the rest of the depth, from tier 1 alone, is reranked with at most
+    `boost` added (see rerank_boost).
+    """
+    if TIER_MODE == "off" or "tiers" not in _index_cache or not query.terms:
+        return None
+    exact = max(top_k, exact or 0)
+    depth = max(exact, depth or 0)
+    num_docs = _index_cache["metadata"]["num_docs"]
+
+    def clauses(terms):
+        result = []
+        for query_term in terms:
+            fields, term = _split_field(query_term)
+            result.append(
+                [
+                    (postings, _bm25_idf(postings.doc_freq, num_docs) * weight,
+                     _tf_columns(postings, fields))
+                    for postings, weight in _resolve_term(term)
+                ]
+            )
+        return result
+
+    def pruned(clause):
+        return any(postings.tier is not None for postings, _, _ in clause)
+
+    def answer(top, total):
+        metrics.inc("search_tier_total", result="full" if top is None else "tier1")
+        return None if top is None else (top, total)
+
+    # Tier 1 only pays off when it leaves postings out: not for an OR of
+    # unpruned (rare) terms, nor for an AND with one, which the full index
+    # answers by walking that term's few postings
+    if match != "any" and len(query.terms) > 1:
+        # Rarest first and once per term, like score_conjunctive
+        conjunctive = clauses(dict.fromkeys(query.terms))
+        total = _match_count(conjunctive, conjunctive=True) if all(conjunctive) else 0
+        if match != "all" or total >= top_k:
+            if not total:
+                return answer([], 0)
+            if not all(map(pruned, conjunctive)):
+                return answer(None, total)
+            conjunctive.sort(key=lambda clause: sum(p.doc_freq for p, _, _ in clause))
+            return answer(_tier_top(conjunctive, exact, True, total, depth, boost), total)
+        logger.info("Only %d docs match all terms, falling back to OR", total)
+
+    disjunctive = clauses(query.terms)
+    if not any(map(pruned, disjunctive)):
+        return answer(None, None)
+    total = _match_count(disjunctive, conjunctive=False)
+    return answer(_tier_top(disjunctive, exact, False, total, depth, boost), total)
+
+
+# ─────────────────────────────────────────────
+# RERANKING
+# ─────────────────────────────────────────────
+# search() runs in two stages:
+#
+#   1. retrieval   the scorers above keep their best RERANK_CANDIDATES docs
+#                  (instead of the top_k) by BM25
+#   2. reranking   each reranker of RERANKERS rescores that batch in turn,
+#                  the last one keeping the top_k
+#
+# Rerankers work on features of a candidate doc, computed locally from the
+# loaded index (no network, no model server):
+#
+#   proximity   Σ idf(terms in the shortest window of body tokens holding the
+#               query terms) · terms / window length: adjacent terms get the
+#               whole Σ idf and it fades as they spread (simple queries of two
+#               or more terms, on an index with positions)
+#   title       Σ idf(query terms in the title) · their share of the title's
+#               tokens: a title made of the query scores highest
+#   pagerank    log of the doc's PageRank over the crawled links (0 for an
+#               average page, see indexer.compute_pagerank)
+#
+# Proximity looks at the first PROXIMITY_MAX_POSITIONS positions of a term in
+# a doc; terms restricted to titles and wildcards have no positions and take
+# no part.
+#
+# The "proximity", "title" and "pagerank" rerankers add weight · feature to
+# the incoming score (PROXIMITY_WEIGHT, TITLE_MATCH_WEIGHT, PAGERANK_WEIGHT).
+# They take candidates best first and stop as soon as even the largest
+# possible boost couldn't lift the next one into the top they keep.  "linear"
+# replaces the score with a linear model over the BM25 score and every
+# feature, computed one feature column at a time across the batch; its
+# weights come from LINEAR_MODEL_FILE (a JSON file trained offline, see
+# LinearReranker) or LINEAR_WEIGHTS.  Any object with a name, prepare() and
+# rerank() like theirs can be plugged in with set_rerankers(); one without a
+# max_boost() (see rerank_boost) sends its queries to the full postings.
+#
+# Each stage has its own budget: a query whose retrieval took longer than
+# RETRIEVAL_BUDGET_MS isn't reranked (it is slow enough already), and a
+# reranker past RERANK_BUDGET_MS stops where it is (candidates it didn't get
+# to stay below the ones it rescored, a linear model leaves out the features
+# it didn't compute).  Both count in search_rerank_over_budget_total{stage}
+# (see _note_over_budget), and every reranker is timed as its own search
+# stage, "rerank_<name>".  A response cut short says so in "over_budget" and
+# is never cached: not in the result cache, the head table or the page cache.
+#
+# On tier 1 (see TIERED SEARCH) every rerank candidate is one of tier 1's, so
+# a query is only answered there when its BM25 k-th score beats the tier
+# bound plus the largest boost of the plan (rerank_boost): otherwise its
+# candidates come from the full postings.  Each shard reranks its own
+# candidates.
+
+RERANKERS = os.environ.get("RERANKERS", "proximity")  # comma-separated, in order ("": none)
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", "200"))  # docs retrieval keeps
+RETRIEVAL_BUDGET_MS = float(os.environ.get("RETRIEVAL_BUDGET_MS", "100"))  # 0: no limit
+RERANK_BUDGET_MS = float(os.environ.get("RERANK_BUDGET_MS", "10"))  # per reranker, 0: no limit
+
+PROXIMITY_WEIGHT = float(os.environ.get("PROXIMITY_WEIGHT", "0.5"))  # 0: BM25 only
+PROXIMITY_MAX_POSITIONS = 64  # positions of a term per doc
+TITLE_MATCH_WEIGHT = 0.5
+PAGERANK_WEIGHT = 0.5
+LINEAR_MODEL_FILE = os.environ.get("LINEAR_MODEL_FILE", "rerank_model.json")
+LINEAR_WEIGHTS = {"bm25": 1.0, "proximity": 0.5, "title": 0.5, "pagerank": 0.5}
+
+_rerankers = None  # the RERANKERS, built on first use
+
+# Stages of the running query past their time budget (see _note_over_budget)
+_over_budget: ContextVar[set | None] = ContextVar("_over_budget", default=None)
+
+
+def _note_over_budget(stage: str):
+    """Counts a stage past its time budget, and flags the query it cut short."""
+    metrics.inc("search_rerank_over_budget_total", stage=stage)
+    stages = _over_budget.get()
+    if stages is not None:
+        stages.add(stage)
+
+
+def _feature_terms(query_terms: list[str], field: str) -> list[tuple[list[Postings], float]]:
+    """(postings of its dictionary terms, idf) of every distinct query term that can match field."""
+    num_docs = _index_cache["metadata"]["num_docs"]
+    terms = []
+    for query_term in dict.fromkeys(query_terms):
+        fields, term = _split_field(query_term)
+        if fields and field not in fields:
+            continue
+        if field == "body" and "*" in term:
+            continue  # merged wildcard postings have no positions
+        resolved = _resolve_term(term)
+        if resolved:
+            idf = max(_bm25_idf(p.doc_freq, num_docs) * weight for p, weight in resolved)
+            terms.append(([postings for postings, _ in resolved], idf))
+    return terms
+
+
+def _query_terms(query: Query) -> list[str]:
+    """The terms a query is scored on, whatever its mode."""
+    if query.mode == "phrase":
+        return query.phrase_tokens
+    if query.mode == "boolean":
+        return _collect_leaf_terms(query.boolean_ast)
+    return query.terms
+
+
+def _proximity_terms(query: Query) -> list[tuple[list[Postings], float]]:
+    """The query terms proximity is computed on, [] when it has none."""
+    if query.mode != "simple" or _index_cache["metadata"].get("positions") == "none":
+        return []
+    terms = _feature_terms(query.terms, "body")
+    return terms if len(terms) > 1 else []
+
+
+def _min_window(positions: list[list[int]]) -> tuple[int, int]:
+    """
+    (terms, length) of the shortest run of tokens holding one position of
+    every non-empty list of positions (one list per term).
+    """
+    events = sorted((position, n) for n, term in enumerate(positions) for position in term)
+    terms = sum(1 for term in positions if term)
+    counts = [0] * len(positions)
+    covered = start = 0
+    best = math.inf
+    for position, n in events:
+        counts[n] += 1
+        covered += counts[n] == 1
+        while covered == terms:
+            first, m = events[start]
+            best = min(best, position - first + 1)
+            counts[m] -= 1
+            covered -= counts[m] == 0
+            start += 1
+    return terms, best
+
+
+# Features: built per query, falsy when they don't apply to it, then called
+# with a doc id.  bound and low are the largest and smallest values the
+# feature can take for the query.
+
+
+class ProximityFeature:
+    """Closeness of the query terms in the body (see above)."""
+
+    def __init__(self, query: Query):
+        self.terms = _proximity_terms(query)
+        self.bound = sum(idf for _, idf in self.terms)
+        self.low = 0.0
+
+    def __bool__(self):
+        return bool(self.terms)
+
+    def __call__(self, doc: int) -> float:
+        positions, idf_sum = [], 0.0
+        for postings, idf in self.terms:
+            found = []
+            for entry in postings:
+                i = entry.find(doc)
+                if i >= 0:
+                    found.extend(entry.positions_of(i)[:PROXIMITY_MAX_POSITIONS])
+            if found:
+                idf_sum += idf
+            positions.append(found)
+        covered, length = _min_window(positions)
+        return idf_sum * min(1.0, covered / length) if covered > 1 else 0.0
+
+
+class TitleFeature:
+    """How much of the title the query terms make up (see above)."""
+
+    def __init__(self, query: Query):
+        has_titles = "title" in _field_stats
+        self.terms = _feature_terms(_query_terms(query), "title") if has_titles else []
+        self.title_lengths = _field_stats["title"][1] if has_titles else None
+        self.bound = sum(idf for _, idf in self.terms)
+        self.low = 0.0
+
+    def __bool__(self):
+        return bool(self.terms)
+
+    def __call__(self, doc: int) -> float:
+        matched, idf_sum = 0, 0.0
+        for postings, idf in self.terms:
+            for entry in postings:
+                if entry.title_tf is None:
+                    continue
+                i = entry.find(doc)
+                if i >= 0 and entry.title_tf[i]:
+                    matched += 1
+                    idf_sum += idf
+                    break
+        return idf_sum * min(1.0, matched / self.title_lengths[doc]) if matched else 0.0
+
+
+class PageRankFeature:
+    """Query-independent: log PageRank of the doc (see above)."""
+
+    def __init__(self, query: Query):
+        self.bound = _doc_rank_max
+        self.low = _doc_rank_min  # below-average pages have a negative log PageRank
+
+    def __bool__(self):
+        return _doc_rank is not None
+
+    def __call__(self, doc: int) -> float:
+        return _doc_rank[doc]
+
+
+FEATURES = {"proximity": ProximityFeature, "title": TitleFeature, "pagerank": PageRankFeature}
+
+
+class FeatureReranker:
+    """Adds weight · one of FEATURES to the incoming score of each candidate."""
+
+    def __init__(self, feature: str, weight: float):
+        self.name = feature
+        self.weight = weight
+
+    def prepare(self, query: Query):
+        """What rerank() needs for query, None when it wouldn't change its ranking."""
+        if not self.weight:
+            return None
+        return FEATURES[self.name](query) or None
+
+    def max_boost(self, feature) -> float:
+        """The most rerank() can raise one candidate's score over another's."""
+        return abs(self.weight) * (feature.bound - feature.low)
+
+    def rerank(self, feature, candidates: list, keep: int, deadline: float) -> list:
+        """candidates (best first) → rescored, best first; the top `keep` are exact."""
+        max_boost = max(self.weight * feature.bound, self.weight * feature.low)
+        rescored = []  # (doc, score) in incoming order
+        kth = []  # min-heap of the top `keep` scores so far
+        for doc, score in candidates:
+            if len(kth) == keep and score + max_boost <= kth[0]:
+                break  # neither this doc nor any after it can make the top `keep`
+            if time.perf_counter() > deadline:
+                _note_over_budget(self.name)
+                break
+            score += self.weight * feature(doc)
+            rescored.append((doc, score))
+            if len(kth) < keep:
+                heapq.heappush(kth, score)
+            elif score > kth[0]:
+                heapq.heapreplace(kth, score)
+        rescored.sort(key=itemgetter(1), reverse=True)
+        return rescored + candidates[len(rescored):]
+
+
+class LinearReranker:
+    """
+    score = bias + weights["bm25"] · incoming score + Σ weights[f] · feature f.
+    The model file is {"weights": {"bm25": …, "proximity": …, …}, "bias": …},
+    fitted offline on judged queries with the same features.
+    """
+
+    name = "linear"
+
+    def __init__(self, weights: dict, bias: float = 0.0):
+        unknown = set(weights) - set(FEATURES) - {"bm25"}
+        if unknown:
+            raise ValueError(f"Unknown features in the linear model: {sorted(unknown)}")
+        self.weights = weights
+        self.bias = bias
+        self.scale = weights.get("bm25", 1.0)  # of the incoming score
+
+    @classmethod
+    def load(cls, path: str = LINEAR_MODEL_FILE) -> "LinearReranker":
+        """The model in path, LINEAR_WEIGHTS if there is no such file."""
+        if not os.path.exists(path):
+            return cls(dict(LINEAR_WEIGHTS))
+        with open(path, "r", encoding="utf-8") as f:
+            model = json.load(f)
+        logger.info("Linear reranker loaded from %s", path)
+        return cls(model["weights"], model.get("bias", 0.0))
+
+    def prepare(self, query: Query):
+        features = [
+            (FEATURES[name](query), weight)
+            for name, weight in self.weights.items()
+            if name != "bm25" and weight
+        ]
+        return [(feature, weight) for feature, weight in features if feature] or None
+
+    def max_boost(self, features) -> float | None:
+        """
+        The most the features can raise one candidate's score over another's,
+        in incoming score (None when the model doesn't grow with it).
+        """
+        if self.scale <= 0:
+            return None
+        spread = sum(abs(weight) * (feature.bound - feature.low) for feature, weight in features)
+        return spread / self.scale
+
+    def rerank(self, features, candidates: list, keep: int, deadline: float) -> list:
+        """candidates → rescored by the model, best first."""
+        docs = [doc for doc, _ in candidates]
+        columns = [[score for _, score in candidates]]
+        weights = [self.scale]
+        for feature, weight in features:
+            if time.perf_counter() > deadline:
+                _note_over_budget(self.name)
+                break  # the features left are left out
+            columns.append(list(map(feature, docs)))
+            weights.append(weight)
+        np = _numpy()
+        if np:
+            scores = (np.array(weights) @ np.array(columns) + self.bias).tolist()
+        else:
+            scores = [self.bias + sum(map(mul, weights, row)) for row in zip(*columns)]
+        return sorted(zip(docs, scores), key=itemgetter(1), reverse=True)
+
+
+def _make_reranker(name: str):
+    if name == "linear":
+        return LinearReranker.load()
+    weights = {
+        "proximity": PROXIMITY_WEIGHT, "title": TITLE_MATCH_WEIGHT, "pagerank": PAGERANK_WEIGHT
+    }
+    if name not in weights:
+        raise ValueError(f"Unknown reranker {name!r} in RERANKERS")
+    return FeatureReranker(name, weights[name])
+
+
+def get_rerankers() -> list:
+    """The rerankers search() runs, in order."""
+    global _rerankers
+    if _rerankers is None:
+        _rerankers = [_make_reranker(n.strip()) for n in RERANKERS.split(",") if n.strip()]
+    return _rerankers
+
+
+def set_rerankers(rerankers: list):
+    """Replaces the rerankers search() runs (cached responses are dropped)."""
+    global _rerankers
+    _rerankers = list(rerankers)
+    with _result_cache_lock:
+        _result_cache.clear()
+    with _page_cache_lock:
+        _page_cache.clear()
+
+
+def rerank_plan(query: Query) -> list[tuple]:
+    """(reranker, what it prepared) of every reranker that would change query's ranking."""
+    plan = []
+    for reranker in get_rerankers():
+        prepared = reranker.prepare(query)
+        if prepared is not None:
+            plan.append((reranker, prepared))
+    return plan
+
+
+def rerank_boost(plan: list[tuple]) -> float:
+    """
+    The most plan can raise one candidate's BM25 score over another's (see
+    TIERED SEARCH), inf when one of its rerankers can't bound its boost:
+    no max_boost(), or it returns None.  A reranker's max_boost() is in its
+    incoming score, which earlier rerankers' `scale` multiplied.
+    """
+    boost, scale = 0.0, 1.0  # scale: incoming score per BM25 point
+    for reranker, prepared in plan:
+        max_boost = getattr(reranker, "max_boost", None)
+        step = max_boost(prepared) if max_boost is not None else None
+        if step is None:
+            return math.inf
+        boost += step / scale
+        scale *= getattr(reranker, "scale", 1.0)
+    return boost
+
+
+def rerank(plan: list[tuple], candidates: list[tuple[int, float]], top_k: int) -> list:
+    """candidates (retrieval's best, best first) through every reranker of plan → top_k."""
+    for n, (reranker, prepared) in enumerate(plan):
+        keep = top_k if n == len(plan) - 1 else len(candidates)
+        deadline = time.perf_counter() + RERANK_BUDGET_MS / 1000 if RERANK_BUDGET_MS else math.inf
+        with metrics.timer(f"rerank_{reranker.name}"):
+            candidates = reranker.rerank(prepared, candidates, keep, deadline)
+    return candidates[:top_k]
+
+
+# Pattern → doc_freq across ALL shards, set by a shard while serving a sharded
+# query (see shards.py) so merged wildcard postings get the global IDF.
+_global_df: ContextVar[dict | None] = ContextVar("_global_df", default=None)
+
+# Term → resolved entries, shared by all queries of one batch chunk (see
+# search_many), or the cached resolutions of one query (see compile_query).
+# Always scoped to a single batch chunk / search, so merged wildcard postings
+# are never held on to.
+_term_memo: ContextVar[dict | None] = ContextVar("_term_memo", default=None)
+
+
+def _resolve_term(term: str) -> list[tuple[Postings, float]]:
+    """
+    Maps one query term to the postings it should be scored with:
+        known term     → [(postings, 1.0)]
+        wildcard term  → [(virtual postings merging all expansions, 1.0)]
+        unknown term   → [(postings of each near neighbour, down-weight), ...]
+    """
+    memo = _term_memo.get()
+    if memo is None:
+        return _lookup_term(term)
+    if term not in memo:
+        memo[term] = _lookup_term(term)
+    return memo[term]
+
+
+def _lookup_term(term: str) -> list[tuple[Postings, float]]:
+    term_id = _term_id(term)
+    if term_id is not None:
+        return [(_entries[term_id], 1.0)]
+    if "*" in term:
+        postings = _wildcard_entry(term)
+        return [(postings, 1.0)] if postings.doc_freq else []
+    return [(_entries[t], weight) for t, weight in expand_fuzzy(term)]
+
+
+def _expand_term(term: str) -> list[int]:
+    """Like _resolve_term, but returns the ids of the concrete dictionary terms."""
+    _, term = _split_field(term)
+    term_id = _term_id(term)
+    if term_id is not None:
+        return [term_id]
+    if "*" in term:
+        return expand_wildcard(term)
+    return [t for t, _ in expand_fuzzy(term)]
+
+
+# ─────────────────────────────────────────────
+# WILDCARD TERMS
+# ─────────────────────────────────────────────
+# Trailing wildcards (neur*) are a range scan over the sorted term dictionary.
+# Leading / infix wildcards (*ology, ne*al) go through a bigram index
+# ("$neural$" → $n ne eu ur ra al l$) to find candidate terms, which are then
+# checked against the full pattern.
+#
+# The matching terms are merged into ONE virtual postings list, so a pattern
+# is scored like a single term (its own df / IDF) rather than as N separate
+# terms that would each add their own IDF.
+
+
+def _bigrams(text: str) -> set[str]:
+    return {text[i : i + 2] for i in range(len(text) - 1)}
+
+
+def _build_kgram_index() -> dict:
+    kgrams = defaultdict(set)
+    for term_id, term in enumerate(_sorted_terms):
+        for gram in _bigrams(f"${term}$"):
+            kgrams[gram].add(term_id)
+    logger.info("Built bigram index over %d terms", len(_sorted_terms))
+    return dict(kgrams)
+
+
+def expand_wildcard(pattern: str) -> list[int]:
+    """
+    Expands a wildcard pattern into the ids of the matching dictionary terms.
+    Capped at WILDCARD_MAX_EXPANSIONS, keeping the highest doc_freq terms.
+    """
+    global _kgram_index
+    _ensure_loaded()
+    prefix = pattern.split("*", 1)[0]
+
+    if pattern == prefix + "*":
+        # Trailing wildcard → contiguous range of the sorted dictionary
+        matches = []
+        i = bisect_left(_sorted_terms, prefix)
+        while i < len(_sorted_terms) and len(matches) < WILDCARD_SCAN_LIMIT:
+            if not _sorted_terms[i].startswith(prefix):
+                break
+            matches.append(i)
+            i += 1
+    else:
+        # Leading / infix wildcard → intersect bigram postings, then verify
+        if _kgram_index is None:
+            _kgram_index = _build_kgram_index()
+        grams = set()
+        for piece in f"${pattern}$".split("*"):
+            grams |= _bigrams(piece)
+        if not grams:
+            return []
+        candidate_sets = sorted((_kgram_index.get(g, set()) for g in grams), key=len)
+        candidates = set.intersection(*candidate_sets)
+
+        regex = re.compile(".*".join(re.escape(p) for p in pattern.split("*")))
+        matches = [t for t in candidates if regex.fullmatch(_sorted_terms[t])]
+
+    if len(matches) > WILDCARD_MAX_EXPANSIONS:
+        matches = heapq.nlargest(
+            WILDCARD_MAX_EXPANSIONS, matches, key=lambda t: _entries[t].doc_freq
+        )
+    logger.info("Expanded wildcard %r → %d terms", pattern, len(matches))
+    return matches
+
+
+def _wildcard_entry(pattern: str) -> Postings:
+    """
+    Merges the postings of every expansion of pattern into a single virtual
+    postings list (without positions): term frequencies are summed per doc,
+    doc_freq is the merged doc count.
+    """
+    term_ids = expand_wildcard(pattern)
+    if len(term_ids) == 1:
+        return _entries[term_ids[0]]  # nothing to merge
+
+    body, title = defaultdict(int), defaultdict(int)
+    for term_id in term_ids:
+        postings = _entries[term_id]
+        for doc, tf in zip(postings.docs, postings.tf):
+            body[doc] += tf
+        if postings.title_tf is not None:
+            for doc, tf in zip(postings.docs, postings.title_tf):
+                title[doc] += tf
+
+    docs = array("I", sorted(body))
+    global_df = _global_df.get()
+    doc_freq = global_df[pattern] if global_df and pattern in global_df else len(docs)
+    return Postings(
+        doc_freq,
+        docs,
+        array("I", map(body.__getitem__, docs)),
+        array("I", (title.get(doc, 0) for doc in docs)) if title else None,
+    )
+
+
+# ─────────────────────────────────────────────
+# TYPO TOLERANCE
+# ─────────────────────────────────────────────
+# Unknown terms are looked up in the deletion index built by the indexer
+# (see indexer.build_fuzzy_index).  Candidates sharing a delete-string are
+# verified with a bounded Damerau-Levenshtein distance, then the closest
+# and most common ones are kept.
+
+
+def _edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Optimal-string-alignment distance (Levenshtein + adjacent transpositions),
+    so "nueral" → "neural" costs 1.  Bails out with max_distance + 1 as soon
+    as a whole row exceeds the bound.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    prev_prev = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        curr = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            curr[j] = min(prev[j] + 1, curr[j - 1] + 1, prev[j - 1] + cost)
+            if (
+                prev_prev is not None
+                and j > 1
+                and a[i - 1] == b[j - 2]
+                and a[i - 2] == b[j - 1]
+            ):
+                curr[j] = min(curr[j], prev_prev[j - 2] + 1)
+        if min(curr) > max_distance:
+            return max_distance + 1
+        prev_prev, prev = prev, curr
+    return prev[-1]
+
+
+def expand_fuzzy(term: str) -> list[tuple[int, float]]:
+    """
+    Maps an unknown (stemmed) term to up to FUZZY_MAX_EXPANSIONS indexed terms
+    within the fuzzy index's max edit distance.
+    Returns [(term id, weight), ...] — nearest distance only, most common first.
+    """
+    _ensure_loaded()
+    fuzzy = _index_cache["fuzzy"]
+    max_distance = fuzzy["max_distance"]
+
+    if len(term) < FUZZY_MIN_TERM_LENGTH or not term.isalpha():
+        return []
+    if len(term) <= 5:
+        max_distance = min(max_distance, 1)  # short words: one typo at most
+
+    candidates = set()
+    for d in fuzzy_deletes(term[: fuzzy["prefix_length"]], max_distance):
+        candidates.update(fuzzy["deletes"].get(d, ()))
+
+    matches = []
+    for candidate in candidates:  # term ids, ordered like their terms
+        distance = _edit_distance(term, _sorted_terms[candidate], max_distance)
+        if distance <= max_distance:
+            matches.append((distance, -_entries[candidate].doc_freq, candidate))
+    if not matches:
+        return []
+    matches.sort()
+
+    # Only keep the closest tier — a distance-1 fix beats any distance-2 guess,
+    # however rare (and therefore high-IDF) the distance-2 term is
+    best = matches[0][0]
+    expansions = [
+        (candidate, FUZZY_WEIGHT**distance)
+        for distance, _, candidate in matches[:FUZZY_MAX_EXPANSIONS]
+        if distance == best
+    ]
+    if expansions:
+        logger.info(
+            "Expanded unknown term %r → %s",
+            term,
+            [(_sorted_terms[t], weight) for t, weight in expansions],
+        )
+    return expansions
 
 
 # ─────────────────────────────────────────────
@@ -722,119 +2203,906 @@ def score_simple(terms: list[str]) -> list[tuple[str, float]]:
 # ─────────────────────────────────────────────
 # Uses the position lists stored in the index.
 # A phrase matches doc d if every consecutive pair of tokens
-# appears at consecutive positions somewhere in d.
+# appears at consecutive positions somewhere in d.  On an index built
+# without positions it matches every doc with all of its tokens.
 
 
-def score_phrase(phrase_tokens: list[str]) -> list[tuple[str, float]]:
+def score_phrase(phrase_tokens: list[str]) -> list[tuple[int, float]]:
     """
     Finds docs where phrase_tokens appear consecutively (in order).
     Score = BM25 of the first token (so results are still meaningfully ranked).
+    Returns list of (doc id, score), unsorted.
     """
     _ensure_loaded()
     if not phrase_tokens:
         return []
 
-    index = _index_cache["index"]
     num_docs = _index_cache["metadata"]["num_docs"]
     avg_dl = _index_cache["metadata"]["avg_doc_length"]
-    doc_lengths = _index_cache["doc_lengths"]
+    doc_lengths = _field_stats["body"][1]
 
-    # Start with candidate docs that contain the first token
-    first = phrase_tokens[0]
-    if first not in index:
+    # Every token must be in the dictionary
+    term_ids = [_term_id(token) for token in phrase_tokens]
+    if None in term_ids:
         return []
-
-    # For each candidate doc, check whether all tokens are consecutive
+    first, rest = _entries[term_ids[0]], [_entries[t] for t in term_ids[1:]]
+    idf = _bm25_idf(first.doc_freq, num_docs)
+
+    # Docs with every token, and each token's posting index for them (in doc
+    # order): set intersection + compress, so C-speed scans of the postings
+    common = set(first.docs).intersection(*(postings.docs for postings in rest))
+    if _index_cache["metadata"].get("positions") == "none":
+        return [
+            (doc, idf * _bm25_tf(first.tf[first.find(doc)], doc_lengths[doc], avg_dl))
+            for doc in common
+        ]
+    in_common = common.__contains__
+    found = [
+        compress(range(len(postings)), map(in_common, postings.docs))
+        for postings in (first, *rest)
+    ]
+
+    # A phrase starts at p if token k is at p + k for every k: intersect the
+    # candidate starts with each token's positions shifted back by k
+    # (positions_of inlined: this loop runs once per doc with every token)
+    first_positions, first_offsets = first.positions, first.offsets
+    shifted = [(k.__rsub__, p.positions, p.offsets) for k, p in enumerate(rest, 1)]
     matches = []
-    for doc_id, posting in index[first]["postings"].items():
-        start_positions = posting["positions"]
-
-        for start in start_positions:
-            found = True
-            for offset, token in enumerate(phrase_tokens[1:], 1):
-                if token not in index:
-                    found = False
-                    break
-                postings_for_token = index[token]["postings"]
-                if doc_id not in postings_for_token:
-                    found = False
-                    break
-                if (start + offset) not in postings_for_token[doc_id]["positions"]:
-                    found = False
-                    break
-            if found:
-                # Phrase confirmed — score with BM25 of first token as tiebreaker
-                idf = _bm25_idf(index[first]["doc_freq"], num_docs)
-                tf_norm = _bm25_tf(posting["term_freq"], int(doc_lengths[doc_id]), avg_dl)
-                matches.append((doc_id, idf * tf_norm))
-                break  # one match per doc is enough
+    for doc, i, *rest_found in zip(sorted(common), *found):
+        starts = set(first_positions[first_offsets[i] : first_offsets[i + 1]])
+        for (shift, positions, offsets), j in zip(shifted, rest_found):
+            if not starts:
+                break
+            starts.intersection_update(map(shift, positions[offsets[j] : offsets[j + 1]]))
+        if starts:
+            # Phrase confirmed — score with BM25 of first token as tiebreaker
+            tf_norm = _bm25_tf(first.tf[i], doc_lengths[doc], avg_dl)
+            matches.append((doc, idf * tf_norm))
 
-    return sorted(matches, key=lambda x: x[1], reverse=True)
+    return matches
 
 
 # ─────────────────────────────────────────────
 # BOOLEAN SEARCH
 # ─────────────────────────────────────────────
-# Walks the AST and returns a SET of matching doc_ids at each node.
+# The AST is first rewritten by the query planner (see below), then the plan
+# is executed to get the SET of matching doc ids.
 # Final set is scored with BM25 on the leaf terms for ranking.
 
 
-def _eval_boolean(node: dict) -> set[str]:
-    """Recursively evaluates a boolean AST node → set of matching doc_ids."""
-    _ensure_loaded()
-    index = _index_cache["index"]
+def _execute_plan(node: dict, candidates: set[int] | None = None) -> set[int]:
+    """
+    Recursively executes a plan node → set of matching doc ids.
+    With candidates, only those docs are considered (and probed against the
+    postings instead of walking them when there are fewer candidates).
+    """
+    if "const" in node:
+        if node["const"] == "NONE":
+            return set()
+        return set(range(len(_doc_ids)) if candidates is None else candidates)
 
     if "term" in node:
-        # Leaf: return all docs containing this term
-        term = node["term"]
-        if term in index:
-            return set(index[term]["postings"].keys())
-        return set()
+        return _term_docs(node["term"], candidates)
 
     op = node["op"]
 
-    if op == "NOT":
-        all_docs = set(_index_cache["doc_lengths"].keys())
-        return all_docs - _eval_boolean(node["operand"])
-
-    left = _eval_boolean(node["left"])
-    right = _eval_boolean(node["right"])
-
     if op == "AND":
-        return left & right
-    if op == "OR":
-        return left | right
+        docs = candidates
+        for child in node["children"]:  # cheapest first
+            docs = _execute_plan(child, docs)
+            if not docs:
+                break
+        return docs
 
-    return set()
+    if op == "OR":
+        docs = set()
+        for child in node["children"]:
+            docs |= _execute_plan(child, candidates)
+        return docs
+
+    if op == "ANDNOT":
+        docs = _execute_plan(node["left"], candidates)
+        return docs - _execute_plan(node["right"], docs) if docs else docs
+
+    # NOT with nothing to subtract it from → complement against the corpus
+    all_docs = set(range(len(_doc_ids)) if candidates is None else candidates)
+    return all_docs - _execute_plan(node["operand"], all_docs)
+
+
+def _term_docs(query_term: str, candidates: set[int] | None = None) -> set[int]:
+    """Docs containing a leaf term (or its expansions) in the requested fields."""
+    fields, term = _split_field(query_term)
+    column = _field_stats[fields[0]][0] if len(fields) == 1 else None
+    docs = set()
+    for postings, _ in _resolve_term(term):
+        tfs = None if column is None else getattr(postings, column)
+        if column is not None and tfs is None:
+            continue  # never in that field
+        if candidates is not None and len(candidates) * _PROBE_RATIO < len(postings):
+            found = postings.select(candidates)
+            docs.update(postings.docs[i] for i in found if tfs is None or tfs[i])
+            continue
+        hits = postings.docs if tfs is None else compress(postings.docs, tfs)
+        docs.update(hits if candidates is None else candidates.intersection(hits))
+    return docs
 
 
-def _collect_leaf_terms(node: dict) -> list[str]:
+def _collect_leaf_terms(node) -> list[str]:
     """Walks the AST and collects every leaf term (for BM25 scoring)."""
-    if "term" in node:
-        return [node["term"]]
-    terms = []
-    if "operand" in node:
-        terms += _collect_leaf_terms(node["operand"])
-    if "left" in node:
-        terms += _collect_leaf_terms(node["left"])
-    if "right" in node:
-        terms += _collect_leaf_terms(node["right"])
-    return terms
+    if isinstance(node, Term):
+        return [node.term]
+    if isinstance(node, Not):
+        return _collect_leaf_terms(node.operand)
+    return _collect_leaf_terms(node.left) + _collect_leaf_terms(node.right)
 
 
-def score_boolean(ast: dict) -> list[tuple[str, float]]:
+def score_boolean(ast, plan: dict | None = None) -> list[tuple[int, float]]:
     """
-    Evaluates the boolean AST to get the matching doc set,
+    Plans and executes the boolean AST to get the matching doc set,
     then ranks those docs by BM25 on the positive leaf terms.
     """
-    matching_ids = _eval_boolean(ast)
+    matching_ids = _execute_plan(plan or plan_query(ast))
     if not matching_ids:
         return []
 
-    # Score the full corpus with BM25, then filter to the boolean match set
+    # Score only the boolean match set with BM25
     leaf_terms = _collect_leaf_terms(ast)
-    all_scored = score_simple(leaf_terms)
-    return [(did, score) for did, score in all_scored if did in matching_ids]
+    return score_simple(leaf_terms, candidates=matching_ids)
+
+
+# ─────────────────────────────────────────────
+# QUERY PLANNER
+# ─────────────────────────────────────────────
+# Rewrites a boolean AST before it is executed:
+#   - nested AND / OR chains are flattened into one n-ary node
+#   - AND children are ordered by doc_freq; each later child only probes the
+#     docs that survived so far instead of materialising its whole postings
+#   - A AND NOT B becomes ANDNOT(A, B): B is probed against A's docs instead
+#     of being complemented against the full corpus
+#   - terms that match nothing fold to the constant NONE (and NOT NONE to
+#     ALL), which empties ANDs and drops out of ORs before anything runs
+#
+# Plan nodes are dicts (the JSON form of the AST, see ast_to_dict), plus:
+#   docs = estimated number of matching docs (terms assumed independent;
+#          a title: / body: term counts only its postings in that field)
+#   cost = estimated number of postings / docs touched to execute the node
+#
+#   {"op": "ANDNOT", "docs": 12.4, "cost": 310,
+#    "left":  {"op": "AND", "children": [{"term": "robot", ...}, {"term": "python", ...}], ...},
+#    "right": {"term": "deep", "docs": 80, "cost": 80}}
+
+
+def plan_query(ast) -> dict:
+    """Boolean AST → executable plan (see above)."""
+    _ensure_loaded()
+    return _plan(ast, _index_cache["metadata"]["num_docs"])
+
+
+def _field_doc_freq(query_term: str) -> int:
+    """Docs with a field-restricted leaf term (or its expansions) in that field."""
+    fields, _ = _split_field(query_term)
+    column = _field_stats[fields[0]][0]
+    docs = 0
+    for term_id in _expand_term(query_term):
+        postings = _entries[term_id]
+        tfs = getattr(postings, column)
+        if tfs is not None and len(tfs):
+            # Scaled to doc_freq, which is the global df on a shard
+            docs += postings.doc_freq * (len(tfs) - tfs.count(0)) / len(tfs)
+    return round(docs)
+
+
+def _const(value: str, num_docs: int) -> dict:
+    return {"const": value, "docs": num_docs if value == "ALL" else 0, "cost": 0}
+
+
+def _plan(node, num_docs: int) -> dict:
+    if isinstance(node, Term):
+        fields, _ = _split_field(node.term)
+        postings = _query_postings([node.term])
+        if not postings or not any(field in _field_stats for field in fields):
+            return _const("NONE", num_docs)
+        docs = _field_doc_freq(node.term) if len(fields) == 1 else postings
+        if not docs:
+            return _const("NONE", num_docs)
+        return {"term": node.term, "docs": min(docs, num_docs), "cost": postings}
+
+    if isinstance(node, Not):
+        operand = _plan(node.operand, num_docs)
+        if "const" in operand:
+            return _const("ALL" if operand["const"] == "NONE" else "NONE", num_docs)
+        return {
+            "op": "NOT",
+            "operand": operand,
+            "docs": num_docs - operand["docs"],
+            "cost": num_docs + operand["cost"],
+        }
+
+    children = [_plan(node.left, num_docs), _plan(node.right, num_docs)]
+    if node.op == "OR":
+        return _plan_or(children, num_docs)
+
+    # AND: split into the docs to keep and the docs to exclude
+    keep, exclude = [], []
+    for child in children:
+        if child.get("op") == "AND":
+            keep += child["children"]
+        elif child.get("op") == "ANDNOT":
+            keep += _flatten("AND", child["left"])
+            exclude += _flatten("OR", child["right"])
+        elif child.get("op") == "NOT":
+            exclude.append(child["operand"])
+        else:
+            keep.append(child)
+
+    if any(child.get("const") == "NONE" for child in keep):
+        return _const("NONE", num_docs)
+    keep = [child for child in keep if "const" not in child]  # drop ALL
+    excluded = _plan_or(exclude, num_docs) if exclude else _const("NONE", num_docs)
+    if excluded.get("const") == "ALL":
+        return _const("NONE", num_docs)
+
+    if not keep:
+        if "const" in excluded:
+            return _const("ALL", num_docs)
+        return {
+            "op": "NOT",
+            "operand": excluded,
+            "docs": num_docs - excluded["docs"],
+            "cost": num_docs + excluded["cost"],
+        }
+
+    keep.sort(key=lambda child: child["docs"])
+    if len(keep) == 1:
+        kept = keep[0]
+    else:
+        docs, cost = keep[0]["docs"], keep[0]["cost"]
+        for child in keep[1:]:
+            cost += min(child["cost"], docs)  # probing the survivors
+            docs *= child["docs"] / num_docs
+        kept = {"op": "AND", "children": keep, "docs": round(docs, 1), "cost": round(cost)}
+
+    if "const" in excluded:
+        return kept
+    return {
+        "op": "ANDNOT",
+        "left": kept,
+        "right": excluded,
+        "docs": round(kept["docs"] * (1 - excluded["docs"] / num_docs), 1),
+        "cost": round(kept["cost"] + min(excluded["cost"], kept["docs"])),
+    }
+
+
+def _plan_or(children: list[dict], num_docs: int) -> dict:
+    flat = [grandchild for child in children for grandchild in _flatten("OR", child)]
+    if any(child.get("const") == "ALL" for child in flat):
+        return _const("ALL", num_docs)
+    flat = [child for child in flat if "const" not in child]  # drop NONE
+    if not flat:
+        return _const("NONE", num_docs)
+    if len(flat) == 1:
+        return flat[0]
+    return {
+        "op": "OR",
+        "children": flat,
+        "docs": min(num_docs, sum(child["docs"] for child in flat)),
+        "cost": sum(child["cost"] for child in flat),
+    }
+
+
+def _flatten(op: str, node: dict) -> list[dict]:
+    return node["children"] if node.get("op") == op else [node]
+
+
+def _chain(op: str, terms: list[str]):
+    """["a", "b", "c"] → left-deep AST a op b op c, like _parse_boolean builds."""
+    ast = None
+    for term in terms:
+        ast = Term(term) if ast is None else BinOp(op, ast, Term(term))
+    return ast
+
+
+def explain_query(query: Query, match: str = "all") -> dict:
+    """
+    What search() will run for a parsed query, with estimated costs.
+    Simple and phrase queries are shown as the AND / OR of their terms.
+    """
+    _ensure_loaded()
+    num_docs = _index_cache["metadata"]["num_docs"]
+    if query.mode == "boolean":
+        ast, op = query.boolean_ast, None
+    elif query.mode == "phrase":
+        ast, op = _chain("AND", query.phrase_tokens), "AND"
+    else:
+        op = "OR" if match == "any" else "AND"
+        ast = _chain(op, list(dict.fromkeys(query.terms)))
+
+    if query.plan is not None:
+        plan = query.plan
+    else:
+        plan = _plan(ast, num_docs) if ast else _const("NONE", num_docs)
+    explanation = {"mode": query.mode, "plan": plan}
+    if query.mode == "simple":
+        explanation["match"] = match
+        if match == "all":
+            explanation["fallback"] = "OR when fewer than top_k docs match every term"
+        if TIER_MODE != "off" and "tiers" in _index_cache:
+            explanation["tier1"] = (
+                f"top {_index_cache['tiers']['postings']} postings per term first ({TIER_MODE}),"
+                " the full index if that can't answer"
+            )
+    if query.mode == "phrase":
+        if _index_cache["metadata"].get("positions") == "none":
+            explanation["then"] = "none: the index has no positions, so this is the AND"
+        else:
+            explanation["then"] = "check token positions of the AND matches"
+    else:
+        explanation["parallel"] = use_parallel(query)
+    rerankers = [reranker.name for reranker, _ in rerank_plan(query)]
+    if rerankers:
+        explanation["rerank"] = f"top {RERANK_CANDIDATES} by {', '.join(rerankers)}"
+    if _dense is not None and HYBRID_SEARCH and query.mode == "simple":
+        explanation["hybrid"] = (
+            f"RRF of the top {HYBRID_CANDIDATES} with the {HYBRID_CANDIDATES} nearest docs"
+            f" by vector ({min(DENSE_PROBES, len(_dense[1]))} of {len(_dense[1])} IVF lists)"
+        )
+    if COLLAPSE_DUPLICATES and _duplicate_of:
+        explanation["collapse"] = (
+            f"one result per near-duplicate cluster ({len(_duplicate_of)} near-duplicates"
+            f" in the index)"
+        )
+    return explanation
+
+
+# ─────────────────────────────────────────────
+# PLAN CACHE
+# ─────────────────────────────────────────────
+# Repeated queries skip parsing, tokenizing, planning and dictionary lookups:
+# compile_query keeps the parsed + planned Query for each raw query string in
+# a bounded LRU, together with its terms already resolved to index entries.
+# Wildcard terms are left out of that memo (their merged postings can be
+# large) and are resolved per search as before.  Cleared on index (re)load.
+
+PLAN_CACHE_SIZE = 1024  # raw query strings kept
+
+_plan_cache = OrderedDict()  # raw query → (Query, {term: resolved entries})
+_plan_cache_lock = threading.Lock()
+_plan_cache_stats = {"hits": 0, "misses": 0, "parse_seconds": 0.0}
+
+
+def compile_query(raw: str) -> tuple[Query, dict]:
+    """
+    parse_query + plan_query + term resolution, cached by raw query string.
+    Returns (query, resolved), resolved being a _term_memo for this query.
+    Both are shared between callers and must not be modified.
+    """
+    key = raw.strip()
+    with _plan_cache_lock:
+        cached = _plan_cache.get(key)
+        if cached is not None:
+            _plan_cache.move_to_end(key)
+            _plan_cache_stats["hits"] += 1
+            metrics.inc("plan_cache_requests_total", result="hit")
+            return cached
+
+    start = time.perf_counter()
+    query = parse_query(key)
+    if query.mode == "boolean":
+        query.plan = plan_query(query.boolean_ast)
+    resolved = {term: _lookup_term(term) for term in _batch_terms([query]) if "*" not in term}
+    elapsed = time.perf_counter() - start
+
+    with _plan_cache_lock:
+        _plan_cache_stats["misses"] += 1
+        _plan_cache_stats["parse_seconds"] += elapsed
+        _plan_cache[key] = (query, resolved)
+        if len(_plan_cache) > PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+    metrics.inc("plan_cache_requests_total", result="miss")
+    return query, resolved
+
+
+def plan_cache_info() -> dict:
+    """Hit / miss counts and time spent parsing + planning cache misses."""
+    with _plan_cache_lock:
+        stats = dict(_plan_cache_stats)
+        stats["size"] = len(_plan_cache)
+    misses = stats["misses"]
+    stats["avg_parse_ms"] = round(stats["parse_seconds"] * 1000 / misses, 3) if misses else 0.0
+    return stats
+
+
+# ─────────────────────────────────────────────
+# RESULT CACHE
+# ─────────────────────────────────────────────
+# search() keeps the response of recent queries (before the AI summary and
+# the explain plan, which are added per call) in an LRU keyed by normalized
+# query, top_k and match.  Head queries can also be precomputed offline into
+# index.head.json (querylog.py head → build_head_results): that table is
+# loaded with the index, checked first and never evicted.  Both are only
+# valid for the index they were computed on: cleared / reloaded on every load.
+
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "1024"))  # responses kept (0: off)
+
+_result_cache = OrderedDict()  # (query, top_k, match) → response
+_result_cache_lock = threading.Lock()
+_head_results = {}  # (query, top_k, match) → response, from index.head.json
+
+
+def _copy_response(response: dict) -> dict:
+    """A response callers can add keys to without touching the cached one."""
+    return dict(response, results=[dict(result) for result in response["results"]])
+
+
+def _cached_response(key: tuple) -> dict | None:
+    response = _head_results.get(key)
+    if response is not None:
+        metrics.inc("result_cache_requests_total", result="head")
+        return _copy_response(response)
+    with _result_cache_lock:
+        response = _result_cache.get(key)
+        if response is not None:
+            _result_cache.move_to_end(key)
+    metrics.inc("result_cache_requests_total", result="miss" if response is None else "hit")
+    return None if response is None else _copy_response(response)
+
+
+def _cache_response(key: tuple, response: dict):
+    if not RESULT_CACHE_SIZE:
+        return
+    with _result_cache_lock:
+        _result_cache[key] = _copy_response(response)
+        if len(_result_cache) > RESULT_CACHE_SIZE:
+            _result_cache.popitem(last=False)
+
+
+def result_cache_info() -> dict:
+    with _result_cache_lock:
+        size = len(_result_cache)
+    with _page_cache_lock:
+        pages = len(_page_cache)
+    return {"size": size, "head_queries": len(_head_results), "paged_queries": pages}
+
+
+def _index_stamp(path: str) -> dict:
+    """What identifies one version of an index file (head tables are tied to it)."""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def build_head_results(queries: list[str], top_k: int = TOP_K, match: str = "all") -> str:
+    """
+    Runs queries against the loaded index and writes their responses (no AI
+    summary) to its head table (index.head.json) → the table's path.
+    """
+    _ensure_loaded()
+    results = {}
+    for raw in queries:
+        query = normalize_query(raw)
+        response = search(query, top_k=top_k, include_summary=False, match=match)
+        if response.get("over_budget"):
+            logger.warning("Head results: %r left out, over its time budget", query)
+            continue
+        results[query] = response
+    table = {
+        "index": _index_stamp(INDEX_FILE),
+        "tier_mode": TIER_MODE,
+        "rerankers": [reranker.name for reranker in get_rerankers()],
+        "collapse_duplicates": COLLAPSE_DUPLICATES,
+        "top_k": top_k,
+        "match": match,
+        "results": results,
+    }
+    path = head_results_path(INDEX_FILE)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False)
+    logger.info("Head results for %d queries saved → %s", len(results), path)
+    return path
+
+
+def _load_head_results() -> dict:
+    """The head table of INDEX_FILE, if there is one built for this very file."""
+    path = head_results_path(INDEX_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        table = json.load(f)
+    if (
+        table["index"] != _index_stamp(INDEX_FILE)
+        or table["tier_mode"] != TIER_MODE
+        or table.get("rerankers") != [reranker.name for reranker in get_rerankers()]
+        or table.get("collapse_duplicates") != COLLAPSE_DUPLICATES
+    ):
+        logger.warning("Ignoring %s: built for another version of %s", path, INDEX_FILE)
+        return {}
+    top_k, match = table["top_k"], table["match"]
+    logger.info("Loaded head results for %d queries from %s", len(table["results"]), path)
+    return {(query, top_k, match): response for query, response in table["results"].items()}
+
+
+# ─────────────────────────────────────────────
+# WARMUP
+# ─────────────────────────────────────────────
+# A fresh worker is slow on its first queries: nothing is cached, and the
+# positions file hasn't been paged in yet.  After the background load (see
+# start_background_load), the WARMUP_QUERIES most frequent queries of the
+# query log (querylog.py) are replayed through search(), filling the plan and
+# result caches (and each frequent term's tier bound), and their terms'
+# positions are read once so phrase queries on them don't fault pages in.
+# /ready reports "warming" until that is done.
+
+WARMUP_QUERIES = int(os.environ.get("WARMUP_QUERIES", "200"))  # 0: no warmup
+_POSITIONS_PER_PAGE = mmap.PAGESIZE // 4
+
+_warming = threading.Event()  # set while the background load is still warming up
+
+
+def _touch_positions(term_ids) -> int:
+    """Reads one position per page of these terms' positions → pages touched."""
+    pages = 0
+    for term_id in term_ids:
+        positions = _entries[term_id].positions
+        if positions is not None and len(positions):
+            touched = positions[::_POSITIONS_PER_PAGE]
+            sum(touched)  # reading them is what faults the pages in
+            pages += len(touched)
+    return pages
+
+
+def warmup(queries: list[str], top_k: int = TOP_K, match: str = "all") -> dict:
+    """Replays queries (no AI summary) to warm the caches → what was done."""
+    start = time.perf_counter()
+    _ensure_loaded()
+    term_ids = set()
+    for i, raw in enumerate(queries):
+        search(raw, top_k=top_k, include_summary=False, match=match)
+        query, _ = compile_query(raw)
+        terms = query.phrase_tokens if query.mode == "phrase" else _batch_terms([query])
+        term_ids.update(t for term in terms for t in _expand_term(term))
+        _load_status["warmed"] = i + 1
+    report = {
+        "queries": len(queries),
+        "positions_pages": _touch_positions(term_ids),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    metrics.set_gauge("warmup_seconds", report["seconds"])
+    logger.info(
+        "Warmed up with %d queries (%d position pages) in %.2fs",
+        report["queries"],
+        report["positions_pages"],
+        report["seconds"],
+    )
+    return report
+
+
+# ─────────────────────────────────────────────
+# INTRA-QUERY PARALLELISM
+# ─────────────────────────────────────────────
+# Queries touching a lot of postings (many terms, very common terms, wide
+# wildcards) are split by doc-id range.  Each range is scored by its own
+# thread with NumPy kernels, which release the GIL, so the ranges really run
+# on separate cores.  Every range returns its own top_k and the partial lists
+# are merged.  Smaller queries stay on the plain single-threaded scorers.
+#
+# Postings are turned into sorted NumPy columns (doc ids, body tf, title tf)
+# the first time a term is used here, and cached per term id in an LRU bounded
+# by TERM_COLUMNS_MB (24 bytes a posting).  NumPy is optional: without it
+# every query takes the single-threaded path.
+
+INTRA_QUERY_WORKERS = os.cpu_count() or 1
+INTRA_QUERY_MIN_POSTINGS = 200_000  # below this, the plain scorers are faster
+TERM_COLUMNS_MB = float(os.environ.get("TERM_COLUMNS_MB", "256"))  # column cache size (0: off)
+
+_np = None  # numpy module once imported, False if it isn't installed
+_range_pool = None  # (pid, ThreadPoolExecutor) — recreated after a fork
+_term_columns = OrderedDict()  # term id → (doc ids, body tf, title tf) NumPy columns
+_term_columns_lock = threading.Lock()
+_term_columns_bytes = 0
+_doc_columns = None  # {field: lengths} NumPy columns indexed by doc id
+
+
+def _numpy():
+    global _np
+    if _np is None:
+        try:
+            import numpy
+
+            _np = numpy
+        except ImportError:
+            logger.warning("numpy not installed: no intra-query parallelism or semantic search")
+            _np = False
+    return _np
+
+
+def _query_postings(terms: list[str]) -> int:
+    """Number of postings scoring these terms would walk."""
+    return sum(_entries[t].doc_freq for term in terms for t in _expand_term(term))
+
+
+def use_parallel(query: Query) -> bool:
+    if INTRA_QUERY_WORKERS < 2 or query.mode == "phrase":
+        return False
+    terms = query.terms if query.mode == "simple" else _collect_leaf_terms(query.boolean_ast)
+    return _query_postings(terms) >= INTRA_QUERY_MIN_POSTINGS and bool(_numpy())
+
+
+def _columns(postings: Postings, term_id: int | None = None):
+    """NumPy columns of a postings list (cached when it is a dictionary term)."""
+    global _term_columns_bytes
+    if term_id is not None:
+        with _term_columns_lock:
+            columns = _term_columns.get(term_id)
+            if columns is not None:
+                _term_columns.move_to_end(term_id)
+                return columns
+    np = _np
+    # The array('I') columns are already sorted by doc id: just widen them
+    docs = np.frombuffer(postings.docs, dtype=np.uint32).astype(np.int64)
+    body = np.frombuffer(postings.tf, dtype=np.uint32).astype(np.float64)
+    if postings.title_tf is None:
+        title = np.zeros(len(docs))
+    else:
+        title = np.frombuffer(postings.title_tf, dtype=np.uint32).astype(np.float64)
+    columns = (docs, body, title)
+    size = sum(column.nbytes for column in columns)
+    if term_id is not None and size <= TERM_COLUMNS_MB * 1024 * 1024:
+        with _term_columns_lock:
+            if term_id not in _term_columns:
+                _term_columns[term_id] = columns
+                _term_columns_bytes += size
+            while _term_columns_bytes > TERM_COLUMNS_MB * 1024 * 1024:
+                _term_columns_bytes -= sum(column.nbytes for column in _term_columns.popitem(last=False)[1])
+    return columns
+
+
+def _ensure_doc_columns():
+    global _doc_columns
+    if _doc_columns is None:
+        _doc_columns = {
+            field: _np.array(lengths, dtype=_np.float64)
+            for field, (_, lengths, _) in _field_stats.items()
+        }
+    return _doc_columns
+
+
+def _clause_columns(query_term: str) -> tuple[tuple[str, ...], list]:
+    """One query term → (fields, [(doc ids, body tf, title tf, idf * weight), ...])."""
+    num_docs = _index_cache["metadata"]["num_docs"]
+    fields, term = _split_field(query_term)
+    term_id = _term_id(term)
+    if term_id is not None:
+        term_ids = [term_id]
+    elif "*" in term:
+        term_ids = [None]  # merged virtual entry, not cached
+    else:
+        term_ids = [t for t, _ in expand_fuzzy(term)]
+
+    parts = []
+    for term_id, (postings, weight) in zip(term_ids, _resolve_term(term)):
+        idf = _bm25_idf(postings.doc_freq, num_docs) * weight
+        parts.append((*_columns(postings, term_id), idf))
+    return fields, parts
+
+
+def _range_bm25f(parts_fields, lo: int, hi: int):
+    """
+    Vectorised BM25F over one doc-id range.
+    Returns (score per doc in [lo, hi), per-clause match masks).
+    """
+    np = _np
+    lengths = _doc_columns
+    scores = np.zeros(hi - lo)
+    clause_masks = []
+    for fields, parts in parts_fields:
+        matched = np.zeros(hi - lo, dtype=bool)
+        for docs, body_tf, title_tf, idf in parts:
+            start, end = np.searchsorted(docs, (lo, hi))
+            if start == end:
+                continue
+            ids = docs[start:end]
+            pseudo_tf = np.zeros(end - start)
+            for field, tf in (("body", body_tf), ("title", title_tf)):
+                if field in fields and field in lengths:
+                    b = FIELD_B[field]
+                    avg_length = _field_stats[field][2]
+                    norm = 1 - b + b * lengths[field][ids] / avg_length
+                    pseudo_tf += FIELD_WEIGHTS[field] * tf[start:end] / norm
+            contribution = idf * pseudo_tf * (BM25_K1 + 1) / (pseudo_tf + BM25_K1)
+            scores[ids - lo] += contribution
+            matched[ids - lo] |= contribution > 0
+        clause_masks.append(matched)
+    return scores, clause_masks
+
+
+def _range_boolean(node, lo: int, hi: int, cache: dict):
+    """Boolean AST → match mask over doc ids [lo, hi)."""
+    if isinstance(node, Term):
+        _, masks = _range_bm25f([cache[node.term]], lo, hi)
+        return masks[0]
+    if isinstance(node, Not):
+        return ~_range_boolean(node.operand, lo, hi, cache)
+    left = _range_boolean(node.left, lo, hi, cache)
+    right = _range_boolean(node.right, lo, hi, cache)
+    return (left & right) if node.op == "AND" else (left | right)
+
+
+def _score_range(query: Query, clauses: dict, conjunctive: bool, lo: int, hi: int, top_k: int):
+    """Scores one doc-id range → (its top_k [(doc id, score)], its match count)."""
+    np = _np
+    terms = query.terms if query.mode == "simple" else _collect_leaf_terms(query.boolean_ast)
+    if conjunctive:
+        terms = dict.fromkeys(terms)  # score_simple counts repeats, score_conjunctive doesn't
+    scores, masks = _range_bm25f([clauses[t] for t in terms], lo, hi)
+
+    hit = scores > 0
+    if query.mode == "boolean":
+        hit &= _range_boolean(query.boolean_ast, lo, hi, clauses)
+    elif conjunctive:
+        for mask in masks:
+            hit &= mask
+
+    candidates = np.flatnonzero(hit)
+    total = len(candidates)
+    if total > top_k:
+        candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+    return [(lo + int(i), float(scores[i])) for i in candidates], total
+
+
+def score_parallel(query: Query, top_k: int, conjunctive: bool = False):
+    """
+    Scores a simple or boolean query over INTRA_QUERY_WORKERS doc-id ranges
+    in parallel.  Unlike the other scorers it only returns the top_k:
+    ([(doc id, score), ...] sorted descending, total number of matches).
+    """
+    global _range_pool
+    _ensure_loaded()
+    _ensure_doc_columns()
+    num_docs = len(_doc_ids)
+
+    terms = query.terms if query.mode == "simple" else _collect_leaf_terms(query.boolean_ast)
+    clauses = {term: _clause_columns(term) for term in dict.fromkeys(terms)}
+
+    if _range_pool is None or _range_pool[0] != os.getpid():
+        _range_pool = (os.getpid(), ThreadPoolExecutor(max_workers=INTRA_QUERY_WORKERS))
+    step = -(-num_docs // INTRA_QUERY_WORKERS)  # ceil division
+    futures = [
+        _range_pool[1].submit(
+            _score_range, query, clauses, conjunctive, lo, min(lo + step, num_docs), top_k
+        )
+        for lo in range(0, num_docs, step)
+    ]
+    partials = [future.result() for future in futures]
+
+    merged = heapq.nlargest(
+        top_k, (hit for hits, _ in partials for hit in hits), key=lambda x: (x[1], -x[0])
+    )
+    return merged, sum(total for _, total in partials)
+
+
+# ─────────────────────────────────────────────
+# HYBRID SEARCH
+# ─────────────────────────────────────────────
+# An index built with dense vectors (indexer.build_dense: LSA doc vectors +
+# IVF lists in index.vectors) also finds docs by meaning.  Simple queries
+# then fuse two rankings:
+#
+#   keyword   the usual BM25 (+ rerank) ranking, its top HYBRID_CANDIDATES
+#   semantic  the HYBRID_CANDIDATES docs whose vectors are nearest the
+#             query's (cosine), over the DENSE_PROBES IVF lists nearest it
+#
+# by reciprocal rank fusion: score = Σ 1 / (HYBRID_RRF_K + rank) over the
+# rankings a doc is in.  A doc high in both comes first, and a doc with none
+# of the terms can still make the results, so "total" (keyword matches) may
+# be lower than the count.  Queries without keyword matches, and queries with
+# a term restricted to titles (the doc vectors can't tell fields apart), are
+# keyword-only.  Only the keyword top_k is exact on tier 1 (see
+# RERANKING).  index.vectors is memory-mapped like index.positions; with
+# numpy missing or HYBRID_SEARCH=0 queries are keyword-only.
+HYBRID_SEARCH = os.environ.get("HYBRID_SEARCH", "1") != "0"
+HYBRID_CANDIDATES = 50  # docs taken from each ranking
+HYBRID_RRF_K = 60  # rank damping of reciprocal rank fusion
+DENSE_PROBES = int(os.environ.get("DENSE_PROBES", "32"))  # IVF lists scored per query
+
+_dense = None  # (term vectors, centroids, doc ids, doc vectors, offsets), see _map_vectors
+
+
+def _map_vectors(path: str, dense: dict | None) -> tuple | None:
+    """
+    NumPy views of the blocks of index.vectors (read-only memory map), None
+    if the index has no vectors or numpy isn't installed.
+    """
+    if dense is None:
+        return None
+    np = _numpy()
+    if not np:
+        return None
+    dims, lists, offsets = dense["dims"], dense["lists"], dense["offsets"]
+    num_docs = offsets[-1]
+    with open(vectors_path(path), "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    layout = (
+        ("<f4", len(_sorted_terms), dims),  # term vectors
+        ("<f4", lists, dims),  # centroids
+        ("<u4", num_docs, 1),  # doc ids
+        ("<f4", num_docs, dims),  # doc vectors
+    )
+    blocks, at = [], 0
+    for dtype, rows, width in layout:
+        block = np.frombuffer(buffer, dtype, rows * width, at)
+        blocks.append(block if width == 1 else block.reshape(rows, width))
+        at += 4 * rows * width
+    logger.info("Dense vectors mapped: %d dims, %d IVF lists", dims, lists)
+    return (*blocks, offsets)
+
+
+def dense_search(query: Query, n: int, probes: int | None = None) -> list[tuple[int, float]]:
+    """The n docs nearest the query's vector (cosine over the probed IVF lists), best first."""
+    np = _numpy()
+    term_vectors, centroids, docs, doc_vectors, offsets = _dense
+    num_docs = _index_cache["metadata"]["num_docs"]
+    term_ids = list(dict.fromkeys(t for term in query.terms for t in _expand_term(term)))
+    if not term_ids:
+        return []
+    idf = np.array([_bm25_idf(_entries[t].doc_freq, num_docs) for t in term_ids], np.float32)
+    vector = idf @ term_vectors[term_ids]
+    if not vector.any():
+        return []
+
+    probes = min(probes or DENSE_PROBES, len(centroids))
+    nearest = np.argpartition(centroids @ -vector, probes - 1)[:probes]
+    candidates = np.concatenate([docs[offsets[l] : offsets[l + 1]] for l in nearest])
+    scores = np.concatenate(
+        [doc_vectors[offsets[l] : offsets[l + 1]] @ vector for l in nearest]
+    ) / np.linalg.norm(vector)
+    if len(scores) > n:
+        top = np.argpartition(-scores, n - 1)[:n]
+        candidates, scores = candidates[top], scores[top]
+    order = np.argsort(-scores, kind="stable")
+    return list(zip(candidates[order].tolist(), scores[order].tolist()))
+
+
+def fuse_rrf(rankings: list[list[tuple[int, float]]], top_k: int) -> list[tuple[int, float]]:
+    """Reciprocal rank fusion of rankings (best first each) → the top_k, best first."""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, (doc, _) in enumerate(ranking, 1):
+            fused[doc] += 1 / (HYBRID_RRF_K + rank)
+    return heapq.nlargest(top_k, fused.items(), key=itemgetter(1))
+
+
+# ─────────────────────────────────────────────
+# DUPLICATE COLLAPSING
+# ─────────────────────────────────────────────
+# The indexer clusters near-duplicate pages (indexer.NearDuplicates), and a
+# cluster is shown once: as its best-ranked doc, with "duplicates" counting
+# the docs of its cluster ranked below it.  A result that isn't its
+# cluster's canonical doc says which one is in "duplicate_of", so the shard
+# coordinator can collapse clusters spread over shards the same way.  To
+# still fill top_k, up to top_k more results are ranked before collapsing
+# (never more than the index has near-duplicates).
+COLLAPSE_DUPLICATES = os.environ.get("COLLAPSE_DUPLICATES", "1") != "0"
+
+
+def collapse_slack(top_k: int) -> int:
+    """Extra results to rank so top_k are left once duplicates are collapsed."""
+    return min(top_k, len(_duplicate_of)) if COLLAPSE_DUPLICATES else 0
+
+
+def collapse_duplicates(ranked: list, top_k: int, cluster) -> list[tuple]:
+    """
+    The first top_k items of ranked (best first) of distinct clusters, each
+    as (item, the items of its cluster ranked below it).  cluster: item →
+    its cluster key.
+    """
+    kept, position = [], {}
+    for item in ranked:
+        key = cluster(item)
+        if key in position:
+            kept[position[key]][1].append(item)
+        elif len(kept) < top_k:
+            position[key] = len(kept)
+            kept.append((item, []))
+    return kept
 
 
 # ─────────────────────────────────────────────
@@ -845,12 +3113,14 @@ def score_boolean(ast: dict) -> list[tuple[str, float]]:
 
 
 def generate_snippet(
-    text: str, query_terms: list[str], max_len: int = SNIPPET_LENGTH
+    text: str, query_terms: list[str], max_len: int = SNIPPET_LENGTH, stems: frozenset = frozenset()
 ) -> str:
     """
     Finds the sentence / region containing the first raw (un-stemmed) term hit,
     returns a trimmed window of ≤ max_len chars with **bold** highlights.
-    Falls back to the opening of the text if no term is found.
+    stems are dictionary terms (wildcard / typo expansions): words stemming to
+    one of them are hits too.  Falls back to the opening of the text if no
+    term is found.
     """
     lower = text.lower()
 
@@ -860,6 +3130,11 @@ def generate_snippet(
         idx = lower.find(term.lower())
         if idx != -1 and idx < best_pos:
             best_pos = idx
+    if stems:
+        for token, offset in zip(*tokenize_with_offsets(text[:best_pos])):
+            if token in stems:
+                best_pos = offset
+                break
 
     # Centre a window around the hit
     half = max_len // 2
@@ -884,6 +3159,18 @@ def generate_snippet(
             continue  # skip single-char noise like "a"
         pattern = re.compile(r"\b" + re.escape(term) + r"\b", re.IGNORECASE)
         window = pattern.sub(lambda m: f"**{m.group()}**", window)
+    if stems:
+        parts = []
+        cursor = 0
+        for token, offset in zip(*tokenize_with_offsets(window)):
+            if token not in stems or window[max(0, offset - 2):offset] == "**":
+                continue  # not an expansion, or already highlighted
+            token_end = offset
+            while token_end < len(window) and window[token_end] in _TOKEN_CHARS:
+                token_end += 1
+            parts += [window[cursor:offset], "**", window[offset:token_end], "**"]
+            cursor = token_end
+        window = "".join(parts) + window[cursor:]
 
     # Add ellipsis if we trimmed
     if start > 0:
@@ -894,6 +3181,96 @@ def generate_snippet(
     return window
 
 
+# Snippets from stored token offsets
+# The index keeps the character offset of every body token, and postings keep
+# token positions, so all query-term hits in a doc are known without touching
+# the text.  The window with the most distinct terms (then most hits) wins;
+# highlighting is plain string slicing.
+
+_TOKEN_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789")
+
+
+def generate_snippet_from_offsets(
+    text: str, doc: int, term_ids: list[int], max_len: int = SNIPPET_LENGTH
+) -> str:
+    """
+    Builds a ≤ max_len char snippet around the densest cluster of query-term
+    hits in doc, with **bold** highlights.  term_ids are dictionary terms
+    (see _expand_term).  Falls back to the opening of the text if none hit.
+    """
+    offsets = _token_offsets[doc]
+
+    # (char offset, term number) for every hit, in text order
+    hits = []
+    for n, term_id in enumerate(term_ids):
+        postings = _entries[term_id]
+        i = postings.find(doc)
+        if i >= 0:
+            hits.extend((offsets[pos], n) for pos in postings.positions_of(i))
+    hits.sort()
+
+    # Slide a window over the hits (spanning at most half a snippet, so there
+    # is context around them): most distinct terms first, then most hits
+    hit_offsets = [offset for offset, _ in hits]
+    counts = [0] * len(term_ids)
+    distinct = left = 0
+    best_distinct = best_count = best_left = best_right = 0
+    for right, (offset, n) in enumerate(hits):
+        if not counts[n]:
+            distinct += 1
+        counts[n] += 1
+        while offset - hit_offsets[left] > max_len // 2:
+            counts[hits[left][1]] -= 1
+            if not counts[hits[left][1]]:
+                distinct -= 1
+            left += 1
+        if distinct > best_distinct or (
+            distinct == best_distinct and right - left >= best_count
+        ):
+            best_distinct, best_count = distinct, right - left + 1
+            best_left, best_right = left, right
+
+    if hits:
+        span_start, span_end = hit_offsets[best_left], hit_offsets[best_right]
+        slack = max_len - (span_end - span_start)
+        start = max(0, span_start - slack // 3)  # a little context before the hits
+    else:
+        span_start = span_end = start = 0
+    end = min(len(text), start + max_len)
+    start = max(0, min(start, end - max_len))
+
+    # Trim to word boundaries, never past the first / last hit
+    if start > 0:
+        space = text.find(" ", start, span_start)
+        if space != -1:
+            start = space + 1
+    if end < len(text):
+        space = text.rfind(" ", span_end, end)
+        if space != -1:
+            end = space
+
+    # Highlight each hit inside the window
+    parts = []
+    cursor = start
+    for offset, _ in hits:
+        if offset < cursor or offset >= end:
+            continue
+        token_end = offset
+        while token_end < end and text[token_end] in _TOKEN_CHARS:
+            token_end += 1
+        parts.append(text[cursor:offset])
+        parts.append(f"**{text[offset:token_end]}**")
+        cursor = token_end
+    parts.append(text[cursor:end])
+    window = "".join(parts)
+
+    if start > 0:
+        window = "..." + window
+    if end < len(text):
+        window = window + "..."
+    return window
+
+
 # ─────────────────────────────────────────────
 # AI SUMMARY GENERATION (using Groq API)
 # ─────────────────────────────────────────────
@@ -953,9 +3330,24 @@ def generate_ai_summary(query: str, top_results: list[dict]) -> str:
 # ─────────────────────────────────────────────
 
 
-def search(raw_query: str, top_k: int = TOP_K, include_summary: bool = True) -> dict:
+def search(
+    raw_query: str,
+    top_k: int = TOP_K,
+    include_summary: bool = True,
+    match: str = "all",
+    explain: bool = False,
+    cursor: str | None = None,
+    offset: int = 0,
+) -> dict:
     """
-    Public API.  Takes a raw query string, returns a dict with results and optional AI summary:
+    Public API.  Takes a raw query string, returns a dict with results and optional AI summary.
+    match="all" runs simple multi-term queries conjunctively (every term must
+    match), falling back to "any" (OR) when that yields fewer than top_k docs.
+    explain=True adds the query plan with its estimated costs (explain_query).
+    Repeated queries are answered from the result cache (see RESULT CACHE).
+    A full page has a "next_cursor": passed back as cursor, it returns the
+    next top_k results (offset skips that many instead, see PAGINATION);
+    later pages have no AI summary.  CursorError for a cursor of another query.
         {
             "query": "...",
             "count": 5,
@@ -971,56 +3363,588 @@ def search(raw_query: str, top_k: int = TOP_K, include_summary: bool = True) ->
                 ...
             ],
             "ai_summary": "..." (optional, if include_summary=True and API configured)
+            "plan": {...} (optional, if explain=True)
+            "next_cursor": "..." (if there may be more results)
         }
     """
+    start = time.perf_counter()
     _ensure_loaded()
-    query = parse_query(raw_query)
+    if cursor is not None:
+        seen, score, doc_id = decode_cursor(cursor, raw_query, match)
+        response = _search_page(raw_query, top_k, match, seen, (score, doc_id))
+    elif offset:
+        response = _search_page(raw_query, top_k, match, offset)
+    else:
+        key = (normalize_query(raw_query), top_k, match)
+        response = _cached_response(key)
+        if response is None:
+            with metrics.timer("parse"):
+                query, resolved = compile_query(raw_query)
+            token = _term_memo.set(dict(resolved))  # copy: wildcards get added per search
+            try:
+                response = _run_query(query, top_k, match)
+            finally:
+                _term_memo.reset(token)
+            if not response.get("over_budget"):
+                _cache_response(key, response)
+        response["query"] = raw_query
+        if response["count"] == top_k and top_k:
+            last = response["results"][-1]
+            response["next_cursor"] = encode_cursor(
+                raw_query, match, top_k, last["score"], last["doc_id"]
+            )
+    if explain:
+        response["plan"] = explain_query(compile_query(raw_query)[0], match)
+
+    # ── Add AI summary if requested ───────────────────────
+    if include_summary and response["results"] and cursor is None and not offset:
+        with metrics.timer("summary"):
+            summary = generate_ai_summary(raw_query, response["results"])
+        if summary:
+            response["ai_summary"] = summary
+
+    metrics.observe("search_seconds", time.perf_counter() - start)
+    return response
+
+
+def _run_query(query: Query, top_k: int, match: str, round_scores: bool = True) -> dict:
+    """
+    Scores a parsed query and formats its top_k results (no AI summary).
+    match is "all", "any", or "strict" (all terms, never fall back to OR —
+    used by shards, where the fallback has to be decided globally).
+    Shards also keep exact scores so the coordinator can merge ties correctly.
+    """
+    metrics.inc("search_queries_total", mode=query.mode)
+    start = time.perf_counter()
+
+    # ── Resolve terms to postings (dictionary, wildcard, fuzzy) ──
+    # Only done up front when a memo keeps the result for the scorers
+    if _term_memo.get() is not None:
+        with metrics.timer("candidates"):
+            touched = sum(
+                len(postings)
+                for term in _batch_terms([query])
+                for postings, _ in _resolve_term(term)
+            )
+        metrics.inc("search_postings_touched_total", touched)
+
+    sizes = _stage_sizes(query, top_k)
+    scored, total = _retrieve(query, top_k, match, sizes)
+
+    # ── Keep the top_k (scorers return every match, unsorted) ──
+    with metrics.timer("topk"):
+        top = heapq.nlargest(sizes[-1], scored, key=lambda x: x[1])
+
+    over_budget = set()
+    token = _over_budget.set(over_budget)
+    try:
+        ranked = _final_ranking(query, top, top_k, sizes, start)
+    finally:
+        _over_budget.reset(token)
+    results = _format_results(query, ranked, round_scores)
+    response = {
+        "query": query.raw,
+        "count": len(results),
+        "total": len(scored) if total is None else total,
+        "results": results
+    }
+    if over_budget:
+        response["over_budget"] = sorted(over_budget)  # partly reranked: not to be cached
+    return response
+
+
+def _retrieve(query: Query, top_k: int, match: str, sizes: tuple) -> tuple:
+    """
+    First stage: routes query to the right scorer → (scored, total).  total
+    is None when scored holds every match; the tiered and parallel scorers
+    only return the top `depth` (see _stage_sizes).
+    """
+    _, plan, shown, _, depth = sizes
+    total = None
+    with metrics.timer("scoring"):
+        tiered = None
+        if query.mode == "simple":
+            tiered = score_tiered(query, top_k, match, depth, shown, rerank_boost(plan))
+        if tiered is not None:
+            scored, total = tiered
+        elif query.mode != "phrase" and use_parallel(query):
+            scored = None
+            if query.mode == "simple" and match != "any" and len(query.terms) > 1:
+                scored, total = score_parallel(query, depth, conjunctive=True)
+                if match == "all" and total < top_k:
+                    logger.info("Only %d docs match all terms, falling back to OR", total)
+                    scored = None
+            if scored is None:
+                scored, total = score_parallel(query, depth)
+        else:
+            scored = _all_matches(query, top_k, match)
+    return scored, total
+
+
+def _all_matches(query: Query, top_k: int, match: str) -> list[tuple[int, float]]:
+    """Every doc matching query with its score, unsorted (single-threaded scorers)."""
+    if query.mode == "phrase":
+        term_ids = {_term_id(t) for t in query.phrase_tokens} - {None}
+        metrics.inc("search_postings_touched_total", sum(_entries[t].doc_freq for t in term_ids))
+        return score_phrase(query.phrase_tokens)
+    if query.mode == "boolean":
+        return score_boolean(query.boolean_ast, query.plan)
+    if match != "any" and len(query.terms) > 1:
+        scored = score_conjunctive(query.terms)
+        if match != "all" or len(scored) >= top_k:
+            return scored
+        logger.info("Only %d docs match all terms, falling back to OR", len(scored))
+    return score_simple(query.terms)
+
+
+def _stage_sizes(query: Query, top_k: int) -> tuple:
+    """
+    How many results each stage keeps for top_k of them → (hybrid, rerank
+    plan, shown, keep, depth).
+    """
+    hybrid = (
+        _dense is not None
+        and HYBRID_SEARCH
+        and query.mode == "simple"
+        # doc vectors mix titles into the body: they can't honour "title:"
+        and all("body" in _split_field(term)[0] for term in query.terms)
+    )
+    shown = top_k + collapse_slack(top_k)  # results ranked before duplicates are collapsed
+    keep = max(shown, HYBRID_CANDIDATES) if hybrid else shown  # keyword results kept
+    plan = rerank_plan(query)
+    depth = max(keep, RERANK_CANDIDATES) if plan else keep  # retrieval results kept
+    return hybrid, plan, shown, keep, depth
 
-    # ── Route to the right scorer ─────────────────────────
+
+def _final_ranking(
+    query: Query, top: list, top_k: int, sizes: tuple, start: float, keep_all: bool = False
+) -> list:
+    """
+    Retrieval's best (see _stage_sizes) reranked, fused and collapsed → the
+    top_k as ((doc, score), the docs collapsed into it).  keep_all: rank
+    every candidate instead, the top_k staying the same (see PAGINATION).
+    """
+    hybrid, plan, shown, keep, _ = sizes
+    if keep_all:
+        shown = keep = top_k = len(top)
+
+    # ── Second stage: rerank the candidates ──────────────
+    if plan:
+        if RETRIEVAL_BUDGET_MS and time.perf_counter() - start > RETRIEVAL_BUDGET_MS / 1000:
+            _note_over_budget("retrieval")
+            top = top[:keep]
+        else:
+            top = rerank(plan, top, keep)
+
+    # ── Fuse with the nearest docs by meaning (see HYBRID SEARCH) ──
+    if hybrid and top:  # no keyword match: nothing for the dense list to add to
+        keyword_keep = sizes[3]  # fused as in the top_k ranking; the rest follow
+        with metrics.timer("dense"):
+            fused = fuse_rrf(
+                [top[:keyword_keep], dense_search(query, HYBRID_CANDIDATES)],
+                keyword_keep + HYBRID_CANDIDATES if keep_all else shown,
+            )
+        if keep_all:
+            in_fused = {doc for doc, _ in fused}
+            fused += [item for item in top[keyword_keep:] if item[0] not in in_fused]
+        top = fused
+
+    # ── One result per near-duplicate cluster (see DUPLICATE COLLAPSING) ──
+    if collapse_slack(top_k):
+        top = collapse_duplicates(top, len(top) if keep_all else top_k, lambda item: _cluster(item[0]))
+        collapsed = sum(len(dropped) for _, dropped in top)
+        if collapsed:
+            metrics.inc("search_duplicates_collapsed_total", collapsed)
+        return top
+    return [(item, ()) for item in top[:top_k]]
+
+
+def _cluster(doc: int) -> str:
+    """Near-duplicate cluster of a doc: its canonical doc's external id."""
+    return _duplicate_of.get(doc) or _doc_ids[doc]
+
+
+def _format_results(query: Query, ranked: list, round_scores: bool = True, first_rank: int = 1):
+    """Result dicts of ranked ((doc, score), collapsed docs), with snippets."""
     if query.mode == "phrase":
-        scored = score_phrase(query.phrase_tokens)
         raw_terms = query.phrase_tokens  # for snippet highlighting
     elif query.mode == "boolean":
-        scored = score_boolean(query.boolean_ast)
         raw_terms = _collect_leaf_terms(query.boolean_ast)
     else:
-        scored = score_simple(query.terms)
         raw_terms = query.terms
 
-    # ── Build result dicts ────────────────────────────────
-    # Also keep the original (un-stemmed) words for snippet highlighting
-    original_words = re.findall(r"[a-z0-9]+", raw_query.lower())
+    with metrics.timer("snippets"):
+        # Also keep the original (un-stemmed) words for snippet highlighting
+        # (field prefixes like "title:" are not words to highlight)
+        unprefixed = re.sub(r"\b(title|body):", " ", query.raw.lower())
+        original_words = re.findall(r"[a-z0-9]+", unprefixed)
+
+        # Dictionary terms for offset-based snippets (wildcards / typos expanded)
+        snippet_terms = list(
+            dict.fromkeys(t for term in raw_terms for t in _expand_term(term))
+        )
+        # ... of which the wildcard / typo expansions, for text snippets
+        expansions = frozenset(
+            _sorted_terms[t]
+            for term in raw_terms if _term_id(_split_field(term)[1]) is None
+            for t in _expand_term(term)
+        )
 
-    results = []
-    for rank, (doc_id, score) in enumerate(scored[:top_k], 1):
-        page = _pages_by_id.get(doc_id, {})
-        snippet = generate_snippet(page.get("text", ""), original_words)
-        results.append(
-            {
+        results = []
+        for rank, ((doc, score), dropped) in enumerate(ranked, first_rank):
+            page = _doc_pages[doc]  # {} for a doc missing from the crawled pages
+            text = page.get("text", "")
+            if text and _token_offsets is not None and _token_offsets[doc] is not None:
+                snippet = generate_snippet_from_offsets(text, doc, snippet_terms)
+            else:
+                snippet = generate_snippet(text, original_words, stems=expansions)
+            result = {
                 "rank": rank,
-                "doc_id": doc_id,
+                "doc_id": _doc_ids[doc],  # back to the external id
                 "title": page.get("title", "Unknown"),
                 "url": page.get("url", ""),
-                "score": round(score, 4),
+                "score": round(score, 4) if round_scores else score,
                 "snippet": snippet,
             }
-        )
+            if doc in _duplicate_of:
+                result["duplicate_of"] = _duplicate_of[doc]
+            if dropped:
+                result["duplicates"] = len(dropped)
+            results.append(result)
+    return results
 
-    response = {
-        "query": raw_query,
-        "count": len(results),
-        "results": results
-    }
-    
-    # ── Add AI summary if requested ───────────────────────
-    if include_summary and results:
-        summary = generate_ai_summary(raw_query, results)
-        if summary:
-            response["ai_summary"] = summary
-    
+
+# ─────────────────────────────────────────────
+# PAGINATION
+# ─────────────────────────────────────────────
+# search() answers the first page; a full page carries a "next_cursor", and
+# search(..., cursor=...) answers the page after it.  Pages go through one
+# ranking per query:
+#
+#   head   every candidate page 1 was ranked from (RERANK_CANDIDATES with
+#          rerankers), ranked the way search() ranks them: reranked, fused,
+#          duplicates collapsed.  Page 1 is its first top_k.
+#   tail   every other match by BM25 alone, best score then lowest doc id
+#          first, one per near-duplicate cluster (none of the head's)
+#
+# The first page after page 1 builds it: the head from page 1's retrieval
+# with nothing cut, the tail as a heap of the remaining matches.  It is kept
+# PAGE_CACHE_SECONDS for the pages after it (LRU of PAGE_CACHE_SIZE queries:
+# a tail holds every match of its query).  A cursor holds how many results
+# were seen and the last one's (score, doc id):
+#
+#   - a head page is a slice of the head
+#   - the next tail page pops top_k entries off the heap; popped entries are
+#     kept in order, so going back a page is a slice too
+#   - a tail page past what was popped (a fresh ranking, or an offset jump)
+#     is a thresholded top-k: the best top_k of the tail ranked after the
+#     cursor's (score, doc id), in one pass
+#
+# so a deep page never re-sorts the results before it.  Cursors are opaque
+# (URL-safe base64 JSON), tied to their query and match mode; ranks stay
+# absolute.
+
+PAGE_CACHE_SIZE = int(os.environ.get("PAGE_CACHE_SIZE", "32"))  # rankings kept (0: off)
+PAGE_CACHE_SECONDS = float(os.environ.get("PAGE_CACHE_SECONDS", "120"))
+
+_page_cache = OrderedDict()  # (query, top_k, match) → _Ranking
+_page_cache_lock = threading.Lock()
+
+
+class _Ranking:
+    """The ranking pages of one query are cut from (see PAGINATION)."""
+
+    def __init__(self, head: list, tail: list, collapsed: dict, total: int):
+        self.head = head  # [((doc, score), collapsed docs)], best first
+        self.tail = tail  # heap of (-score, doc) not popped yet
+        self.collapsed = collapsed  # tail doc → (doc, score) of its cluster left out
+        self.popped = []  # (-score, doc) popped off the tail, in order
+        self.size = len(head) + len(tail)
+        self.total = total
+        self.over_budget = False  # cut short by a time budget: not to be cached
+        self.expires = time.monotonic() + PAGE_CACHE_SECONDS
+        self.lock = threading.Lock()
+
+    def tail_page(self, skip: int, after: tuple | None, count: int) -> list[tuple]:
+        """
+        count (-score, doc) tail entries after the first skip, or after
+        `after` (-score, doc) when given.
+        """
+        with self.lock:
+            if after is not None:
+                if not self.popped or after > self.popped[-1]:
+                    return heapq.nsmallest(count, (entry for entry in self.tail if entry > after))
+                skip = bisect_right(self.popped, after)
+            while len(self.popped) < skip + count and self.tail:
+                self.popped.append(heapq.heappop(self.tail))
+            return self.popped[skip : skip + count]
+
+
+def _build_ranking(query: Query, top_k: int, match: str) -> _Ranking:
+    # Head: page 1's candidates, so page 1 is the head's first top_k
+    start = time.perf_counter()
+    sizes = _stage_sizes(query, top_k)
+    scored, total = _retrieve(query, top_k, match, sizes)
+    with metrics.timer("topk"):
+        top = heapq.nlargest(sizes[-1], scored, key=itemgetter(1))
+    over_budget = set()
+    token = _over_budget.set(over_budget)
+    try:
+        head = _final_ranking(query, top, top_k, sizes, start, keep_all=True)
+    finally:
+        _over_budget.reset(token)
+    if total is not None:  # only the best were scored; the tail needs every match
+        with metrics.timer("scoring"):
+            scored = _all_matches(query, top_k, match)
+
+    in_head = set()
+    for (doc, _), collapsed in head:
+        in_head.add(doc)
+        in_head.update(d for d, _ in collapsed)
+    tail = [(-score, doc) for doc, score in scored if doc not in in_head]
+    collapsed = {}
+    if collapse_slack(top_k):
+        clusters = defaultdict(list)
+        for entry in tail:
+            clusters[_cluster(entry[1])].append(entry)
+        for doc, _ in head:
+            clusters.pop(_cluster(doc[0]), None)
+        tail = []
+        for members in clusters.values():
+            members.sort()
+            tail.append(members[0])
+            if len(members) > 1:
+                collapsed[members[0][1]] = [(doc, -negated) for negated, doc in members[1:]]
+    heapq.heapify(tail)
+    ranking = _Ranking(head, tail, collapsed, len(scored) if total is None else total)
+    ranking.over_budget = bool(over_budget)
+    return ranking
+
+
+class CursorError(ValueError):
+    """A cursor that is malformed or belongs to another query."""
+
+
+def _cursor_digest(raw_query: str, match: str) -> str:
+    return hashlib.blake2b(f"{normalize_query(raw_query)}\0{match}".encode(), digest_size=6).hexdigest()
+
+
+def encode_cursor(raw_query: str, match: str, seen: int, score: float, doc_id: str) -> str:
+    """Cursor of the page after `seen` results, the last one (score, doc_id)."""
+    payload = json.dumps([seen, score, doc_id, _cursor_digest(raw_query, match)])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, raw_query: str, match: str) -> tuple[int, float, str]:
+    """cursor → (results seen, last score, last doc id); CursorError if it isn't one of query's."""
+    try:
+        seen, score, doc_id, digest = json.loads(
+            base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        )
+    except (ValueError, TypeError) as e:
+        raise CursorError("malformed cursor") from e
+    if digest != _cursor_digest(raw_query, match):
+        raise CursorError("cursor belongs to another query")
+    if not isinstance(seen, int) or seen < 0 or not isinstance(score, (int, float)):
+        raise CursorError("malformed cursor")
+    return seen, score, str(doc_id)
+
+
+def _doc_of(doc_id: str) -> int | None:
+    """External doc id → doc id (binary search of _doc_ids), None if unknown."""
+    if not doc_id.isdigit():
+        return None
+    i = bisect_left(_doc_ids, int(doc_id), key=int)
+    return i if i < len(_doc_ids) and _doc_ids[i] == doc_id else None
+
+
+def _ranking(raw_query: str, query: Query, top_k: int, match: str) -> _Ranking:
+    """The cached ranking of a query, built if it is missing or expired."""
+    key = (normalize_query(raw_query), top_k, match)
+    with _page_cache_lock:
+        ranking = _page_cache.get(key)
+        if ranking is not None and ranking.expires > time.monotonic():
+            _page_cache.move_to_end(key)
+            metrics.inc("page_cache_requests_total", result="hit")
+            return ranking
+    metrics.inc("page_cache_requests_total", result="miss")
+    ranking = _build_ranking(query, top_k, match)
+    if PAGE_CACHE_SIZE and not ranking.over_budget:
+        with _page_cache_lock:
+            _page_cache[key] = ranking
+            _page_cache.move_to_end(key)
+            while len(_page_cache) > PAGE_CACHE_SIZE:
+                _page_cache.popitem(last=False)
+    return ranking
+
+
+def _search_page(raw_query: str, top_k: int, match: str, seen: int, last=None) -> dict:
+    """
+    The top_k results after the first `seen` of the ranking of raw_query
+    (see PAGINATION); last: the (score, doc id) of the last one seen.
+    """
+    with metrics.timer("parse"):
+        query, resolved = compile_query(raw_query)
+    token = _term_memo.set(dict(resolved))
+    try:
+        ranking = _ranking(raw_query, query, top_k, match)
+    finally:
+        _term_memo.reset(token)
+
+    page = ranking.head[seen : seen + top_k]
+    if len(page) < top_k:
+        skip = max(0, seen - len(ranking.head))
+        after = None
+        if skip and last is not None and _doc_of(last[1]) is not None:
+            after = (-last[0], _doc_of(last[1]))
+        page += [
+            ((doc, -negated), ranking.collapsed.get(doc, ()))
+            for negated, doc in ranking.tail_page(skip, after, top_k - len(page))
+        ]
+    results = _format_results(query, page, first_rank=seen + 1)
+    response = {"query": raw_query, "count": len(results), "total": ranking.total, "results": results}
+    if page and seen + len(page) < ranking.size:
+        (doc, score), _ = page[-1]
+        response["next_cursor"] = encode_cursor(
+            raw_query, match, seen + len(page), score, _doc_ids[doc]
+        )
     return response
 
 
+# ─────────────────────────────────────────────
+# BATCH SEARCH
+# ─────────────────────────────────────────────
+# For offline evaluation / federated callers sending thousands of queries:
+#   1. every query is parsed up front (identical query strings run once)
+#   2. every distinct term of the batch is resolved once (wildcard merges,
+#      fuzzy expansions, postings lookups) and reused by all of its queries
+#   3. queries are split into chunks, scored in this process (the default,
+#      BATCH_WORKERS=1) or on BATCH_WORKERS worker processes
+#   4. responses are yielded in input order as their chunk completes
+#
+# Worker processes cost memory: each loads its own copy of the index, so a
+# server holds (app workers) × BATCH_WORKERS × (index size) on top of its own
+# copies, and the first batch waits for every worker's cold load.  They only
+# pay off for offline runs of many thousands of queries on a spare machine.
+# Workers come from a forkserver (spawn where there is none), never forked
+# from this process: it runs threads (index loader, query log, range pool)
+# whose locks a fork could copy held.  The pool lives until exit.  Resolved
+# postings don't cross processes: a worker resolves each term at most once
+# per batch, keeping the memo of the last batch it served.  Workers read
+# their settings from the environment, like any fresh process.
+
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "1"))  # worker processes, 1: inline
+BATCH_CHUNK_SIZE = 64  # queries per worker task
+
+_batch_pool = None  # ProcessPoolExecutor, created on the first parallel batch
+_batch_memo = (None, None)  # in a worker: (batch id, term memo) of the last batch
+_batch_ids = count()
+
+
+def _batch_terms(queries: list[Query]) -> set[str]:
+    """Every distinct term _resolve_term will be asked for by these queries."""
+    terms = set()
+    for query in queries:
+        if query.mode == "boolean":
+            query_terms = _collect_leaf_terms(query.boolean_ast)
+        elif query.mode == "simple":
+            query_terms = query.terms
+        else:
+            continue  # phrase search reads the index directly
+        terms.update(_split_field(t)[1] for t in query_terms)
+    return terms
+
+
+def _search_chunk(queries: list[Query], top_k: int, match: str, memo: dict) -> list[dict]:
+    """Runs one chunk of a batch with the batch's term memo."""
+    token = _term_memo.set(memo)
+    try:
+        return [_run_query(query, top_k, match) for query in queries]
+    finally:
+        _term_memo.reset(token)
+
+
+def _init_batch_worker(index_file: str, pages_file: str):
+    global INDEX_FILE, CRAWLED_DATA_FILE
+    INDEX_FILE, CRAWLED_DATA_FILE = index_file, pages_file
+    _ensure_loaded()
+
+
+def _search_worker_chunk(batch: int, queries: list[Query], top_k: int, match: str) -> list[dict]:
+    """_search_chunk in a batch worker, with the memo of its current batch."""
+    global _batch_memo
+    if _batch_memo[0] != batch:
+        _batch_memo = (batch, {})  # the last batch's postings are let go
+    return _search_chunk(queries, top_k, match, _batch_memo[1])
+
+
+def _batch_pool_for(workers: int):
+    global _batch_pool
+    if _batch_pool is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        _batch_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_batch_worker,
+            initargs=(INDEX_FILE, CRAWLED_DATA_FILE),
+        )
+        atexit.register(_batch_pool.shutdown)
+    return _batch_pool
+
+
+def search_many(
+    raw_queries: list[str],
+    top_k: int = TOP_K,
+    match: str = "all",
+    workers: int = BATCH_WORKERS,
+):
+    """
+    Public batch API.  Yields one response dict per query (same shape as
+    search(), without AI summaries), in input order, as soon as it is ready.
+    """
+    _ensure_loaded()
+
+    unique = list(dict.fromkeys(raw_queries))
+    parsed = [parse_query(raw) for raw in unique]
+    chunks = [
+        parsed[i : i + BATCH_CHUNK_SIZE] for i in range(0, len(parsed), BATCH_CHUNK_SIZE)
+    ]
+    logger.info(
+        "Batch: %d queries (%d unique) in %d chunks", len(raw_queries), len(unique), len(chunks)
+    )
+
+    if workers > 1 and len(chunks) > 1:
+        pool, batch = _batch_pool_for(workers), next(_batch_ids)
+        pending = [pool.submit(_search_worker_chunk, batch, c, top_k, match) for c in chunks]
+        chunk_results = (future.result() for future in pending)
+    else:
+        memo = {}
+        token = _term_memo.set(memo)
+        try:
+            for term in _batch_terms(parsed):
+                _resolve_term(term)  # fetch each postings list once for the whole batch
+        finally:
+            _term_memo.reset(token)
+        chunk_results = (_search_chunk(c, top_k, match, memo) for c in chunks)
+
+    # Map results back onto the original order (duplicates included)
+    done = {}
+    position = 0
+    completed = 0
+    for responses in chunk_results:
+        for response in responses:
+            response["query"] = unique[completed]
+            done[unique[completed]] = response
+            completed += 1
+        while position < len(raw_queries) and raw_queries[position] in done:
+            yield done[raw_queries[position]]
+            position += 1
+
+
 def print_results(results: list[dict]):
     """Pretty-prints a result list to the terminal."""
     if not results:
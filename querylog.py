@@ -0,0 +1,188 @@
+import os
+import re
+import json
+import time
+import atexit
+import logging
+import argparse
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+# QUERY LOG
+#
+# Which queries users run, so a fresh worker can warm itself with the most
+# popular ones (query_engine.warmup) and a head-query results table can be
+# built offline (query_engine.build_head_results).  Compact and anonymized by
+# construction:
+#
+#   - only the query text is kept (whitespace collapsed) with a count: no
+#     client address, user, timestamp or request order
+#   - queries that look like they carry personal data (an email address, a
+#     long run of digits) or are longer than MAX_QUERY_LENGTH aren't counted
+#   - a query only reaches QUERY_LOG_FILE once this worker has seen it
+#     QUERY_LOG_MIN_COUNT times: one-off queries never leave memory
+#   - memory and file keep at most QUERY_LOG_MAX_ENTRIES queries each, the
+#     rarest are dropped first
+#
+# app.py counts every /search query; a daemon thread merges the counts into
+# QUERY_LOG_FILE every QUERY_LOG_FLUSH_SECONDS (and at exit).  Workers sharing
+# the file each add their own counts to it under a file lock.
+#
+# File layout: {"query": count, ...}, most frequent first.
+
+QUERY_LOG_FILE = os.environ.get("QUERY_LOG_FILE", "query_log.json")
+QUERY_LOG_ENABLED = os.environ.get("QUERY_LOG", "1") != "0"
+QUERY_LOG_MIN_COUNT = int(os.environ.get("QUERY_LOG_MIN_COUNT", "3"))
+QUERY_LOG_FLUSH_SECONDS = float(os.environ.get("QUERY_LOG_FLUSH_SECONDS", "60"))
+QUERY_LOG_MAX_ENTRIES = 100_000
+MAX_QUERY_LENGTH = 200  # chars; longer queries are pasted text, not searches
+
+_PERSONAL = re.compile(r"\S@\S|\d{6,}")  # email addresses, phone / card / id numbers
+
+_counts = Counter()  # query → times seen since it was last written to the file
+_counts_lock = threading.Lock()
+_flush_thread = None  # started by start_query_log(); nothing is counted before
+
+
+def normalize_query(raw: str) -> str:
+    """The form queries are counted and cached under: whitespace collapsed."""
+    return " ".join(raw.split())
+
+
+def record_query(raw: str):
+    """Counts one user query (no-op until start_query_log() has run)."""
+    if _flush_thread is None:
+        return
+    query = normalize_query(raw)
+    if not query or len(query) > MAX_QUERY_LENGTH or _PERSONAL.search(query):
+        return
+    with _counts_lock:
+        _counts[query] += 1
+        if len(_counts) > QUERY_LOG_MAX_ENTRIES:
+            _trim(_counts, QUERY_LOG_MAX_ENTRIES // 2)
+
+
+def _trim(counts: Counter, size: int):
+    """Keeps the size most frequent queries of counts (in place)."""
+    kept = dict(counts.most_common(size))
+    counts.clear()
+    counts.update(kept)
+
+
+def read_query_log(path: str = QUERY_LOG_FILE) -> Counter:
+    """Query counts stored in path (empty if there is no log yet)."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return Counter(json.load(f))
+    except FileNotFoundError:
+        return Counter()
+
+
+def top_queries(n: int, path: str = QUERY_LOG_FILE) -> list[str]:
+    """The n most frequent logged queries, most frequent first."""
+    return [query for query, _ in read_query_log(path).most_common(n)]
+
+
+def flush_query_log(path: str = QUERY_LOG_FILE) -> int:
+    """
+    Adds this worker's counts to path: the queries already in it and those
+    seen QUERY_LOG_MIN_COUNT times here.  The others stay in memory.
+    Returns the number of queries written.
+    """
+    with _counts_lock:
+        pending = dict(_counts)
+    if not pending:
+        return 0
+
+    with _file_lock(path):
+        stored = read_query_log(path)
+        written = {
+            query: count
+            for query, count in pending.items()
+            if query in stored or count >= QUERY_LOG_MIN_COUNT
+        }
+        if not written:
+            return 0
+        stored.update(written)
+        _trim(stored, QUERY_LOG_MAX_ENTRIES)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(dict(stored.most_common()), f, ensure_ascii=False)
+        os.replace(tmp, path)  # readers never see a half-written log
+
+    with _counts_lock:
+        for query, count in written.items():
+            _counts[query] -= count
+            if _counts[query] <= 0:
+                del _counts[query]
+    return len(written)
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Exclusive lock on path + ".lock" between workers (no-op without fcntl)."""
+    try:
+        import fcntl
+    except ImportError:  # Windows: one worker per log file
+        yield
+        return
+    with open(path + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield  # released when the file is closed
+
+
+def start_query_log(path: str = QUERY_LOG_FILE, flush_seconds: float = QUERY_LOG_FLUSH_SECONDS):
+    """Starts counting queries, flushed to path every flush_seconds and at exit."""
+    global _flush_thread
+    if _flush_thread is not None or not QUERY_LOG_ENABLED:
+        return
+
+    def flush():
+        try:
+            written = flush_query_log(path)
+        except OSError as e:
+            logger.error("Error writing query log %s: %s", path, e)
+            return
+        if written:
+            logger.info("Query log: %d queries added to %s", written, path)
+
+    def run():
+        while True:
+            time.sleep(flush_seconds)
+            flush()
+
+    _flush_thread = threading.Thread(target=run, name="query-log-flush", daemon=True)
+    _flush_thread.start()
+    atexit.register(flush)
+
+
+# ─────────────────────────────────────────────
+# ENTRY POINT
+# ─────────────────────────────────────────────
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect the query log / build head results")
+    parser.add_argument("command", choices=["top", "head"])
+    parser.add_argument("-n", "--top", type=int, default=20, help="number of head queries")
+    parser.add_argument("--log", default=QUERY_LOG_FILE)
+    parser.add_argument("--top-k", type=int, default=None)
+    parser.add_argument("--match", default="all", choices=["all", "any"])
+    args = parser.parse_args()
+
+    if args.command == "top":
+        for query, count in read_query_log(args.log).most_common(args.top):
+            print(f"{count:>8}  {query}")
+    else:
+        import query_engine  # only the head table needs the index
+
+        top_k = query_engine.TOP_K if args.top_k is None else args.top_k
+        query_engine.build_head_results(top_queries(args.top, args.log), top_k, args.match)
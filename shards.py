@@ -0,0 +1,347 @@
+import os
+import json
+import math
+import time
+import heapq
+import logging
+import argparse
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import query_engine
+from query_engine import parse_query, Query, TOP_K
+from indexer import load_index, load_positions, save_index, INDEX_FILE, CRAWLED_DATA_FILE
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+# SHARDED INDEX
+#
+# The corpus is split by document into N shards of contiguous doc ids.  Every
+# shard file has exactly the same layout as index.json (with its own positions
+# file, index.shard{i}.positions), so a shard is served by the unchanged query
+# engine (in a worker process, or by app.py started with INDEX_FILE /
+# CRAWLED_DATA_FILE pointing at the shard files).
+#
+# What keeps BM25 consistent across shards:
+#   - metadata (num_docs, avg_doc_length, avg_title_length) is the GLOBAL one
+#   - every term keeps its GLOBAL doc_freq, and the full dictionary is kept in
+#     every shard (terms with no local docs get empty postings), so IDF, fuzzy
+#     expansion and wildcard expansion pick the same terms everywhere
+#   - merged wildcard postings have no stored df; the coordinator sums each
+#     shard's local count first and sends the global df along with the query
+#
+# Query flow:  coordinator parses → scatters Query to all shards → each shard
+# returns its own top_k (with snippets) → coordinator merges the top_k lists.
+# A later page (offset, or a cursor's results seen) asks every shard for its
+# offset + top_k and keeps the merged results past offset.
+#
+# Near-duplicate clusters (index "duplicates") can span shards: every shard
+# keeps its docs' global canonical ids, collapses the clusters it sees, and
+# the coordinator collapses the merged lists once more.
+
+SHARD_INDEX_FILE = "index.shard{}.json"
+SHARD_PAGES_FILE = "crawled_data.shard{}.json"
+
+
+def split_index(full_index: dict, num_shards: int) -> list[dict]:
+    """Splits a built index into num_shards document-partitioned shard indexes."""
+    doc_ids = sorted(full_index["doc_lengths"], key=int)
+    per_shard = math.ceil(len(doc_ids) / num_shards) if doc_ids else 1
+    shard_of = {doc_id: i // per_shard for i, doc_id in enumerate(doc_ids)}
+
+    shards = []
+    for n in range(num_shards):
+        members = doc_ids[n * per_shard : (n + 1) * per_shard]
+        shard = {
+            "metadata": dict(
+                full_index["metadata"],
+                shard={"id": n, "num_shards": num_shards, "num_docs": len(members)},
+            ),
+        }
+        # Same section order as index.json (the engine streams it in that order)
+        for section in ("doc_lengths", "title_lengths", "doc_rank", "duplicates", "token_offsets"):
+            if section in full_index:
+                shard[section] = {
+                    d: full_index[section][d] for d in members if d in full_index[section]
+                }
+        shard["index"] = {}
+        if "fuzzy" in full_index:
+            shard["fuzzy"] = full_index["fuzzy"]
+        if "tiers" in full_index:
+            # Each shard's tier 1 is its own docs of the global one; the engine
+            # bounds what is left out from the shard's own postings
+            tiers = full_index["tiers"]
+            shard["tiers"] = dict(
+                tiers,
+                terms={
+                    term: [d for d in docs if shard_of[d] == n]
+                    for term, docs in tiers["terms"].items()
+                },
+            )
+        if "positions" in full_index:
+            shard["positions"] = {}  # written to the shard's own positions file
+        shards.append(shard)
+
+    # One pass over the postings, routing each (and its term_freq positions)
+    # to its doc's shard
+    all_positions = full_index.get("positions")
+    for term, entry in full_index["index"].items():
+        for shard in shards:
+            shard["index"][term] = {"doc_freq": entry["doc_freq"], "postings": {}}
+        positions = all_positions.get(term, ()) if all_positions is not None else None
+        start = 0
+        for doc_id, posting in entry["postings"].items():
+            shard = shards[shard_of[doc_id]]
+            shard["index"][term]["postings"][doc_id] = posting
+            if positions is not None and posting["term_freq"]:
+                end = start + posting["term_freq"]
+                shard["positions"].setdefault(term, array("I")).extend(positions[start:end])
+                start = end
+
+    return shards
+
+
+def build_shards(
+    num_shards: int, index_file: str = INDEX_FILE, pages_file: str = CRAWLED_DATA_FILE
+):
+    """Writes index.shard{i}.json (+ .positions) + crawled_data.shard{i}.json for every shard."""
+    full_index = load_index(index_file)
+    positions = load_positions(full_index, index_file)
+    if positions is not None:
+        full_index["positions"] = positions
+    with open(pages_file, "r", encoding="utf-8") as f:
+        pages = json.load(f)
+
+    for n, shard in enumerate(split_index(full_index, num_shards)):
+        save_index(shard, SHARD_INDEX_FILE.format(n))
+        shard_pages = [p for p in pages if str(p["id"]) in shard["doc_lengths"]]
+        with open(SHARD_PAGES_FILE.format(n), "w", encoding="utf-8") as f:
+            json.dump(shard_pages, f, ensure_ascii=False)
+        logger.info("Shard %d: %d docs", n, len(shard_pages))
+
+
+# ─────────────────────────────────────────────
+# SHARD SIDE
+# ─────────────────────────────────────────────
+# These run inside whatever process holds the shard (worker process or the
+# /shard/* endpoints of app.py).
+
+
+def shard_wildcard_df(patterns: list[str]) -> dict:
+    """Local doc count of each wildcard pattern's merged postings."""
+    query_engine._ensure_loaded()
+    return {p: query_engine._wildcard_entry(p).doc_freq for p in patterns}
+
+
+def shard_search(query: Query, top_k: int, match: str, global_df: dict) -> dict:
+    """Runs a parsed query against the local shard with global wildcard dfs."""
+    query_engine._ensure_loaded()
+    token = query_engine._global_df.set(global_df)
+    try:
+        return query_engine._run_query(query, top_k, match, round_scores=False)
+    finally:
+        query_engine._global_df.reset(token)
+
+
+def _init_shard_worker(index_file: str, pages_file: str):
+    query_engine.INDEX_FILE = index_file
+    query_engine.CRAWLED_DATA_FILE = pages_file
+    query_engine._ensure_loaded()
+
+
+# ─────────────────────────────────────────────
+# SHARD CLIENTS
+# ─────────────────────────────────────────────
+
+
+class LocalShard:
+    """A shard served by a dedicated worker process on this machine."""
+
+    def __init__(self, index_file: str, pages_file: str):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.name = index_file
+        # spawn → a clean interpreter that only ever loads its own shard
+        self._pool = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_shard_worker,
+            initargs=(index_file, pages_file),
+        )
+
+    def wildcard_df(self, patterns):
+        return self._pool.submit(shard_wildcard_df, patterns)
+
+    def search(self, query, top_k, match, global_df):
+        return self._pool.submit(shard_search, query, top_k, match, global_df)
+
+    def close(self):
+        self._pool.shutdown()
+
+
+class HttpShard:
+    """A shard served by another app.py node (see the /shard/* endpoints)."""
+
+    _executor = None  # shared thread pool for in-flight HTTP calls
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        import requests  # only coordinators need it; keeps it off the import path
+
+        self.name = url.rstrip("/")
+        self._session = requests.Session()
+        self._timeout = timeout
+        if HttpShard._executor is None:
+            HttpShard._executor = ThreadPoolExecutor(max_workers=32)
+
+    def get(self, path):
+        response = self._session.get(self.name + path, timeout=self._timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _post(self, path, payload):
+        response = self._session.post(self.name + path, json=payload, timeout=self._timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def wildcard_df(self, patterns):
+        return self._executor.submit(self._post, "/shard/wildcard_df", {"patterns": patterns})
+
+    def search(self, query, top_k, match, global_df):
+        payload = {
+            "query": query.to_dict(), "top_k": top_k, "match": match, "global_df": global_df
+        }
+        return self._executor.submit(self._post, "/shard/search", payload)
+
+    def close(self):
+        self._session.close()
+
+
+# ─────────────────────────────────────────────
+# COORDINATOR
+# ─────────────────────────────────────────────
+
+
+class ShardedSearcher:
+    """Scatters each query to every shard and merges their top_k lists."""
+
+    def __init__(self, shards: list):
+        self.shards = shards
+
+    @classmethod
+    def local(cls, num_shards: int) -> "ShardedSearcher":
+        """One worker process per shard file written by build_shards()."""
+        return cls(
+            [
+                LocalShard(SHARD_INDEX_FILE.format(n), SHARD_PAGES_FILE.format(n))
+                for n in range(num_shards)
+            ]
+        )
+
+    def _scatter(self, method: str, *args) -> list:
+        futures = [getattr(shard, method)(*args) for shard in self.shards]
+        return [future.result() for future in futures]
+
+    def search(
+        self,
+        raw_query: str,
+        top_k: int = TOP_K,
+        include_summary: bool = True,
+        match: str = "all",
+        cursor: str | None = None,
+        offset: int = 0,
+    ) -> dict:
+        """Same contract as query_engine.search(), over all shards."""
+        start = time.perf_counter()
+        if cursor is not None:
+            offset = query_engine.decode_cursor(cursor, raw_query, match)[0]
+        page_size, top_k = top_k, offset + top_k
+        with metrics.timer("parse"):
+            query = parse_query(raw_query)
+
+        # Phase 1 (wildcards only): global df of each merged pattern
+        patterns = sorted(t for t in query_engine._batch_terms([query]) if "*" in t)
+        global_df = {}
+        if patterns:
+            for local_df in self._scatter("wildcard_df", patterns):
+                for pattern, df in local_df.items():
+                    global_df[pattern] = global_df.get(pattern, 0) + df
+
+        # Phase 2: score.  The AND → OR fallback depends on the GLOBAL number
+        # of conjunctive matches, so shards run strict AND and we re-scatter.
+        shard_match = "strict" if match == "all" else match
+        responses = self._scatter("search", query, top_k, shard_match, global_df)
+        total = sum(r["total"] for r in responses)
+        if match == "all" and query.mode == "simple" and total < page_size:
+            responses = self._scatter("search", query, top_k, "any", global_df)
+            total = sum(r["total"] for r in responses)
+
+        ranked = (result for r in responses for result in r["results"])
+        if query_engine.COLLAPSE_DUPLICATES:
+            merged = []
+            for result, dropped in query_engine.collapse_duplicates(
+                sorted(ranked, key=lambda result: result["score"], reverse=True),
+                top_k,
+                lambda result: result.get("duplicate_of", result["doc_id"]),
+            ):
+                if dropped:
+                    result["duplicates"] = result.get("duplicates", 0) + sum(
+                        1 + other.get("duplicates", 0) for other in dropped
+                    )
+                merged.append(result)
+        else:
+            merged = heapq.nlargest(top_k, ranked, key=lambda result: result["score"])
+        merged = merged[offset:]
+        for rank, result in enumerate(merged, offset + 1):
+            result["rank"] = rank
+            result["score"] = round(result["score"], 4)
+
+        response = {"query": raw_query, "count": len(merged), "total": total, "results": merged}
+        over_budget = sorted({stage for r in responses for stage in r.get("over_budget", ())})
+        if over_budget:
+            response["over_budget"] = over_budget
+        if len(merged) == page_size and page_size:
+            response["next_cursor"] = query_engine.encode_cursor(
+                raw_query, match, top_k, merged[-1]["score"], merged[-1]["doc_id"]
+            )
+        if include_summary and merged and not offset:
+            with metrics.timer("summary"):
+                summary = query_engine.generate_ai_summary(raw_query, merged)
+            if summary:
+                response["ai_summary"] = summary
+        metrics.observe("search_seconds", time.perf_counter() - start)
+        return response
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+
+# ─────────────────────────────────────────────
+# ENTRY POINT
+# ─────────────────────────────────────────────
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build / query a sharded index")
+    parser.add_argument("command", choices=["build", "search"])
+    parser.add_argument("--shards", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("query", nargs="*")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_shards(args.shards)
+    else:
+        searcher = ShardedSearcher.local(args.shards)
+        try:
+            result = searcher.search(" ".join(args.query), top_k=args.top_k, include_summary=False)
+            query_engine.print_results(result["results"])
+        finally:
+            searcher.close()
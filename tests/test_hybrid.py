@@ -0,0 +1,70 @@
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import indexer
+import benchmark
+import query_engine as qe
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Hybrid search only fuses the dense ranking into queries it can't mislead:
+# none for a field-restricted query, none for a query without keyword hits.
+
+
+@unittest.skipIf(numpy is None, "dense vectors need numpy")
+class HybridSearchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.INFO)
+        cls.workdir = tempfile.TemporaryDirectory()
+        pages = benchmark.generate_corpus(400, seed=7)
+        pages_file = os.path.join(cls.workdir.name, "crawled_data.json")
+        index_file = os.path.join(cls.workdir.name, "index.json")
+        with open(pages_file, "w", encoding="utf-8") as f:
+            json.dump(pages, f)
+        indexer.save_index(indexer.build_index(pages, dense=True), index_file)
+
+        cls.saved = (qe.INDEX_FILE, qe.CRAWLED_DATA_FILE, qe.RESULT_CACHE_SIZE)
+        qe.INDEX_FILE, qe.CRAWLED_DATA_FILE, qe.RESULT_CACHE_SIZE = index_file, pages_file, 0
+        qe._ready.clear()
+        qe._ensure_loaded()
+
+    @classmethod
+    def tearDownClass(cls):
+        qe.INDEX_FILE, qe.CRAWLED_DATA_FILE, qe.RESULT_CACHE_SIZE = cls.saved
+        qe._ready.clear()  # the next search loads the configured index again
+        cls.workdir.cleanup()
+        logging.disable(logging.NOTSET)
+
+    def test_plain_query_is_fused(self):
+        self.assertIsNotNone(qe._dense)
+        self.assertTrue(qe._stage_sizes(qe.parse_query("history science"), 10)[0])
+
+    def test_title_restriction_holds(self):
+        query = qe.parse_query("title:history")
+        self.assertFalse(qe._stage_sizes(query, 10)[0])
+        response = qe.search("title:history", top_k=10, include_summary=False)
+        self.assertLessEqual(response["count"], response["total"])
+        for result in response["results"]:
+            self.assertIn("histor", result["title"].lower())
+
+    def test_no_keyword_hits_no_results(self):
+        query = qe.parse_query("history science")
+        sizes = qe._stage_sizes(query, 10)
+        self.assertTrue(sizes[0])
+        self.assertEqual(qe._final_ranking(query, [], 10, sizes, time.perf_counter()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()